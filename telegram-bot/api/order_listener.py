@@ -1,17 +1,50 @@
 """
 FastAPI webhook server for receiving order updates from backend.
 """
-from fastapi import FastAPI, Header, HTTPException, Request, Form
+import asyncio
+import hmac
+import sys
+import time
+from fastapi import FastAPI, Header, HTTPException, Request, Form, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional, Set
 from datetime import datetime
 import hashlib
 from aiogram import Bot
-from services.notify_user import notify_user_order_status
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.types import Update
+from services.templates import STATUSES
+from services.dispatcher import dispatcher, NotificationJob
+from services.outbox import outbox
+from services.profile_cache import profile_cache
+from keyboards.factory import keyboard_factory
+from services.launch_token import launch_tokens, InvalidLaunchToken, INIT_DATA_MAX_AGE, verify_init_data
+from services.order_history import order_history
+from services.blocked_chats import blocked_chats
+from services.order_feed import order_feed
+from services.staff_feed import staff_feed
 from utils.id_formatter import format_order_id
-from bot import API_SECRET_KEY, supabase
-from utils.logger import logger
+from bot import dp
+from config import settings
+from utils.metrics import registry, MetricsMiddleware, CONTENT_TYPE
+from utils.tracing import TracingMiddleware
+from utils.logger import logger, order_id_var, RequestContextMiddleware
+
+# Upper bound on items accepted by /api/order-updates/batch
+MAX_BATCH_SIZE = 500
+
+# Payme methods whose first response is replayed for retries. Not PerformTransaction:
+# a later CancelTransaction changes its answer, and the transaction table already
+# makes a repeated perform harmless
+PAYME_IDEMPOTENT_METHODS = {"CancelTransaction"}
+
+# JSON-RPC error for a body that is not valid JSON
+PAYME_PARSE_ERROR = -32700
+
+# Telegram updates being processed in webhook mode (referenced until done)
+_update_tasks: Set[asyncio.Task] = set()
+_update_slots = asyncio.Semaphore(settings.telegram_webhook_concurrency)
 
 # Create FastAPI app
 app = FastAPI(title="Telegram Bot Webhook")
@@ -25,6 +58,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency histograms for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Server span per request when tracing is enabled
+app.add_middleware(TracingMiddleware)
+
+# Correlation ID for every log record of a request
+app.add_middleware(RequestContextMiddleware)
+
+
+def _loaded(module: str, name: str):
+    """A lazily imported service (payments, broadcasts), or None until its first use."""
+    return getattr(sys.modules.get(module), name, None)
+
+
+async def _broadcast_engine():
+    """Broadcast engine, imported and started on first use."""
+    from services.broadcast import broadcast_engine
+    await broadcast_engine.start(app.state.bot)
+    return broadcast_engine
+
+
+def _hit_rate(stats: dict) -> float:
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups else 0.0
+
+
+def _idempotency_hit_rate() -> float:
+    # 0 until the first payment callback (or deferred startup) imports the store
+    idempotency_store = _loaded("services.idempotency", "idempotency_store")
+    return _hit_rate(idempotency_store.stats()) if idempotency_store else 0.0
+
+
+# Read at scrape time from the components' own counters
+registry.gauge_callback("notify_queue_depth", "Notifications waiting in the dispatcher queue", lambda: dispatcher.stats()["queue_depth"])
+registry.gauge_callback("notify_in_flight", "Notifications being sent right now", lambda: dispatcher.stats()["in_flight"])
+registry.gauge_callback("notify_drain_rate", "Notifications sent per second over the last minute", lambda: dispatcher.stats()["drain_rate"])
+registry.gauge_callback("notify_sent", "Notifications sent since start", lambda: dispatcher.stats()["sent"])
+registry.gauge_callback("notify_failed", "Notifications dropped since start", lambda: dispatcher.stats()["failed"])
+registry.gauge_callback("outbox_pending_writes", "Outbox writes waiting for the next group commit", lambda: outbox.stats()["pending_writes"])
+registry.gauge_callback("profile_cache_hit_rate", "Profile cache hit rate", lambda: profile_cache.stats()["hit_rate"])
+registry.gauge_callback("keyboard_cache_hit_rate", "Keyboard cache hit rate", lambda: keyboard_factory.stats()["hit_rate"])
+registry.gauge_callback("order_history_cache_hit_rate", "Order history page cache hit rate", lambda: order_history.stats()["hit_rate"])
+registry.gauge_callback("idempotency_hit_rate", "Payment callback replay hit rate", _idempotency_hit_rate)
+registry.gauge_callback("blocked_chats", "Chats in the blocked registry", lambda: blocked_chats.stats()["blocked"])
+registry.gauge_callback("order_feed_connected", "1 while the Realtime order feed is subscribed", lambda: int(order_feed.stats()["connected"]))
+registry.gauge_callback("staff_active_orders", "Orders in the staff feed index", lambda: staff_feed.stats()["active_orders"])
+registry.gauge_callback("telegram_updates_in_flight", "Webhook updates being processed", lambda: len(_update_tasks))
+
 
 class OrderUpdate(BaseModel):
     """Order update payload model."""
@@ -40,6 +122,7 @@ class OrderUpdate(BaseModel):
     )
     product_name: Optional[str] = Field(None, description="Name of the product")
     order_type: Optional[str] = Field(None, description="Type of order: delivery, takeaway, preorder")
+    locale: Optional[str] = Field(None, description="Message language: uz (default), ru, en")
 
 
 class DirectMessage(BaseModel):
@@ -48,7 +131,76 @@ class DirectMessage(BaseModel):
     message: str = Field(..., description="Message content")
 
 
-@app.post("/api/order-update")
+class LaunchTokenRequest(BaseModel):
+    """Launch token verification payload model."""
+    token: Optional[str] = Field(None, max_length=512, description="Value of the Web App URL's launch parameter")
+    init_data: Optional[str] = Field(
+        None, max_length=4096, description="Telegram.WebApp.initData, used when the token is missing or expired"
+    )
+
+
+class BroadcastRequest(BaseModel):
+    """Broadcast payload model."""
+    message: str = Field(..., min_length=1, max_length=4096, description="Message content (HTML)")
+
+
+@app.post(settings.telegram_webhook_path, include_in_schema=False)
+async def telegram_webhook(
+    request: Request,
+    x_telegram_bot_api_secret_token: Optional[str] = Header(None)
+):
+    """
+    Receive updates pushed by Telegram (BOT_MODE=webhook).
+
+    The update is handed to the aiogram dispatcher in a background task and
+    acknowledged immediately, so updates are processed concurrently. When
+    TELEGRAM_WEBHOOK_CONCURRENCY updates are already running, the response
+    waits for a free slot, which makes Telegram slow down its deliveries.
+
+    Raises:
+        HTTPException: If webhook mode is off, the secret token does not
+            match or the body is not a valid update
+    """
+    if settings.bot_mode != "webhook":
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    if not x_telegram_bot_api_secret_token or not hmac.compare_digest(
+        x_telegram_bot_api_secret_token, settings.telegram_webhook_secret
+    ):
+        logger.warning("Telegram webhook call with invalid secret token from %s", request.client.host)
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    bot: Bot = request.app.state.bot
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except ValueError as e:
+        logger.warning("Invalid Telegram update: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid update")
+
+    await _update_slots.acquire()
+    task = asyncio.create_task(_process_update(bot, update))
+    _update_tasks.add(task)
+    task.add_done_callback(_update_tasks.discard)
+    return {"ok": True}
+
+
+async def _process_update(bot: Bot, update: Update):
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        logger.error("Failed to process Telegram update %s: %s", update.update_id, e)
+    finally:
+        _update_slots.release()
+
+
+async def drain_updates(timeout: float = 10.0):
+    """Wait for Telegram updates still being processed (on shutdown)."""
+    if _update_tasks:
+        logger.info("Waiting for %s Telegram updates to finish...", len(_update_tasks))
+        await asyncio.wait(set(_update_tasks), timeout=timeout)
+
+
+@app.post("/api/order-update", status_code=202)
 async def order_update_webhook(
     order_update: OrderUpdate,
     request: Request,
@@ -56,6 +208,9 @@ async def order_update_webhook(
 ):
     """
     Webhook endpoint for receiving order updates from backend.
+
+    The notification is queued and sent by the background dispatcher,
+    so the request returns as soon as the update is accepted.
     
     Args:
         order_update: Order update data
@@ -63,64 +218,165 @@ async def order_update_webhook(
         x_api_key: API key from header
         
     Returns:
-        dict with success status
+        dict with the queued job id
         
     Raises:
-        HTTPException: If authentication fails or notification fails
+        HTTPException: If authentication fails, the status is unknown
+            or the notification queue is full
     """
     # Validate API key
-    if x_api_key != API_SECRET_KEY:
+    if x_api_key != settings.api_secret_key:
         logger.warning(
-            f"Unauthorized webhook attempt from {request.client.host}"
+            "Unauthorized webhook attempt from %s", request.client.host
         )
         raise HTTPException(status_code=401, detail="Unauthorized")
-    
+
+    # Scoped to this request's task
+    order_id_var.set(order_update.order_id)
     logger.info(
-        f"Received order update: Order {order_update.order_id}, "
-        f"User {order_update.telegram_user_id}, Status {order_update.status}"
-    )
-    
-    # Get bot instance from app state
-    bot: Bot = request.app.state.bot
-    
-    # Send notification to user
-    result = await notify_user_order_status(
-        bot=bot,
-        telegram_user_id=order_update.telegram_user_id,
-        order_id=order_update.order_id,
-        status=order_update.status,
-        product_name=order_update.product_name,
-        order_type=order_update.order_type
+        "Received order update: Order %s, "
+        "User %s, Status %s",
+        order_update.order_id, order_update.telegram_user_id, order_update.status
     )
+
+    if order_update.status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status: {order_update.status}")
+
+    staff_feed.apply(order_update.order_id, order_update.status, order_update.order_type, order_update.product_name)
+
+    # The Realtime feed may have queued this change already
+    if not order_feed.claim(order_update.order_id, order_update.status):
+        return {
+            "success": True,
+            "message": "Notification already queued",
+            "job_id": None,
+            "order_id": order_update.order_id,
+            "telegram_user_id": order_update.telegram_user_id
+        }
     
-    if not result["success"]:
-        logger.error(f"Failed to send notification: {result['message']}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to send notification: {result['message']}"
-        )
+    job = _job_from_update(order_update)
+
+    # The user's cached order history shows the old status now
+    order_history.invalidate(order_update.telegram_user_id)
+
+    # Persist before queueing so a restart cannot lose the update
+    try:
+        job.outbox_id = await outbox.append(job.to_payload())
+        job.job_id = str(job.outbox_id)
+    except Exception as e:
+        order_feed.forget(order_update.order_id, order_update.status)
+        logger.error("Failed to write order %s to outbox: %s", order_update.order_id, e)
+        raise HTTPException(status_code=503, detail="Failed to store notification, retry later")
+
+    try:
+        job_id = dispatcher.submit(job)
+    except asyncio.QueueFull:
+        outbox.mark_failed(job.outbox_id)
+        order_feed.forget(order_update.order_id, order_update.status)
+        logger.error("Notification queue full, rejecting update for order %s", order_update.order_id)
+        raise HTTPException(status_code=503, detail="Notification queue is full")
     
     return {
         "success": True,
-        "message": "Notification sent successfully",
+        "message": "Notification queued",
+        "job_id": job_id,
         "order_id": order_update.order_id,
         "telegram_user_id": order_update.telegram_user_id
     }
 
 
-async def update_order_status_db(order_id: str, status: str):
-    """Helper to update order status in Supabase."""
+@app.post("/api/order-updates/batch", status_code=202)
+async def order_updates_batch(
+    order_updates: List[OrderUpdate],
+    request: Request,
+    x_api_key: Optional[str] = Header(None)
+):
+    """
+    Accept many order updates in one request (e.g. "mark all ready" or backfills).
+
+    Valid items are written to the outbox in a single group commit and
+    handed to the dispatcher, whose worker pool bounds how many are sent
+    concurrently. Invalid items are reported without affecting the rest.
+
+    Returns:
+        dict with one result per item, in request order
+    """
+    if x_api_key != settings.api_secret_key:
+        logger.warning(
+            "Unauthorized batch webhook attempt from %s", request.client.host
+        )
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not order_updates:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(order_updates) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(order_updates)} items (max {MAX_BATCH_SIZE})"
+        )
+
+    logger.info("Received batch of %s order updates", len(order_updates))
+
+    results = []
+    jobs = []
+    for index, order_update in enumerate(order_updates):
+        result = {
+            "index": index,
+            "order_id": order_update.order_id,
+            "telegram_user_id": order_update.telegram_user_id
+        }
+        if order_update.status not in STATUSES:
+            result.update(success=False, error=f"Invalid status: {order_update.status}")
+        elif not order_feed.claim(order_update.order_id, order_update.status):
+            staff_feed.apply(order_update.order_id, order_update.status, order_update.order_type, order_update.product_name)
+            result.update(success=True, duplicate=True)
+        else:
+            staff_feed.apply(order_update.order_id, order_update.status, order_update.order_type, order_update.product_name)
+            jobs.append((result, _job_from_update(order_update)))
+            order_history.invalidate(order_update.telegram_user_id)
+        results.append(result)
+
     try:
-        # First check if order is in pending_payment status (idempotency)
-        res = await supabase.table("orders").select("status").eq("id", order_id).single()
-        if res and res.get("status") == "pending_payment":
-            await supabase.table("orders").update({"status": status}).eq("id", order_id)
-            logger.info(f"✅ Order {order_id} status updated to {status} via payment callback")
-            return True
-        return False
+        outbox_ids = await outbox.append_many([job.to_payload() for _, job in jobs])
     except Exception as e:
-        logger.error(f"❌ Failed to update order status {order_id}: {e}")
-        return False
+        # Release the claims so a retry of this batch is not treated as a duplicate
+        for _, job in reversed(jobs):
+            order_feed.forget(job.order_id, job.status)
+        logger.error("Failed to write batch to outbox: %s", e)
+        raise HTTPException(status_code=503, detail="Failed to store notifications, retry later")
+
+    for (result, job), outbox_id in zip(jobs, outbox_ids):
+        job.outbox_id = outbox_id
+        job.job_id = str(outbox_id)
+        try:
+            dispatcher.submit(job)
+            result.update(success=True, job_id=job.job_id)
+        except asyncio.QueueFull:
+            outbox.mark_failed(outbox_id)
+            order_feed.forget(job.order_id, job.status)
+            result.update(success=False, error="Notification queue is full")
+
+    accepted = sum(1 for result in results if result["success"])
+    if accepted < len(results):
+        logger.warning("Batch accepted %s/%s order updates", accepted, len(results))
+
+    return {
+        "success": accepted == len(results),
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "results": results
+    }
+
+
+def _job_from_update(order_update: OrderUpdate) -> NotificationJob:
+    return NotificationJob(
+        telegram_user_id=order_update.telegram_user_id,
+        order_id=order_update.order_id,
+        status=order_update.status,
+        product_name=order_update.product_name,
+        order_type=order_update.order_type,
+        locale=order_update.locale
+    )
 
 
 @app.post("/api/payment/click/callback")
@@ -129,63 +385,144 @@ async def click_callback(
     service_id: int = Form(...),
     click_paydoc_id: int = Form(...),
     merchant_trans_id: str = Form(...),
-    amount: float = Form(...),
+    amount: str = Form(...),
     action: int = Form(...),
     error: int = Form(...),
     error_note: str = Form(...),
     sign_time: str = Form(...),
-    sign_string: str = Form(...)
+    sign_string: str = Form(...),
+    merchant_prepare_id: Optional[int] = Form(None)
 ):
     """
-    Click payment callback handler.
+    Click payment callback handler (prepare and complete).
     Documentation: https://docs.click.uz/click-api-request/
+
+    `amount` is kept as the raw string Click signed.
     """
-    logger.info(f"💰 Click callback received for order {merchant_trans_id}, action={action}")
-    
-    # 0 - Prepare, 1 - Complete
-    if error < 0:
-        return {"error": error, "error_note": error_note}
-
-    if action == 1:
-        if error == 0:
-            # Payment successful
-            success = await update_order_status_db(merchant_trans_id, "pending")
-            if success:
-                return {"error": 0, "error_note": "Success"}
-            else:
-                return {"error": -1, "error_note": "Order already processed or not found"}
-    
-    # Simple reply for Prepare (action=0)
-    return {"error": 0, "error_note": "Success"}
+    # Payment engines are imported on first use, keeping them off the startup path
+    from services.click import click_merchant, ClickRequest
+    from services.idempotency import idempotency_store
+
+    order_id_var.set(merchant_trans_id)
+    logger.info("💰 Click callback received for order %s, action=%s", merchant_trans_id, action)
+
+    click_request = ClickRequest(
+        click_trans_id=click_trans_id,
+        service_id=service_id,
+        click_paydoc_id=click_paydoc_id,
+        merchant_trans_id=merchant_trans_id,
+        amount=amount,
+        action=action,
+        error=error,
+        error_note=error_note,
+        sign_time=sign_time,
+        sign_string=sign_string,
+        merchant_prepare_id=merchant_prepare_id
+    )
+
+    async def process():
+        return await click_merchant.handle(click_request)
+
+    # Retries of the same Click transaction step get the first answer replayed;
+    # a failed signature check is never stored under the real transaction's key
+    return await idempotency_store.run(
+        f"click:{click_trans_id}:{action}",
+        process,
+        cacheable=lambda response: response["error"] == 0
+    )
 
 
 @app.post("/api/payment/payme/callback")
-async def payme_callback(request: Request):
+async def payme_callback(request: Request, authorization: Optional[str] = Header(None)):
     """
     Payme payment callback handler (JSON-RPC 2.0).
     Documentation: https://developer.help.paycom.uz/metody-merchant-api
     """
-    data = await request.json()
+    from services.payme import payme_merchant, PaymeError, ERROR_INSUFFICIENT_PRIVILEGE
+    from services.idempotency import idempotency_store
+
+    try:
+        data = await request.json()
+    except ValueError:
+        return {"error": PaymeError(PAYME_PARSE_ERROR, "Parse error").to_dict(), "id": None}
+
+    request_id = data.get("id")
     method = data.get("method")
-    params = data.get("params", {})
-    
-    logger.info(f"💳 Payme callback received: method={method}")
-    
-    # Simplified logic for demonstration
-    # In production, you must verify CheckPerformTransaction, PerformTransaction, etc.
-    if method == "PerformTransaction":
-        order_id = params.get("account", {}).get("order_id")
-        if order_id:
-            await update_order_status_db(order_id, "pending")
+    params = data.get("params") or {}
+
+    logger.info("💳 Payme callback received: method=%s", method)
+
+    if not payme_merchant.is_authorized(authorization):
+        logger.warning("Unauthorized Payme callback from %s", request.client.host)
+        error = PaymeError(ERROR_INSUFFICIENT_PRIVILEGE, "Insufficient privilege")
+        return {"error": error.to_dict(), "id": request_id}
+
+    async def process():
+        try:
+            return {"result": await payme_merchant.handle(method, params)}
+        except PaymeError as e:
+            return {"error": e.to_dict()}
+
+    # Transaction-changing methods are keyed by Payme's transaction id
+    if method in PAYME_IDEMPOTENT_METHODS and params.get("id"):
+        response = await idempotency_store.run(
+            f"payme:{method}:{params['id']}",
+            process,
+            cacheable=lambda response: "result" in response
+        )
+    else:
+        response = await process()
+
+    # Stored responses are shared, so stamp the request id on a copy
+    return {**response, "id": request_id}
+
+
+@app.post("/api/launch-token/verify")
+async def verify_launch_token(payload: LaunchTokenRequest):
+    """
+    Return the profile carried by a Web App launch token.
+
+    No API key: the signed token is the credential, and it only reveals what
+    was issued to its holder. No Supabase query is made. When the token is
+    missing or expired (an old reply keyboard), Telegram's signed `initData`
+    identifies the user instead and the profile is read through the cache.
+
+    Raises:
+        HTTPException: 401 if neither credential is valid
+    """
+    error = "Launch token or init data is required"
+    if payload.token:
+        try:
+            profile = launch_tokens.verify(payload.token)
+        except InvalidLaunchToken as e:
+            error = str(e)
+        else:
             return {
-                "result": {
-                    "transaction": params.get("id"),
-                    "perform_time": int(datetime.utcnow().timestamp() * 1000),
-                    "state": 2
-                }
+                "telegram_user_id": profile.telegram_user_id,
+                "full_name": profile.full_name,
+                "phone": profile.phone,
+                "expires_at": profile.expires_at
             }
-            
-    return {"result": {"success": True}}
+
+    if not payload.init_data:
+        raise HTTPException(status_code=401, detail=error)
+    try:
+        telegram_user_id = verify_init_data(payload.init_data, settings.bot_token)
+    except InvalidLaunchToken as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+    try:
+        user_profile = await profile_cache.get(telegram_user_id) or {}
+    except Exception as e:
+        # The user is still identified; the form is just not pre-filled
+        logger.warning("Profile lookup for Web App launch of %s failed: %s", telegram_user_id, e)
+        user_profile = {}
+    return {
+        "telegram_user_id": telegram_user_id,
+        "full_name": user_profile.get("full_name"),
+        "phone": user_profile.get("phone"),
+        "expires_at": int(time.time() + INIT_DATA_MAX_AGE)
+    }
 
 
 @app.post("/api/send-message")
@@ -197,10 +534,13 @@ async def send_direct_message(
     """
     Endpoint for sending direct messages to users via Telegram ID.
     """
-    if x_api_key != API_SECRET_KEY:
+    if x_api_key != settings.api_secret_key:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     bot: Bot = request.app.state.bot
+
+    if blocked_chats.is_blocked(payload.telegram_user_id):
+        raise HTTPException(status_code=409, detail="User blocked the bot")
     
     try:
         await bot.send_message(
@@ -209,11 +549,99 @@ async def send_direct_message(
             parse_mode="HTML"
         )
         return {"success": True, "message": "Message sent"}
+    except TelegramForbiddenError:
+        blocked_chats.mark_blocked(payload.telegram_user_id)
+        raise HTTPException(status_code=409, detail="User blocked the bot")
     except Exception as e:
-        logger.error(f"Failed to send direct message: {e}")
+        logger.error("Failed to send direct message: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/broadcasts", status_code=202)
+async def create_broadcast(payload: BroadcastRequest, x_api_key: Optional[str] = Header(None)):
+    """
+    Queue a message for every registered profile.
+
+    Sending happens in the background; poll /api/broadcasts/{id} for progress.
+    """
+    if x_api_key != settings.api_secret_key:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    broadcast_engine = await _broadcast_engine()
+    broadcast_id = await broadcast_engine.create(payload.message)
+    return {"success": True, "broadcast_id": broadcast_id}
+
+
+@app.get("/api/broadcasts")
+async def list_broadcasts(limit: int = 20, x_api_key: Optional[str] = Header(None)):
+    """Most recent broadcasts with their progress."""
+    if x_api_key != settings.api_secret_key:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    broadcast_engine = await _broadcast_engine()
+    broadcasts = await broadcast_engine.store.recent(min(max(limit, 1), 100))
+    return {"broadcasts": [await broadcast_engine.progress(b["id"]) for b in broadcasts]}
+
+
+@app.get("/api/broadcasts/{broadcast_id}")
+async def broadcast_progress(broadcast_id: int, x_api_key: Optional[str] = Header(None)):
+    """Progress of one broadcast: counters per outcome, throughput and ETA."""
+    if x_api_key != settings.api_secret_key:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    broadcast_engine = await _broadcast_engine()
+    progress = await broadcast_engine.progress(broadcast_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return progress
+
+
+@app.post("/api/broadcasts/{broadcast_id}/cancel")
+async def cancel_broadcast(broadcast_id: int, x_api_key: Optional[str] = Header(None)):
+    """Stop a pending or running broadcast."""
+    if x_api_key != settings.api_secret_key:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    broadcast_engine = await _broadcast_engine()
+    if not await broadcast_engine.cancel(broadcast_id):
+        raise HTTPException(status_code=409, detail="Broadcast is not pending or running")
+    return {"success": True, "broadcast_id": broadcast_id}
+
+
+@app.get("/api/stats")
+async def stats(x_api_key: Optional[str] = Header(None)):
+    """Runtime statistics for sizing the notification pipeline."""
+    if x_api_key != settings.api_secret_key:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    idempotency_store = _loaded("services.idempotency", "idempotency_store")
+    click_merchant = _loaded("services.click", "click_merchant")
+    return {
+        "dispatcher": dispatcher.stats(),
+        "outbox": outbox.stats(),
+        "profile_cache": profile_cache.stats(),
+        "order_history": order_history.stats(),
+        "keyboards": keyboard_factory.stats(),
+        "launch_tokens": launch_tokens.stats(),
+        "blocked_chats": blocked_chats.stats(),
+        "order_feed": order_feed.stats(),
+        "staff_feed": staff_feed.stats(),
+        "idempotency": idempotency_store.stats() if idempotency_store else None,
+        "click": click_merchant.stats() if click_merchant else None
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus scrape endpoint."""
+    if settings.metrics_token and not (
+        authorization and hmac.compare_digest(authorization, f"Bearer {settings.metrics_token}")
+    ):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -231,7 +659,11 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "order_update": "/api/order-update",
+            "order_updates_batch": "/api/order-updates/batch",
             "send_message": "/api/send-message",
+            "broadcasts": "/api/broadcasts",
+            "stats": "/api/stats",
+            "metrics": "/metrics",
             "health": "/health"
         }
     }
@@ -1,33 +1,28 @@
 """
-Bot initialization and configuration.
+Bot initialization.
+
+Builds the shared Bot, Dispatcher and Supabase proxy from `config.settings`.
 """
-import os
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from dotenv import load_dotenv
-from postgrest import AsyncPostgrestClient
-from utils.logger import logger
-
-# Load environment variables
-load_dotenv()
-
-# Validate required environment variables
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-if not BOT_TOKEN:
-    logger.error("BOT_TOKEN not found in environment variables!")
-    raise ValueError("BOT_TOKEN is required")
-
-SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("VITE_SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY") or os.getenv("VITE_SUPABASE_ANON_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    logger.error("SUPABASE_URL or SUPABASE_KEY not found in environment variables!")
-    raise ValueError("Supabase configuration is required")
-
-if not SUPABASE_URL or not SUPABASE_URL.startswith("http"):
-    logger.error(f"Invalid Supabase URL: {SUPABASE_URL}")
-    raise ValueError("Valid Supabase URL is required")
+from config import settings
+from utils.logger import logger, setup_logger
+from utils.supabase_client import create_postgrest_client, warm_up
+from utils.fsm_storage import create_fsm_storage
+from utils.metrics import TelegramMetricsMiddleware
+from utils.tracing import tracer, TelegramTracingMiddleware
+
+setup_logger(
+    level=settings.log_level,
+    fmt=settings.log_format,
+    log_file=settings.log_file or None,
+    max_bytes=settings.log_max_bytes,
+    backup_count=settings.log_backup_count
+)
+tracer.configure(settings.trace_sample_rate, settings.trace_file)
 
 # Proxy class for lazy initialization of Supabase client
 class SupabaseProxy:
@@ -36,13 +31,17 @@ class SupabaseProxy:
 
     def _get_instance(self):
         if self._instance is None:
-            logger.info(f"Lazily initializing AsyncPostgrestClient with URL: {SUPABASE_URL}")
-            self._instance = AsyncPostgrestClient(
-                f"{SUPABASE_URL}/rest/v1",
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}"
-                }
+            logger.info("Lazily initializing AsyncPostgrestClient with URL: %s", settings.supabase_url)
+            self._instance = create_postgrest_client(
+                settings.supabase_url,
+                settings.supabase_key,
+                pool_size=settings.supabase_pool_size,
+                keepalive=settings.supabase_keepalive,
+                keepalive_expiry=settings.supabase_keepalive_expiry,
+                timeout=settings.supabase_timeout,
+                connect_timeout=settings.supabase_connect_timeout,
+                retries=settings.supabase_retries,
+                http2=settings.supabase_http2
             )
             # Add compatibility alias
             self._instance.table = self._instance.from_
@@ -54,6 +53,10 @@ class SupabaseProxy:
     def from_(self, table_name):
         return self._get_instance().from_(table_name)
 
+    async def warm_up(self):
+        """Open pooled connections at startup so the first query is fast."""
+        await warm_up(self._get_instance(), settings.supabase_warmup_connections)
+
     async def aclose(self):
         if self._instance:
             await self._instance.aclose()
@@ -63,25 +66,22 @@ class SupabaseProxy:
 supabase = SupabaseProxy()
 logger.info("Supabase proxy initialized (lazy load enabled)")
 
-API_SECRET_KEY = os.getenv("API_SECRET_KEY")
-if not API_SECRET_KEY:
-    logger.error("API_SECRET_KEY not found in environment variables!")
-    raise ValueError("API_SECRET_KEY is required for webhook security")
-
-WEBSITE_URL = os.getenv("WEBSITE_URL", "http://localhost:5173")
-WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
-WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
-
-
 # Initialize bot with default properties
 bot = Bot(
-    token=BOT_TOKEN,
+    token=settings.bot_token,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(settings.telegram_api_url)) if settings.telegram_api_url else None,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
+# Time every Bot API call for /metrics
+bot.session.middleware(TelegramMetricsMiddleware())
+bot.session.middleware(TelegramTracingMiddleware())
 
-# Initialize dispatcher
-dp = Dispatcher()
+# Initialize dispatcher with shared conversation state
+dp = Dispatcher(storage=create_fsm_storage(
+    settings.fsm_storage, settings.fsm_db_path, settings.redis_url, settings.fsm_state_ttl
+))
 
 logger.info("Bot initialized successfully")
-logger.info(f"Website URL: {WEBSITE_URL}")
-logger.info(f"Webhook will run on {WEBHOOK_HOST}:{WEBHOOK_PORT}")
+logger.info("Website URL: %s", settings.website_url)
+logger.info("Webhook will run on %s:%s", settings.webhook_host, settings.webhook_port)
+logger.info("Bot update mode: %s, FSM storage: %s", settings.bot_mode, settings.fsm_storage)
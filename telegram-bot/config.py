@@ -0,0 +1,278 @@
+"""
+Application settings.
+
+Every environment variable the bot reads is parsed and validated here, once,
+into a frozen `Settings` object. Modules read `settings.<name>` instead of
+calling os.getenv themselves.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from utils.logger import logger
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def _optional_int(name: str) -> Optional[int]:
+    """An integer setting that may be left empty (None)."""
+    value = os.getenv(name, "").strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        logger.error("%s must be an integer, got %r", name, value)
+        raise ValueError(f"{name} must be an integer or empty")
+
+
+@dataclass(frozen=True)
+class Settings:
+    # Telegram
+    bot_token: str
+    bot_mode: str
+    telegram_api_url: str
+    telegram_webhook_url: str
+    telegram_webhook_path: str
+    telegram_webhook_secret: Optional[str]
+    telegram_webhook_concurrency: int
+
+    # Supabase
+    supabase_url: str
+    supabase_key: str
+    supabase_pool_size: int
+    supabase_keepalive: int
+    supabase_keepalive_expiry: float
+    supabase_timeout: float
+    supabase_connect_timeout: float
+    supabase_retries: int
+    supabase_http2: bool
+    supabase_warmup_connections: int
+
+    # HTTP API
+    api_secret_key: str
+    website_url: str
+    webhook_host: str
+    webhook_port: int
+    metrics_token: Optional[str]
+
+    # Logging and tracing
+    log_level: str
+    log_format: str
+    log_file: str
+    log_max_bytes: int
+    log_backup_count: int
+    trace_sample_rate: float
+    trace_file: str
+
+    # Notification dispatcher
+    notify_workers: int
+    notify_queue_size: int
+    notify_max_attempts: int
+    telegram_global_rate: float
+    telegram_chat_rate: float
+    notify_coalesce_window: float
+    outbox_db_path: str
+
+    # Caches
+    profile_cache_size: int
+    profile_cache_ttl: float
+    order_history_page_size: int
+    order_history_cache_size: int
+    order_history_cache_ttl: float
+    keyboard_cache_size: int
+
+    # Web App launch tokens
+    launch_token_secret: Optional[str]
+    launch_token_ttl: float
+    launch_token_cache_size: int
+
+    # Payments
+    idempotency_db_path: str
+    idempotency_cache_size: int
+    idempotency_ttl: float
+    payme_merchant_key: Optional[str]
+    payme_db_path: str
+    click_secret_key: Optional[str]
+    click_service_id: Optional[int]
+
+    # Conversation state
+    fsm_storage: str
+    fsm_db_path: str
+    redis_url: Optional[str]
+    fsm_state_ttl: float
+
+    # Broadcasts and blocked chats
+    broadcast_db_path: str
+    broadcast_rate: float
+    broadcast_concurrency: int
+    broadcast_chunk_size: int
+    blocked_chats_db_path: str
+    blocked_chats_sync_interval: float
+
+    # Realtime order feed
+    order_feed_enabled: bool
+    order_feed_db_path: str
+    order_feed_catchup_window: float
+
+    # Staff order feed
+    staff_chat_id: Optional[int]
+    staff_feed_db_path: str
+    staff_feed_interval: float
+    staff_feed_max_rows: int
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """
+        Load `.env` and build the settings from the environment.
+
+        Raises:
+            ValueError: If a required setting is missing or invalid
+        """
+        load_dotenv()
+
+        bot_token = os.getenv("BOT_TOKEN")
+        if not bot_token:
+            logger.error("BOT_TOKEN not found in environment variables!")
+            raise ValueError("BOT_TOKEN is required")
+
+        supabase_url = os.getenv("SUPABASE_URL") or os.getenv("VITE_SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_KEY") or os.getenv("VITE_SUPABASE_ANON_KEY")
+        if not supabase_url or not supabase_key:
+            logger.error("SUPABASE_URL or SUPABASE_KEY not found in environment variables!")
+            raise ValueError("Supabase configuration is required")
+        if not supabase_url.startswith("http"):
+            logger.error("Invalid Supabase URL: %s", supabase_url)
+            raise ValueError("Valid Supabase URL is required")
+
+        api_secret_key = os.getenv("API_SECRET_KEY")
+        if not api_secret_key:
+            logger.error("API_SECRET_KEY not found in environment variables!")
+            raise ValueError("API_SECRET_KEY is required for webhook security")
+
+        # Update ingestion: "polling" for local development, "webhook" to have Telegram push updates
+        bot_mode = os.getenv("BOT_MODE", "polling").lower()
+        if bot_mode not in ("polling", "webhook"):
+            raise ValueError(f"BOT_MODE must be 'polling' or 'webhook', got {bot_mode!r}")
+
+        # Public HTTPS base URL Telegram posts to, e.g. https://bot.example.com
+        telegram_webhook_url = os.getenv("TELEGRAM_WEBHOOK_URL", "").rstrip("/")
+        telegram_webhook_secret = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+        if bot_mode == "webhook" and not (telegram_webhook_url and telegram_webhook_secret):
+            logger.error("TELEGRAM_WEBHOOK_URL or TELEGRAM_WEBHOOK_SECRET not found in environment variables!")
+            raise ValueError("TELEGRAM_WEBHOOK_URL and TELEGRAM_WEBHOOK_SECRET are required in webhook mode")
+
+        return cls(
+            bot_token=bot_token,
+            bot_mode=bot_mode,
+            # Bot API base URL (a self-hosted telegram-bot-api or the load-test stand-in)
+            telegram_api_url=os.getenv("TELEGRAM_API_URL", "").rstrip("/"),
+            telegram_webhook_url=telegram_webhook_url,
+            telegram_webhook_path=os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook"),
+            telegram_webhook_secret=telegram_webhook_secret,
+            # Updates processed at once per replica in webhook mode
+            telegram_webhook_concurrency=_int("TELEGRAM_WEBHOOK_CONCURRENCY", 100),
+
+            supabase_url=supabase_url,
+            supabase_key=supabase_key,
+            supabase_pool_size=_int("SUPABASE_POOL_SIZE", 20),
+            supabase_keepalive=_int("SUPABASE_KEEPALIVE", 10),
+            supabase_keepalive_expiry=_float("SUPABASE_KEEPALIVE_EXPIRY", 60),
+            supabase_timeout=_float("SUPABASE_TIMEOUT", 5),
+            supabase_connect_timeout=_float("SUPABASE_CONNECT_TIMEOUT", 3),
+            supabase_retries=_int("SUPABASE_RETRIES", 2),
+            supabase_http2=os.getenv("SUPABASE_HTTP2", "true").lower() == "true",
+            supabase_warmup_connections=_int("SUPABASE_WARMUP_CONNECTIONS", 2),
+
+            api_secret_key=api_secret_key,
+            website_url=os.getenv("WEBSITE_URL", "http://localhost:5173"),
+            webhook_host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+            webhook_port=_int("WEBHOOK_PORT", 8080),
+            # Bearer token required by /metrics (empty = no auth, e.g. when only reachable internally)
+            metrics_token=os.getenv("METRICS_TOKEN") or None,
+
+            # json or text; the file is rotated at log_max_bytes
+            log_level=os.getenv("LOG_LEVEL", "INFO"),
+            log_format=os.getenv("LOG_FORMAT", "json"),
+            log_file=os.getenv("LOG_FILE", "logs/bot.log"),
+            log_max_bytes=_int("LOG_MAX_BYTES", 10 * 1024 * 1024),
+            log_backup_count=_int("LOG_BACKUP_COUNT", 5),
+            # Fraction of requests traced; 0 disables tracing
+            trace_sample_rate=_float("TRACE_SAMPLE_RATE", 0),
+            trace_file=os.getenv("TRACE_FILE", "logs/traces.jsonl"),
+
+            # Telegram allows ~30 msg/s overall, ~1 msg/s per chat
+            notify_workers=_int("NOTIFY_WORKERS", 4),
+            notify_queue_size=_int("NOTIFY_QUEUE_SIZE", 10000),
+            notify_max_attempts=_int("NOTIFY_MAX_ATTEMPTS", 5),
+            telegram_global_rate=_float("TELEGRAM_GLOBAL_RATE", 25),
+            telegram_chat_rate=_float("TELEGRAM_CHAT_RATE", 1),
+            # Updates for one order within this many seconds collapse into one message (0 disables)
+            notify_coalesce_window=_float("NOTIFY_COALESCE_WINDOW", 10),
+            # Local SQLite outbox so accepted notifications survive restarts
+            outbox_db_path=os.getenv("OUTBOX_DB_PATH", "data/outbox.db"),
+
+            profile_cache_size=_int("PROFILE_CACHE_SIZE", 10000),
+            profile_cache_ttl=_float("PROFILE_CACHE_TTL", 300),
+            order_history_page_size=_int("ORDER_HISTORY_PAGE_SIZE", 5),
+            order_history_cache_size=_int("ORDER_HISTORY_CACHE_SIZE", 5000),
+            order_history_cache_ttl=_float("ORDER_HISTORY_CACHE_TTL", 300),
+            # Per-user main menu / Web App keyboards kept built
+            keyboard_cache_size=_int("KEYBOARD_CACHE_SIZE", 10000),
+
+            # HMAC key for Web App launch tokens (empty = derived from API_SECRET_KEY)
+            launch_token_secret=os.getenv("LAUNCH_TOKEN_SECRET") or None,
+            # Reply keyboards stay in the chat, so tokens outlive a single session
+            launch_token_ttl=_float("LAUNCH_TOKEN_TTL", 7 * 24 * 3600),
+            launch_token_cache_size=_int("LAUNCH_TOKEN_CACHE_SIZE", 10000),
+
+            # Replayed responses for duplicate payment callbacks (empty path = memory only)
+            idempotency_db_path=os.getenv("IDEMPOTENCY_DB_PATH", "data/idempotency.db"),
+            idempotency_cache_size=_int("IDEMPOTENCY_CACHE_SIZE", 50000),
+            idempotency_ttl=_float("IDEMPOTENCY_TTL", 2 * 24 * 3600),
+            # Payme merchant API (key from the Payme business cabinet)
+            payme_merchant_key=os.getenv("PAYME_MERCHANT_KEY"),
+            payme_db_path=os.getenv("PAYME_DB_PATH", "data/payme.db"),
+            # Click SHOP API (secret key and service id from the Click merchant cabinet)
+            click_secret_key=os.getenv("CLICK_SECRET_KEY"),
+            click_service_id=_optional_int("CLICK_SERVICE_ID"),
+
+            # memory, sqlite (shared by workers on one host) or redis
+            fsm_storage=os.getenv("FSM_STORAGE", "sqlite").lower(),
+            fsm_db_path=os.getenv("FSM_DB_PATH", "data/fsm.db"),
+            redis_url=os.getenv("REDIS_URL"),
+            fsm_state_ttl=_float("FSM_STATE_TTL", 7 * 24 * 3600),
+
+            # Kept below telegram_global_rate so order notifications still flow
+            broadcast_db_path=os.getenv("BROADCAST_DB_PATH", "data/broadcast.db"),
+            broadcast_rate=_float("BROADCAST_RATE", 20),
+            broadcast_concurrency=_int("BROADCAST_CONCURRENCY", 8),
+            broadcast_chunk_size=_int("BROADCAST_CHUNK_SIZE", 500),
+            # Synced to profiles.bot_blocked every interval seconds
+            blocked_chats_db_path=os.getenv("BLOCKED_CHATS_DB_PATH", "data/blocked_chats.db"),
+            blocked_chats_sync_interval=_float("BLOCKED_CHATS_SYNC_INTERVAL", 60),
+
+            # Notify from the Supabase Realtime feed of `orders` (de-duplicated against /api/order-update)
+            order_feed_enabled=os.getenv("ORDER_FEED_ENABLED", "true").lower() == "true",
+            order_feed_db_path=os.getenv("ORDER_FEED_DB_PATH", "data/order_feed.db"),
+            # Orders re-read after every reconnect to catch changes made while disconnected
+            order_feed_catchup_window=_float("ORDER_FEED_CATCHUP_WINDOW", 24 * 3600),
+
+            # Kitchen/staff chat with a pinned active-order summary (empty = disabled)
+            staff_chat_id=_optional_int("STAFF_CHAT_ID"),
+            staff_feed_db_path=os.getenv("STAFF_FEED_DB_PATH", "data/staff_feed.db"),
+            # Changes within this many seconds go out as one message and one summary edit
+            staff_feed_interval=_float("STAFF_FEED_INTERVAL", 3),
+            staff_feed_max_rows=_int("STAFF_FEED_MAX_ROWS", 25),
+        )
+
+
+settings = Settings.from_env()
@@ -2,57 +2,60 @@
 Handler for order history and admin contact.
 """
 from aiogram import Router, F
-from aiogram.types import Message
-from bot import supabase, logger
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery
+from bot import logger
+from keyboards.inline import OrderHistoryPage, get_order_history_keyboard
+from services.order_history import order_history, Cursor
 
 router = Router()
 
 @router.message(F.text == "📝 Mening buyurtmalarim")
 async def handle_my_orders(message: Message):
-    """Fetch and show user's order history from Supabase."""
+    """Show the newest page of the user's order history."""
     telegram_id = message.from_user.id
-    logger.info(f"User {telegram_id} requested order history")
+    logger.info("User %s requested order history", telegram_id)
     
     try:
-        # Fetch last 5 orders for this user
-        response = await supabase.table("orders").select("*").eq("telegram_user_id", telegram_id).order("created_at", desc=True).limit(5).execute()
+        page = await order_history.get_page(telegram_id)
         
-        if not response.data:
+        if page is None:
             await message.answer("Sizda hali buyurtmalar yo'q. 🍔\nBuyurtma berish uchun 'Buyurtma berish' tugmasini bosing.")
             return
 
-        text = "📝 <b>Oxirgi buyurtmalaringiz:</b>\n\n"
-        
-        status_map = {
-            "pending_payment": "💳 To'lov kutilmoqda",
-            "pending": "⏳ Qabul qilindi",
-            "confirmed": "🍳 Tayyorlanmoqda",
-            "ready": "🥡 Tayyor",
-            "delivering": "🚚 Yo'lda",
-            "on_way": "🚚 Yo'lda",
-            "delivered": "✅ Yetkazildi",
-            "cancelled": "❌ Bekor qilindi"
-        }
-
-        for order in response.data:
-            status = status_map.get(order.get("status"), order.get("status"))
-            price = f"{order.get('total_price'):,}".replace(",", " ") if order.get("total_price") else "0"
-            
-            text += (
-                f"🆔 <b>Buyurtma #{order.get('id')[:6]}</b>\n"
-                f"🍟 Mahsulot: {order.get('product_name')} (x{order.get('quantity')})\n"
-                f"💰 Narxi: {price} so'm\n"
-                f"📊 Holati: {status}\n"
-                f"📅 Sana: {order.get('created_at')[:16].replace('T', ' ')}\n"
-                f"------------------\n\n"
-            )
-        
-        await message.answer(text)
+        await message.answer(page.text, reply_markup=get_order_history_keyboard(page.newer, page.older))
         
     except Exception as e:
-        logger.error(f"Error fetching orders: {e}")
+        logger.error("Error fetching orders: %s", e)
         await message.answer("Xatolik yuz berdi. Iltimos keyinroq qayta urinib ko'ring.")
 
+
+@router.callback_query(OrderHistoryPage.filter())
+async def handle_order_history_page(callback: CallbackQuery, callback_data: OrderHistoryPage):
+    """Switch the order history message to the previous/next page."""
+    telegram_id = callback.from_user.id
+    cursor = Cursor(created_at=callback_data.created_at, order_id=callback_data.order_id)
+
+    try:
+        page = await order_history.get_page(telegram_id, callback_data.direction, cursor)
+    except Exception as e:
+        logger.error("Error fetching order history page: %s", e)
+        await callback.answer("Xatolik yuz berdi. Iltimos keyinroq qayta urinib ko'ring.", show_alert=True)
+        return
+
+    if page is None:
+        await callback.answer("Boshqa buyurtmalar yo'q.")
+        return
+
+    try:
+        await callback.message.edit_text(page.text, reply_markup=get_order_history_keyboard(page.newer, page.older))
+    except TelegramBadRequest as e:
+        # Double taps re-render the same page
+        if "message is not modified" not in str(e):
+            raise
+    await callback.answer()
+
+
 @router.message(F.text == "📞 Adminga bog'lanish")
 async def handle_contact_admin(message: Message):
     """Show admin contact details."""
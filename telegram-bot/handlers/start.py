@@ -7,9 +7,10 @@ from aiogram.types import Message, ReplyKeyboardRemove
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from bot import supabase, logger, WEBSITE_URL
-from keyboards.reply import get_main_menu_keyboard, get_contact_keyboard
-import urllib.parse
+from bot import supabase, logger
+from keyboards.factory import keyboard_factory
+from services.profile_cache import profile_cache
+from services.blocked_chats import blocked_chats
 
 router = Router()
 
@@ -24,34 +25,25 @@ async def cmd_start(message: Message, state: FSMContext):
     user = message.from_user
     telegram_id = user.id
     
-    logger.info(f"User {telegram_id} started the bot")
+    logger.info("User %s started the bot", telegram_id)
+
+    # Writing to the bot again means it is no longer blocked
+    blocked_chats.clear(telegram_id)
     
     # Check if user exists in Supabase
     try:
-        logger.info(f"Checking profile for telegram_id: {telegram_id}")
-        response = await supabase.table("profiles").select("*").eq("telegram_id", telegram_id).execute()
-        logger.info(f"Supabase response received: {response}")
+        logger.info("Checking profile for telegram_id: %s", telegram_id)
+        profile = await profile_cache.get(telegram_id)
         
-        if response.data:
-            # User exists, show main menu
-            profile = response.data[0]
-            
-            # Generate Web App URL with user data for auto-filling
-            params = {
-                "telegram_user_id": telegram_id,
-                "full_name": profile.get("full_name", ""),
-                "phone": profile.get("phone", "")
-            }
-            query_string = urllib.parse.urlencode(params)
-            web_app_url = f"{WEBSITE_URL}?{query_string}"
-            
+        if profile:
+            # User exists, show main menu with the Web App pre-filled
             welcome_text = (
                 f"👋 <b>Assalomu alaykum, {profile.get('full_name')}!</b>\n\n"
                 "Buyurtma berish uchun quyidagi tugmani bosing:"
             )
             await message.answer(
                 welcome_text, 
-                reply_markup=get_main_menu_keyboard(web_app_url=web_app_url)
+                reply_markup=keyboard_factory.main_menu(telegram_id, profile.get("full_name"), profile.get("phone"))
             )
             await state.clear()
         else:
@@ -61,11 +53,11 @@ async def cmd_start(message: Message, state: FSMContext):
                 "Bizning yetkazib berish botimizga xush kelibsiz! 🍔\n"
                 "Davom etishdan oldin raqamingizni yuboring:"
             )
-            await message.answer(welcome_text, reply_markup=get_contact_keyboard())
+            await message.answer(welcome_text, reply_markup=keyboard_factory.contact_keyboard)
             await state.set_state(Registration.waiting_for_contact)
             
     except Exception as e:
-        logger.error(f"Error checking profile: {e}")
+        logger.error("Error checking profile: %s", e)
         await message.answer("Xatolik yuz berdi. Iltimos keyinroq qayta urinib ko'ring.")
 
 
@@ -105,26 +97,18 @@ async def handle_name(message: Message, state: FSMContext):
             "username": message.from_user.username
         }
         
-        logger.info(f"Upserting profile for user {telegram_id}")
-        await supabase.table("profiles").upsert(profile_data).execute()
-        logger.info(f"Profile upserted successfully for {telegram_id}")
-        
-        # Generate Web App URL for the new user
-        params = {
-            "telegram_user_id": telegram_id,
-            "full_name": full_name,
-            "phone": phone
-        }
-        query_string = urllib.parse.urlencode(params)
-        web_app_url = f"{WEBSITE_URL}?{query_string}"
+        logger.info("Upserting profile for user %s", telegram_id)
+        response = await supabase.table("profiles").upsert(profile_data).execute()
+        logger.info("Profile upserted successfully for %s", telegram_id)
+        profile_cache.set(telegram_id, response.data[0] if response.data else profile_data)
         
         await message.answer(
             f"Tabriklaymiz, {full_name}! Ro'yxatdan muvaffaqiyatli o'tdingiz. ✅",
-            reply_markup=get_main_menu_keyboard(web_app_url=web_app_url)
+            reply_markup=keyboard_factory.main_menu(telegram_id, full_name, phone)
         )
         await state.clear()
         
     except Exception as e:
-        logger.error(f"Error saving profile: {e}")
+        logger.error("Error saving profile: %s", e)
         await message.answer("Xatolik yuz berdi. Iltimos qaytadan urinib ko'ring.")
         # Optionally reset or keep state
@@ -3,8 +3,10 @@ Handler for Web App button and interactions.
 """
 from aiogram import Router, F
 from aiogram.types import Message
-from bot import supabase, logger, WEBSITE_URL
-from keyboards.inline import get_webapp_keyboard
+from bot import logger
+from config import settings
+from keyboards.factory import keyboard_factory
+from services.profile_cache import profile_cache
 from utils.logger import logger
 
 router = Router()
@@ -19,42 +21,31 @@ async def handle_order_button(message: Message):
     user = message.from_user
     telegram_id = user.id
     
-    logger.info(f"User {telegram_id} clicked order button")
+    logger.info("User %s clicked order button", telegram_id)
     
     # Try to get user profile for pre-filling
     full_name = None
     phone = None
     
     try:
-        logger.info(f"WebApp: Checking profile for {telegram_id}")
-        response = await supabase.table("profiles").select("*").eq("telegram_id", telegram_id).execute()
-        if response.data:
-            profile = response.data[0]
+        logger.info("WebApp: Checking profile for %s", telegram_id)
+        profile = await profile_cache.get(telegram_id)
+        if profile:
             full_name = profile.get("full_name")
             phone = profile.get("phone")
     except Exception as e:
-        logger.error(f"Error fetching profile for webapp: {e}")
+        logger.error("Error fetching profile for webapp: %s", e)
 
     text = (
         "🍔 <b>Buyurtma berish</b>\n\n"
         "Pastdagi tugmani bosing va taomlarimizni ko'ring!"
     )
     
-    logger.info(f"Generating webapp keyboard for user {telegram_id}")
+    logger.info("Generating webapp keyboard for user %s", telegram_id)
     
-    is_localhost = "localhost" in WEBSITE_URL or "127.0.0.1" in WEBSITE_URL
-    
-    if is_localhost:
-        logger.warning(f"Localhost detected in URL: {WEBSITE_URL}. Sending as text because Telegram buttons don't support localhost.")
-        # Generate the URL manually for text response
-        params = {
-            "telegram_user_id": telegram_id,
-        }
-        if full_name: params["full_name"] = full_name
-        if phone: params["phone"] = phone
-        
-        import urllib.parse
-        final_url = f"{WEBSITE_URL.split('?')[0]}?{urllib.parse.urlencode(params)}"
+    if keyboard_factory.is_localhost:
+        logger.warning("Localhost detected in URL: %s. Sending as text because Telegram buttons don't support localhost.", settings.website_url)
+        final_url = keyboard_factory.webapp_url(telegram_id, full_name, phone)
         
         await message.answer(
             f"🛠 <b>Localhost testi aniqlandi</b>\n\n"
@@ -65,17 +56,17 @@ async def handle_order_button(message: Message):
         )
         return
 
-    keyboard = get_webapp_keyboard(telegram_id, full_name, phone)
+    keyboard = keyboard_factory.webapp(telegram_id, full_name, phone)
     
-    logger.info(f"Keyboard generated. Sending response to user {telegram_id}...")
+    logger.info("Keyboard generated. Sending response to user %s...", telegram_id)
     try:
         await message.answer(
             text,
             reply_markup=keyboard
         )
-        logger.info(f"Response sent successfully to user {telegram_id}")
+        logger.info("Response sent successfully to user %s", telegram_id)
     except Exception as e:
-        logger.error(f"Failed to send webapp keyboard to {telegram_id}: {e}")
+        logger.error("Failed to send webapp keyboard to %s: %s", telegram_id, e)
         await message.answer(
-            f"❌ Tugma yuborishda xatolik yuz berdi. Iltimos, ushbu havoladan foydalaning:\n\n{WEBSITE_URL}"
+            f"❌ Tugma yuborishda xatolik yuz berdi. Iltimos, ushbu havoladan foydalaning:\n\n{settings.website_url}"
         )
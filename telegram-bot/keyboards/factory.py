@@ -0,0 +1,149 @@
+"""
+Cached keyboards and Web App URLs.
+
+The parts of the main menu and Web App keyboards that never change (the
+secondary button row, the contact keyboard, whether WEBSITE_URL is HTTPS
+or localhost) are built once. Per-user markups depend only on the user's
+id, name and phone, so they are memoized in a bounded LRU. aiogram types
+are frozen, so cached markups can safely be sent many times.
+
+Web App URLs carry a signed launch token (services/launch_token.py) rather
+than the profile itself. A cached markup is rebuilt once half of its
+token's lifetime has passed, so a keyboard is never sent with a token
+that is about to expire.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from aiogram.types import (
+    InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, WebAppInfo
+)
+
+from config import settings
+from keyboards.reply import get_contact_keyboard
+from services.launch_token import LaunchTokens, launch_tokens
+
+ORDER_BUTTON_TEXT = "🍔 Buyurtma berish"
+
+
+class KeyboardFactory:
+    """
+    Builds the order keyboards, reusing static parts and recent per-user markups.
+
+    Args:
+        website_url: Base URL of the ordering website (WEBSITE_URL)
+        max_size: Maximum number of cached per-user markups
+        tokens: Issuer of the launch tokens put in Web App URLs
+    """
+
+    def __init__(self, website_url: str, max_size: int, tokens: LaunchTokens):
+        self.website_url = website_url
+        self.max_size = max_size
+        self.tokens = tokens
+        # Telegram Web Apps require HTTPS; Telegram buttons reject localhost links
+        self.is_https = website_url.startswith("https:")
+        self.is_localhost = "localhost" in website_url or "127.0.0.1" in website_url
+        self._url_prefix = website_url + ("&" if "?" in website_url else "?") + "launch="
+        self._refresh_after = tokens.ttl / 2
+
+        self.contact_keyboard = get_contact_keyboard()
+        self._secondary_row = [
+            KeyboardButton(text="📝 Mening buyurtmalarim"),
+            KeyboardButton(text="📞 Bog'lanish")
+        ]
+        # Without HTTPS the order button is plain text, so every user gets the same menu
+        self._plain_main_menu = self._main_menu_markup(KeyboardButton(text=ORDER_BUTTON_TEXT))
+
+        self._entries: "OrderedDict[Tuple, Tuple[float, object]]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def webapp_url(self, telegram_user_id: int, full_name: Optional[str] = None, phone: Optional[str] = None) -> str:
+        """Web App URL with a launch token carrying the user's data for auto-filling the order form."""
+        # base64url needs no percent-encoding
+        return self._url_prefix + self.tokens.issue(telegram_user_id, full_name, phone)
+
+    def main_menu(self, telegram_user_id: int, full_name: Optional[str] = None, phone: Optional[str] = None) -> ReplyKeyboardMarkup:
+        """
+        Main menu keyboard with the order button.
+
+        Args:
+            telegram_user_id: User's Telegram ID
+            full_name: User's full name from profile
+            phone: User's phone number from profile
+
+        Returns:
+            ReplyKeyboardMarkup with main menu buttons
+        """
+        if not self.is_https:
+            return self._plain_main_menu
+
+        key = ("main_menu", telegram_user_id, full_name, phone)
+        markup = self._get(key)
+        if markup is None:
+            button = KeyboardButton(
+                text=ORDER_BUTTON_TEXT,
+                web_app=WebAppInfo(url=self.webapp_url(telegram_user_id, full_name, phone))
+            )
+            markup = self._put(key, self._main_menu_markup(button))
+        return markup
+
+    def webapp(self, telegram_user_id: int, full_name: Optional[str] = None, phone: Optional[str] = None) -> InlineKeyboardMarkup:
+        """
+        Inline keyboard with the Web App button (a browser link for plain HTTP).
+
+        Args:
+            telegram_user_id: User's Telegram ID
+            full_name: User's full name from profile
+            phone: User's phone number from profile
+
+        Returns:
+            InlineKeyboardMarkup with the order button
+        """
+        key = ("webapp", telegram_user_id, full_name, phone)
+        markup = self._get(key)
+        if markup is None:
+            url = self.webapp_url(telegram_user_id, full_name, phone)
+            if self.is_https:
+                button = InlineKeyboardButton(text=ORDER_BUTTON_TEXT, web_app=WebAppInfo(url=url))
+            else:
+                button = InlineKeyboardButton(text=f"{ORDER_BUTTON_TEXT} (Browserda)", url=url)
+            markup = self._put(key, InlineKeyboardMarkup(inline_keyboard=[[button]]))
+        return markup
+
+    def stats(self) -> dict:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+            **self._counters,
+        }
+
+    def _main_menu_markup(self, order_button: KeyboardButton) -> ReplyKeyboardMarkup:
+        return ReplyKeyboardMarkup(
+            keyboard=[[order_button], self._secondary_row],
+            resize_keyboard=True,
+            one_time_keyboard=False,
+            input_field_placeholder="Buyurtma berish uchun tugmani bosing"
+        )
+
+    def _get(self, key: Tuple):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            self._counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._counters["hits"] += 1
+        return entry[1]
+
+    def _put(self, key: Tuple, markup):
+        self._entries[key] = (time.time() + self._refresh_after, markup)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return markup
+
+
+# Shared factory used by all handlers
+keyboard_factory = KeyboardFactory(settings.website_url, max_size=settings.keyboard_cache_size, tokens=launch_tokens)
@@ -1,48 +1,49 @@
 """
 Inline keyboard layouts.
+
+The Web App keyboard is built by keyboards/factory.py.
 """
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
-from bot import WEBSITE_URL
+from typing import Optional
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from services.order_history import Cursor, DIRECTION_OLDER, DIRECTION_NEWER
+
+
+class OrderHistoryPage(CallbackData, prefix="oh"):
+    """Order history navigation; kept short to fit Telegram's 64-byte callback data."""
+    direction: str
+    created_at: int
+    order_id: str
 
 
-def get_webapp_keyboard(telegram_user_id: int, full_name: str = None, phone: str = None) -> InlineKeyboardMarkup:
+def get_order_history_keyboard(newer: Optional[Cursor], older: Optional[Cursor]) -> Optional[InlineKeyboardMarkup]:
     """
-    Create an inline keyboard with Web App button.
-    
+    Create prev/next buttons for an order history page.
+
     Args:
-        telegram_user_id: User's Telegram ID
-        full_name: User's full name from profile
-        phone: User's phone number from profile
-        
+        newer: Cursor of the first order on the page if newer orders exist
+        older: Cursor of the last order on the page if older orders exist
+
     Returns:
-        InlineKeyboardMarkup with Web App button
+        InlineKeyboardMarkup, or None if the page has no neighbours
     """
-    import urllib.parse
-    
-    # Base URL with telegram_user_id
-    webapp_url = f"{WEBSITE_URL}?telegram_user_id={telegram_user_id}"
-    
-    # Add optional parameters
-    if full_name:
-        webapp_url += f"&full_name={urllib.parse.quote(full_name)}"
-    if phone:
-        webapp_url += f"&phone={urllib.parse.quote(phone)}"
-    
-    # Telegram Web Apps REQUIRE HTTPS.
-    if webapp_url.startswith("https:"):
-        button = InlineKeyboardButton(
-            text="🍔 Buyurtma berish",
-            web_app=WebAppInfo(url=webapp_url)
-        )
-    else:
-        # Fallback to browser link for HTTP (localhost)
-        button = InlineKeyboardButton(
-            text="🍔 Buyurtma berish (Browserda)",
-            url=webapp_url
-        )
-
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[[button]]
-    )
-    
-    return keyboard
+    buttons = []
+    if newer:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Oldingi",
+            callback_data=OrderHistoryPage(
+                direction=DIRECTION_NEWER, created_at=newer.created_at, order_id=newer.order_id
+            ).pack()
+        ))
+    if older:
+        buttons.append(InlineKeyboardButton(
+            text="Keyingi ➡️",
+            callback_data=OrderHistoryPage(
+                direction=DIRECTION_OLDER, created_at=older.created_at, order_id=older.order_id
+            ).pack()
+        ))
+
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
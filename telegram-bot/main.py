@@ -1,68 +1,201 @@
 """
 Main entry point for the Telegram bot.
-Starts both the Telegram bot polling and the FastAPI webhook server.
+Starts the FastAPI webhook server and receives Telegram updates either by
+long polling (BOT_MODE=polling, local development) or through a webhook
+route on the same server (BOT_MODE=webhook).
 """
 import asyncio
+import os
+import sys
+import time
+from typing import Optional
+
 from aiogram import Bot
-from bot import bot, dp, WEBHOOK_HOST, WEBHOOK_PORT
+from bot import bot, dp, supabase
+from config import settings
 from handlers import start, webapp, orders
-from api.order_listener import app as webhook_app
-from utils.logger import logger
+from api.order_listener import app as webhook_app, drain_updates
+from services.dispatcher import dispatcher
+from services.outbox import outbox
+from services.blocked_chats import blocked_chats
+from services.order_feed import order_feed
+from services.staff_feed import staff_feed
+from utils.logger import logger, update_context_middleware
+from utils.tracing import handler_tracing_middleware
 import uvicorn
 
 
+# Background warm-up started by on_startup
+_deferred_startup: Optional[asyncio.Task] = None
+
+
 async def on_startup():
-    """Execute on bot startup."""
+    """Execute on bot startup (only what serving needs; local SQLite only)."""
+    global _deferred_startup
     logger.info("Bot is starting up...")
     
     # Store bot instance in webhook app state
     webhook_app.state.bot = bot
+
+    # Known blocked chats are skipped before any send
+    await blocked_chats.start()
+
+    # Start draining queued notifications, including any left over from a restart
+    await outbox.start()
+    await dispatcher.start(bot)
+    asyncio.create_task(dispatcher.replay_outbox())
+
+    # Notify from the Realtime feed of orders; connects in the background
+    await order_feed.start()
+
+    _deferred_startup = asyncio.create_task(start_deferred(), name="deferred-startup")
     
     logger.info("Bot started successfully!")
 
 
+async def start_deferred():
+    """
+    Warm up what is not needed to start serving.
+
+    Payment engines and broadcasts are imported here or by their first
+    request, whichever comes first; each piece also starts itself on first use.
+    """
+    started = time.perf_counter()
+    try:
+        # Establish Supabase connections before the first user query
+        await supabase.warm_up()
+
+        # Load stored payment callback responses so retries are answered from memory
+        from services.idempotency import idempotency_store
+        from services.payme import payme_merchant
+        await idempotency_store.start()
+        await payme_merchant.store.start()
+
+        # Resume a broadcast interrupted by the last shutdown (none if there never was one)
+        if os.path.exists(settings.broadcast_db_path):
+            from services.broadcast import broadcast_engine
+            await broadcast_engine.start(bot)
+    except Exception as e:
+        logger.error("Deferred startup failed: %s", e)
+    else:
+        logger.info("Deferred startup finished in %.2fs", time.perf_counter() - started)
+
+    # Independent of the steps above: a payment store failure must not leave the staff chat without updates
+    try:
+        # Build the staff order index and bring the pinned summary up to date
+        await staff_feed.start(bot)
+    except Exception as e:
+        logger.error("Staff feed failed to start: %s", e)
+
+
 async def on_shutdown():
     """Execute on bot shutdown."""
     logger.info("Bot is shutting down...")
+    if _deferred_startup is not None and not _deferred_startup.done():
+        _deferred_startup.cancel()
+        await asyncio.gather(_deferred_startup, return_exceptions=True)
+
+    # Lazily imported subsystems only need stopping if they were loaded
+    broadcast = sys.modules.get("services.broadcast")
+    if broadcast is not None:
+        await broadcast.broadcast_engine.stop()
+    await order_feed.stop()
+    await staff_feed.stop()
+    await dispatcher.stop()
+    await blocked_chats.stop()
+    await outbox.stop()
+    idempotency = sys.modules.get("services.idempotency")
+    if idempotency is not None:
+        await idempotency.idempotency_store.stop()
+    payme = sys.modules.get("services.payme")
+    if payme is not None:
+        await payme.payme_merchant.store.stop()
+    await dp.storage.close()
     await supabase.aclose()
     await bot.session.close()
     logger.info("Bot shut down successfully!")
 
 
-async def start_bot():
-    """Start the bot polling."""
-    # Register handlers
+def setup_dispatcher():
+    """Register handlers and lifecycle hooks on the dispatcher."""
     dp.include_router(start.router)
     dp.include_router(webapp.router)
     dp.include_router(orders.router)
-    
-    # Register startup/shutdown handlers
+
+    dp.update.outer_middleware(update_context_middleware)
+    dp.message.middleware(handler_tracing_middleware)
+    dp.callback_query.middleware(handler_tracing_middleware)
+
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
-    
-    # Start polling
+
+
+async def start_bot():
+    """Start the bot polling."""
+    # A webhook left from a webhook-mode deployment makes getUpdates fail
+    await bot.delete_webhook()
+
     logger.info("Starting bot polling...")
     await dp.start_polling(bot)
 
 
-async def start_webhook_server():
-    """Start the FastAPI webhook server."""
+async def run_webhook_mode():
+    """Serve Telegram updates through the FastAPI app instead of polling."""
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+
+    # Serve order updates and /health while the webhook is being registered
+    server = create_webhook_server()
+    serving = asyncio.create_task(server.serve())
+    try:
+        while not server.started and not serving.done():
+            await asyncio.sleep(0.01)
+
+        if server.started:
+            webhook_url = f"{settings.telegram_webhook_url}{settings.telegram_webhook_path}"
+            await bot.set_webhook(
+                url=webhook_url,
+                secret_token=settings.telegram_webhook_secret,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            logger.info("Telegram webhook set to %s", webhook_url)
+
+        await serving
+    finally:
+        if not serving.done():
+            server.should_exit = True
+            await serving
+        # Other replicas keep serving, so the webhook itself is left in place
+        await drain_updates()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+
+
+def create_webhook_server() -> uvicorn.Server:
+    """Build the uvicorn server for the FastAPI app."""
     config = uvicorn.Config(
         app=webhook_app,
-        host=WEBHOOK_HOST,
-        port=WEBHOOK_PORT,
+        host=settings.webhook_host,
+        port=settings.webhook_port,
         log_level="info"
     )
-    server = uvicorn.Server(config)
-    await server.serve()
+    return uvicorn.Server(config)
+
+
+async def start_webhook_server():
+    """Start the FastAPI webhook server."""
+    await create_webhook_server().serve()
 
 
 async def main():
     """
-    Main function to run both bot and webhook server concurrently.
+    Main function to run the bot and webhook server in the configured mode.
     """
-    logger.info("Starting Telegram Bot and Webhook Server...")
-    
+    logger.info("Starting Telegram Bot and Webhook Server (%s mode)...", settings.bot_mode)
+    setup_dispatcher()
+
+    if settings.bot_mode == "webhook":
+        await run_webhook_mode()
+        return
+
     # Run bot polling and webhook server concurrently
     await asyncio.gather(
         start_bot(),
@@ -76,5 +209,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         raise
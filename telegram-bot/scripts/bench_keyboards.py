@@ -0,0 +1,96 @@
+"""
+Micro-benchmark: keyboard building per /start of a registered user.
+
+Compares the previous approach (urlencode the Web App URL, then build new
+KeyboardButton/ReplyKeyboardMarkup objects for every tap) with the cached
+factory in keyboards/factory.py. Users tap repeatedly, as they do when
+reopening the menu, so most factory calls are LRU hits. Reports time and
+bytes allocated per call (tracemalloc peak above the starting level).
+Run from the telegram-bot directory:
+
+    python scripts/bench_keyboards.py [users] [--taps N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.settings needs these; the benchmark never talks to any of them
+for name, value in {
+    "BOT_TOKEN": "123456:bench", "SUPABASE_URL": "http://127.0.0.1", "SUPABASE_KEY": "bench", "API_SECRET_KEY": "bench"
+}.items():
+    os.environ.setdefault(name, value)
+
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup, WebAppInfo  # noqa: E402
+
+from keyboards.factory import KeyboardFactory  # noqa: E402
+from services.launch_token import launch_tokens  # noqa: E402
+
+WEBSITE_URL = "https://shop.example.com/order"
+
+
+def legacy_main_menu(telegram_id, full_name, phone):
+    """What cmd_start did before the factory."""
+    params = {"telegram_user_id": telegram_id, "full_name": full_name, "phone": phone}
+    web_app_url = f"{WEBSITE_URL}?{urllib.parse.urlencode(params)}"
+    buttons = []
+    if web_app_url.startswith("https:"):
+        buttons.append([KeyboardButton(text="🍔 Buyurtma berish", web_app=WebAppInfo(url=web_app_url))])
+    else:
+        buttons.append([KeyboardButton(text="🍔 Buyurtma berish")])
+    buttons.append([
+        KeyboardButton(text="📝 Mening buyurtmalarim"),
+        KeyboardButton(text="📞 Bog'lanish")
+    ])
+    return ReplyKeyboardMarkup(
+        keyboard=buttons,
+        resize_keyboard=True,
+        one_time_keyboard=False,
+        input_field_placeholder="Buyurtma berish uchun tugmani bosing"
+    )
+
+
+def bench(name, fn, users, taps):
+    calls = [(100000000 + i, f"Foydalanuvchi {i}", f"+99890{i:07d}") for i in range(users)] * taps
+
+    started = time.perf_counter()
+    for args in calls:
+        fn(*args)
+    per_call = (time.perf_counter() - started) / len(calls) * 1e6
+
+    # Allocation pass on a sample, separately so tracemalloc does not skew the timing
+    sample = calls[::max(1, len(calls) // 2000)]
+    allocated = 0
+    tracemalloc.start()
+    for args in sample:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(*args)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    per_call_bytes = allocated / len(sample)
+
+    print(f"{name:<8} {per_call:8.2f} µs/call  {per_call_bytes:8.0f} bytes allocated/call")
+    return per_call, per_call_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("users", type=int, nargs="?", default=1000)
+    parser.add_argument("--taps", type=int, default=20)
+    args = parser.parse_args()
+
+    legacy_time, legacy_bytes = bench("legacy", legacy_main_menu, args.users, args.taps)
+    factory = KeyboardFactory(WEBSITE_URL, max_size=max(args.users, 1), tokens=launch_tokens)
+    cached_time, cached_bytes = bench("factory", factory.main_menu, args.users, args.taps)
+
+    print(f"speedup  {legacy_time / cached_time:8.1f}x, {legacy_bytes / max(cached_bytes, 1):.0f}x fewer bytes allocated "
+          f"(hit rate {factory.stats()['hit_rate']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark: event-loop time spent logging per request.
+
+Compares the previous setup (StreamHandler + FileHandler called inline,
+f-string messages) with the queue-based pipeline in utils/logger.py. A
+"request" logs what an order update does: three INFO lines and three DEBUG
+lines that are disabled at the default level. `--stall-ms` makes every
+write sleep to simulate a slow disk or a blocked stdout pipe. Run from the
+telegram-bot directory:
+
+    python scripts/bench_logging.py [requests] [--stall-ms N]
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import logger as logger_module  # noqa: E402
+
+ORDER_ID = "3f2a9c1e-7b4d-4e8a-9c2f-1d5e6a7b8c9d"
+USER_ID = 123456789
+
+
+class StallingStream(io.StringIO):
+    """Console stand-in whose writes take `stall` seconds."""
+
+    def __init__(self, stall: float):
+        super().__init__()
+        self.stall = stall
+
+    def write(self, text):
+        if self.stall:
+            time.sleep(self.stall)
+        return len(text)
+
+
+def request_legacy(log, payload):
+    log.info(f"Received order update: Order {ORDER_ID}, User {USER_ID}, Status confirmed")
+    log.debug(f"Payload: {payload}")
+    log.debug(f"Outbox write for order {ORDER_ID}")
+    log.info(f"Notification sent to user {USER_ID} for order {ORDER_ID} with status confirmed")
+    log.debug(f"Coalescer state: {payload}")
+    log.info(f"Order history invalidated for {USER_ID}")
+
+
+def request_lazy(log, payload):
+    log.info("Received order update: Order %s, User %s, Status %s", ORDER_ID, USER_ID, "confirmed")
+    log.debug("Payload: %s", payload)
+    log.debug("Outbox write for order %s", ORDER_ID)
+    log.info("Notification sent to user %s for order %s with status %s", USER_ID, ORDER_ID, "confirmed")
+    log.debug("Coalescer state: %s", payload)
+    log.info("Order history invalidated for %s", USER_ID)
+
+
+def legacy_logger(path, stall):
+    log = logging.getLogger("bench_legacy")
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    for handler in (logging.StreamHandler(StallingStream(stall)), logging.FileHandler(path, encoding='utf-8')):
+        handler.setFormatter(formatter)
+        log.addHandler(handler)
+    return log
+
+
+def bench(name, log, fn, requests):
+    payload = {"order_id": ORDER_ID, "items": [{"name": "Burger", "quantity": 2}] * 5}
+    started = time.perf_counter()
+    for _ in range(requests):
+        fn(log, payload)
+    per_request = (time.perf_counter() - started) / requests * 1e6
+    print(f"{name:<8} {per_request:9.1f} µs/request on the calling thread")
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("requests", type=int, nargs="?", default=20000)
+    parser.add_argument("--stall-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    stall = args.stall_ms / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = bench("legacy", legacy_logger(os.path.join(tmp, "legacy.log"), stall), request_legacy, args.requests)
+
+        log = logger_module.setup_logger("bench_queue", log_file=os.path.join(tmp, "queue.log"))
+        # Same stalling console as the legacy run
+        for handler in logger_module._listener.handlers:
+            if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+                handler.setStream(StallingStream(stall))
+        queued = bench("queue", log, request_lazy, args.requests)
+
+        drain_started = time.perf_counter()
+        logger_module.shutdown_logging()
+        print(f"listener drained the backlog in {time.perf_counter() - drain_started:.2f}s")
+
+    print(f"saved    {legacy - queued:9.1f} µs/request ({legacy / queued:.1f}x less event-loop time)")
+
+
+if __name__ == "__main__":
+    main()
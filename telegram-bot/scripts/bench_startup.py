@@ -0,0 +1,151 @@
+"""
+Startup benchmark: import cost and time until the bot is serving.
+
+1. Runs `python -X importtime -c "import main"` and reports the total import
+   time with the most expensive modules (self time and cumulative).
+2. Starts main.py in webhook mode against the load-test stand-ins
+   (scripts/loadtest.py) and measures the time from process start to the
+   first successful GET /health, which is what a deploy waits for.
+
+Run from the telegram-bot directory:
+
+    python scripts/bench_startup.py [--runs 5] [--top 15] [--budget-ms 1000]
+
+With --budget-ms it exits with status 1 when the median time to serve is
+over the budget.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import (  # noqa: E402
+    BOT_DIR, BOT_TOKEN, API_SECRET_KEY, WEBHOOK_SECRET, FakeTelegram, FakePostgrest, free_port, start_fake
+)
+
+
+def bot_env(telegram_port: int, postgrest_port: int, bot_port: int) -> dict:
+    return {
+        **os.environ,
+        "BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{telegram_port}",
+        "SUPABASE_URL": f"http://127.0.0.1:{postgrest_port}",
+        "SUPABASE_KEY": "bench-anon-key",
+        "SUPABASE_HTTP2": "false",
+        "API_SECRET_KEY": API_SECRET_KEY,
+        "BOT_MODE": "webhook",
+        "TELEGRAM_WEBHOOK_URL": f"http://127.0.0.1:{bot_port}",
+        "TELEGRAM_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(bot_port),
+        "LOG_LEVEL": "WARNING",
+        "LOG_FILE": "",
+        "PYTHONPATH": BOT_DIR,
+    }
+
+
+def import_times(env: dict, cwd: str):
+    """(total µs, [(self µs, cumulative µs, depth, module)]) from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name[1:].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    total = sum(cumulative for _, cumulative, depth, _ in rows if depth == 0)
+    return total, rows
+
+
+async def time_to_serve(env: dict, cwd: str, bot_port: int, timeout: float = 30) -> float:
+    """Seconds from spawning main.py until GET /health answers 200."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BOT_DIR, "main.py")],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{bot_port}", timeout=1) as client:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Bot exited during startup with code {process.returncode}")
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.01)
+        raise RuntimeError("Bot did not become healthy in time")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def main_async(args) -> int:
+    telegram_port, postgrest_port = free_port(), free_port()
+    runners = [
+        await start_fake(FakeTelegram(0).app(), telegram_port),
+        await start_fake(FakePostgrest(0).app(), postgrest_port),
+    ]
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench-startup-") as workdir:
+            env = bot_env(telegram_port, postgrest_port, free_port())
+            total, rows = import_times(env, workdir)
+            print(f"import main: {total / 1000:.0f} ms")
+
+            print(f"\nTop {args.top} modules by self time:")
+            for self_us, _, _, name in sorted(rows, reverse=True)[:args.top]:
+                print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+            # Direct imports of main.py and of the modules it pulls in first
+            print(f"\nTop {args.top} imports of main.py by cumulative time:")
+            direct = [row for row in rows if row[2] == 1]
+            for _, cumulative_us, _, name in sorted(direct, key=lambda row: -row[1])[:args.top]:
+                print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+            samples = []
+            for _ in range(args.runs):
+                bot_port = free_port()
+                env = bot_env(telegram_port, postgrest_port, bot_port)
+                samples.append(await time_to_serve(env, workdir, bot_port))
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+    median = statistics.median(samples)
+    print(
+        f"\ntime to serve /health: median {median * 1000:.0f} ms, "
+        f"min {min(samples) * 1000:.0f} ms, max {max(samples) * 1000:.0f} ms ({args.runs} runs)"
+    )
+    if args.budget_ms and median * 1000 > args.budget_ms:
+        print(f"FAILED: over the {args.budget_ms:.0f} ms budget")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=0)
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
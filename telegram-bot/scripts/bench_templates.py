@@ -0,0 +1,79 @@
+"""
+Micro-benchmark: per-message render time of order status notifications.
+
+Compares the previous approach (walk the nested template dict, isinstance
+check, str.format per call) with the precompiled lookup in
+services/templates.py. Run from the telegram-bot directory:
+
+    python scripts/bench_templates.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.templates import TEMPLATE_SOURCES, render_status_message  # noqa: E402
+from utils.id_formatter import format_order_id  # noqa: E402
+
+LEGACY_TEMPLATES = TEMPLATE_SOURCES["uz"]
+
+CASES = [
+    ("confirmed", "delivery"),
+    ("ready", "takeaway"),
+    ("ready", None),
+    ("delivering", "delivery"),
+    ("delivered", "preorder"),
+]
+ORDER_ID = "3f2a9c1e-7b4d-4e8a-9c2f-1d5e6a7b8c9d"
+PRODUCT_NAME = "Cheeseburger & Fri"
+
+
+def render_legacy(status, order_id, product_name, order_type):
+    """The per-call lookup notify_user_order_status used before precompiling."""
+    template = LEGACY_TEMPLATES[status]
+    if isinstance(template, dict):
+        current_type = order_type if order_type and order_type in template else "delivery"
+        text_template = template.get(current_type, template.get("delivery"))
+    else:
+        text_template = template
+    return text_template.format(
+        order_id=format_order_id(order_id),
+        product_name=product_name or "Taomlar"
+    )
+
+
+def bench(name, fn, iterations):
+    def run():
+        for status, order_type in CASES:
+            fn(status, order_type)
+
+    seconds = min(timeit.repeat(run, number=iterations, repeat=5))
+    per_message = seconds / (iterations * len(CASES)) * 1e6
+    print(f"{name:<12} {per_message:7.3f} µs/message")
+    return per_message
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    legacy = bench(
+        "legacy",
+        lambda status, order_type: render_legacy(status, ORDER_ID, PRODUCT_NAME, order_type),
+        iterations
+    )
+    compiled = bench(
+        "compiled",
+        lambda status, order_type: render_status_message(status, ORDER_ID, PRODUCT_NAME, order_type),
+        iterations
+    )
+    compiled_ru = bench(
+        "compiled/ru",
+        lambda status, order_type: render_status_message(status, ORDER_ID, PRODUCT_NAME, order_type, "ru"),
+        iterations
+    )
+    print(f"speedup      {legacy / compiled:7.2f}x (ru: {legacy / compiled_ru:.2f}x, includes HTML escaping)")
+
+
+if __name__ == "__main__":
+    main()
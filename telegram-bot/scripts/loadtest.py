@@ -0,0 +1,508 @@
+"""
+End-to-end load test against local Telegram Bot API and PostgREST stand-ins.
+
+Starts a fake Bot API server and a fake PostgREST server in this process,
+runs main.py in webhook mode against them (state goes to a temporary
+directory), then drives order updates, Click prepare/complete callbacks
+and Telegram updates at fixed rates. Click payments also reach the bot as
+Realtime order changes. Reports p50/p95/p99 latency and
+sustained throughput per scenario, plus how fast notifications reached the
+fake Telegram. Run from the telegram-bot directory:
+
+    python scripts/loadtest.py --duration 30 --order-rate 100 --click-rate 20 --update-rate 50
+
+With --max-p99-ms / --max-error-rate it exits with status 1 when a scenario
+is over the limit, so it can gate performance changes. Bot settings such as
+TELEGRAM_GLOBAL_RATE or NOTIFY_WORKERS are taken from the environment.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List
+
+import httpx
+from aiohttp import web
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOT_TOKEN = "123456:LOADTEST-token"
+API_SECRET_KEY = "loadtest-api-key"
+WEBHOOK_SECRET = "loadtest-webhook-secret"
+CLICK_SECRET_KEY = "loadtest-click-secret"
+CLICK_SERVICE_ID = 1
+CLICK_AMOUNT = "25000"
+
+STATUSES = ["confirmed", "ready", "delivering", "delivered"]
+UPDATE_TEXTS = ["/start", "📝 Mening buyurtmalarim"]
+
+# Requests still waiting for a response before new ones are dropped (open loop)
+MAX_IN_FLIGHT = 2000
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class FakeTelegram:
+    """Bot API stand-in answering every method after a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.sent_at: List[float] = []
+        self._message_id = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Load test", "username": "loadtest_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            if method == "sendMessage":
+                self.sent_at.append(time.monotonic())
+            self._message_id += 1
+            result = {
+                "message_id": int(params.get("message_id") or self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakePostgrest:
+    """
+    PostgREST stand-in: every order is payable, every user registered.
+
+    Also serves the Realtime websocket: order writes are pushed to
+    subscribers as postgres_changes events, like Supabase does.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._subscribers: List[tuple] = []
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/rest/v1/{table}", self.handle)
+        app.router.add_get("/realtime/v1/websocket", self.realtime)
+        return app
+
+    async def realtime(self, request: web.Request) -> web.WebSocketResponse:
+        """Minimal Phoenix channel server: join, heartbeat, change pushes."""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subscriber = None
+        try:
+            async for msg in ws:
+                message = json.loads(msg.data)
+                reply = {"status": "ok", "response": {}}
+                if message["event"] == "phx_join":
+                    subscriber = (ws, message["topic"])
+                    self._subscribers.append(subscriber)
+                    self.calls["realtime join"] += 1
+                await ws.send_json({
+                    "topic": message["topic"], "event": "phx_reply", "payload": reply, "ref": message.get("ref")
+                })
+        finally:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+        return ws
+
+    async def _publish(self, change_type: str, rows: list):
+        for ws, topic in list(self._subscribers):
+            for row in rows:
+                self.calls["realtime change"] += 1
+                record = {
+                    "telegram_user_id": uuid.UUID(row["id"]).int % 5000 + 1,
+                    "product_name": "Burger",
+                    "order_type": "delivery",
+                    **row,
+                }
+                await ws.send_json({
+                    "topic": topic,
+                    "event": "postgres_changes",
+                    "payload": {"data": {
+                        "schema": "public", "table": "orders", "type": change_type,
+                        "commit_timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                        "record": record, "old_record": {"id": row["id"]},
+                    }},
+                    "ref": None,
+                })
+
+    async def handle(self, request: web.Request) -> web.Response:
+        table = request.match_info["table"]
+        self.calls[f"{request.method} {table}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        query = request.query
+        if request.method in ("GET", "HEAD"):
+            rows = self._select(table, query)
+        elif request.method in ("POST", "PATCH"):
+            body = await request.json() if request.can_read_body else {}
+            rows = body if isinstance(body, list) else [body]
+            if table == "orders" and request.method == "PATCH" and query.get("id", "").startswith("eq."):
+                rows = [{**row, "id": query["id"][3:]} for row in rows]
+                await self._publish("UPDATE", rows)
+        else:
+            rows = []
+        return web.json_response(rows, headers={"Content-Range": f"0-{max(len(rows) - 1, 0)}/*"})
+
+    def _select(self, table: str, query) -> list:
+        if table == "orders":
+            if query.get("id", "").startswith("eq."):
+                order_id = query["id"][3:]
+                return [{"id": order_id, "status": "pending_payment", "total_price": int(CLICK_AMOUNT)}]
+            if query.get("telegram_user_id", "").startswith("eq."):
+                telegram_id = int(query["telegram_user_id"][3:])
+                return [
+                    {
+                        "id": str(uuid.UUID(int=telegram_id * 100 + i)),
+                        "product_name": "Burger",
+                        "quantity": 1,
+                        "total_price": 25000,
+                        "status": "delivered",
+                        "created_at": f"2026-01-{10 + i:02d}T12:00:00+00:00",
+                    }
+                    for i in range(3)
+                ]
+            return []
+        if table == "profiles" and query.get("telegram_id", "").startswith("eq."):
+            telegram_id = int(query["telegram_id"][3:])
+            return [{"telegram_id": telegram_id, "full_name": "Load Test", "phone": "+998900000000"}]
+        return []
+
+
+class Scenario:
+    """Latency samples and outcome counters for one kind of request."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors: Counter = Counter()
+        self.dropped = 0
+
+    def report(self, duration: float) -> dict:
+        ok = len(self.latencies)
+        failed = sum(self.errors.values())
+        total = ok + failed
+        return {
+            "requests": total,
+            "throughput": round(ok / duration, 1),
+            "error_rate": round(failed / total, 4) if total else 0.0,
+            "dropped": self.dropped,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 2),
+            "errors": dict(self.errors),
+        }
+
+
+class LoadDriver:
+    """Open-loop request generator: requests start on schedule whether or not earlier ones finished."""
+
+    def __init__(self, base_url: str, users: int):
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=30,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=200)
+        )
+        self.users = users
+        self.scenarios: Dict[str, Scenario] = {}
+        self._in_flight = 0
+        self._update_id = 0
+        self._click_trans_id = int(time.time())
+
+    def scenario(self, name: str) -> Scenario:
+        if name not in self.scenarios:
+            self.scenarios[name] = Scenario(name)
+        return self.scenarios[name]
+
+    async def timed(self, name: str, method: str, url: str, check=None, **kwargs):
+        scenario = self.scenario(name)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            scenario.errors[type(e).__name__] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            scenario.errors[f"http_{response.status_code}"] += 1
+            return None
+        if check is not None and not check(response):
+            scenario.errors["bad_response"] += 1
+            return None
+        scenario.latencies.append(elapsed)
+        return response
+
+    async def order_update(self):
+        await self.timed(
+            "order_update", "POST", "/api/order-update",
+            headers={"X-API-Key": API_SECRET_KEY},
+            json={
+                "order_id": str(uuid.uuid4()),
+                "telegram_user_id": random.randint(1, self.users),
+                "status": random.choice(STATUSES),
+                "product_name": "Burger",
+                "order_type": "delivery",
+            }
+        )
+
+    async def click_payment(self):
+        order_id = str(uuid.uuid4())
+        self._click_trans_id += 1
+        form = {
+            "click_trans_id": self._click_trans_id,
+            "service_id": CLICK_SERVICE_ID,
+            "click_paydoc_id": self._click_trans_id,
+            "merchant_trans_id": order_id,
+            "amount": CLICK_AMOUNT,
+            "error": 0,
+            "error_note": "Success",
+            "sign_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        ok = lambda response: response.json().get("error") == 0  # noqa: E731
+
+        prepare = await self.timed("click_prepare", "POST", "/api/payment/click/callback", check=ok, data=self._sign(form, 0))
+        if prepare is None:
+            return
+        form["merchant_prepare_id"] = prepare.json()["merchant_prepare_id"]
+        await self.timed("click_complete", "POST", "/api/payment/click/callback", check=ok, data=self._sign(form, 1))
+
+    async def telegram_update(self, path: str):
+        self._update_id += 1
+        user_id = random.randint(1, self.users)
+        update = {
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+                "text": random.choice(UPDATE_TEXTS),
+            },
+        }
+        await self.timed(
+            "telegram_update", "POST", path,
+            headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET},
+            json=update
+        )
+
+    def _sign(self, form: dict, action: int) -> dict:
+        prepare_id = form.get("merchant_prepare_id", "") if action == 1 else ""
+        raw = (
+            f"{form['click_trans_id']}{form['service_id']}{CLICK_SECRET_KEY}"
+            f"{form['merchant_trans_id']}{prepare_id}{form['amount']}{action}{form['sign_time']}"
+        )
+        return {**form, "action": action, "sign_string": hashlib.md5(raw.encode()).hexdigest()}
+
+    async def run(self, name: str, rate: float, duration: float, make_request):
+        """Start `make_request()` `rate` times per second for `duration` seconds."""
+        if rate <= 0:
+            return
+        tasks = set()
+        interval = 1 / rate
+        started = time.monotonic()
+        next_at = started
+        while next_at < started + duration:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_at += interval
+            if self._in_flight >= MAX_IN_FLIGHT:
+                self.scenario(name).dropped += 1
+                continue
+            task = asyncio.create_task(self._tracked(make_request()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _tracked(self, coro):
+        self._in_flight += 1
+        try:
+            await coro
+        finally:
+            self._in_flight -= 1
+
+
+async def start_fake(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def wait_healthy(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Bot exited during startup with code {process.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Bot did not become healthy in time")
+
+
+async def main_async(args) -> int:
+    telegram = FakeTelegram(args.telegram_latency_ms / 1000)
+    postgrest = FakePostgrest(args.supabase_latency_ms / 1000)
+    telegram_port, postgrest_port, bot_port = free_port(), free_port(), free_port()
+    runners = [
+        await start_fake(telegram.app(), telegram_port),
+        await start_fake(postgrest.app(), postgrest_port),
+    ]
+
+    webhook_path = "/telegram/webhook"
+    env = {
+        "LOG_LEVEL": "WARNING",
+        "SUPABASE_HTTP2": "false",
+        **os.environ,
+        "BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{telegram_port}",
+        "SUPABASE_URL": f"http://127.0.0.1:{postgrest_port}",
+        "SUPABASE_KEY": "loadtest-anon-key",
+        "API_SECRET_KEY": API_SECRET_KEY,
+        "BOT_MODE": "webhook",
+        "TELEGRAM_WEBHOOK_URL": f"http://127.0.0.1:{bot_port}",
+        "TELEGRAM_WEBHOOK_PATH": webhook_path,
+        "TELEGRAM_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(bot_port),
+        "CLICK_SECRET_KEY": CLICK_SECRET_KEY,
+        "CLICK_SERVICE_ID": str(CLICK_SERVICE_ID),
+        "LOG_FILE": "",
+        "PYTHONPATH": BOT_DIR,
+    }
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(BOT_DIR, "main.py")],
+            cwd=workdir,
+            env=env,
+            stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.DEVNULL
+        )
+        driver = LoadDriver(f"http://127.0.0.1:{bot_port}", args.users)
+        try:
+            await wait_healthy(driver.client, process)
+            print(
+                f"Driving {args.duration:.0f}s: order updates {args.order_rate}/s, "
+                f"Click payments {args.click_rate}/s, Telegram updates {args.update_rate}/s"
+            )
+            started = time.monotonic()
+            await asyncio.gather(
+                driver.run("order_update", args.order_rate, args.duration, driver.order_update),
+                driver.run("click", args.click_rate, args.duration, driver.click_payment),
+                driver.run(
+                    "telegram_update", args.update_rate, args.duration,
+                    lambda: driver.telegram_update(webhook_path)
+                ),
+            )
+            elapsed = time.monotonic() - started
+            # Let the dispatcher drain what is still queued
+            await asyncio.sleep(args.drain)
+        finally:
+            await driver.client.aclose()
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            for runner in runners:
+                await runner.cleanup()
+
+    results = {name: scenario.report(elapsed) for name, scenario in driver.scenarios.items()}
+    sends = telegram.sent_at
+    results["telegram_delivery"] = {
+        "messages": len(sends),
+        "throughput": round(len(sends) / (sends[-1] - sends[0]), 1) if len(sends) > 1 else 0.0,
+        "calls": dict(telegram.calls),
+    }
+    results["supabase"] = {"calls": dict(postgrest.calls)}
+
+    print(f"\n{'scenario':<16}{'reqs':>8}{'req/s':>9}{'err%':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, report in results.items():
+        if "p99_ms" in report:
+            print(
+                f"{name:<16}{report['requests']:>8}{report['throughput']:>9}{report['error_rate'] * 100:>8.2f}"
+                f"{report['p50_ms']:>9}{report['p95_ms']:>9}{report['p99_ms']:>9}"
+            )
+            if report["errors"] or report["dropped"]:
+                print(f"{'':<16}errors={report['errors']} dropped={report['dropped']}")
+    delivery = results["telegram_delivery"]
+    print(f"\nTelegram sendMessage: {delivery['messages']} messages at {delivery['throughput']} msg/s sustained")
+    print(f"Realtime: {postgrest.calls['realtime change']} order changes pushed ({postgrest.calls['realtime join']} joins)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [
+        name for name, report in results.items()
+        if "p99_ms" in report and (
+            (args.max_p99_ms and report["p99_ms"] > args.max_p99_ms)
+            or report["error_rate"] > args.max_error_rate
+        )
+    ]
+    if failed:
+        print(f"\nFAILED: {', '.join(failed)} over the p99/error-rate limits")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--order-rate", type=float, default=50, help="/api/order-update requests per second")
+    parser.add_argument("--click-rate", type=float, default=10, help="Click payments (prepare + complete) per second")
+    parser.add_argument("--update-rate", type=float, default=20, help="Telegram webhook updates per second")
+    parser.add_argument("--users", type=int, default=5000, help="distinct Telegram users")
+    parser.add_argument("--telegram-latency-ms", type=float, default=30)
+    parser.add_argument("--supabase-latency-ms", type=float, default=10)
+    parser.add_argument("--drain", type=float, default=2, help="seconds to wait for queued notifications")
+    parser.add_argument("--max-p99-ms", type=float, default=0, help="fail if any scenario's p99 is above this")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's output")
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Registry of chats that blocked the bot.
+
+A send to a user who blocked the bot costs a full Telegram round-trip just
+to fail with 403. Chats are recorded here on the first TelegramForbiddenError
+and checked (an in-memory set lookup) before notifications, direct messages
+and broadcasts. The set is persisted to local SQLite and periodically synced
+to the `profiles.bot_blocked` flag; /start clears it.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+from bot import supabase
+from config import settings
+from utils.logger import logger
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocked_chats (
+    telegram_id INTEGER PRIMARY KEY,
+    blocked INTEGER NOT NULL,
+    synced INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_blocked_chats_synced ON blocked_chats (synced);
+"""
+
+# Flag column on profiles kept in sync with the registry
+PROFILE_FLAG = "bot_blocked"
+
+# Rows pushed to Supabase per update request
+SYNC_BATCH_SIZE = 500
+
+
+class BlockedChatRegistry:
+    """
+    In-memory set of blocked chat ids, written behind to SQLite.
+
+    Args:
+        db_path: SQLite file for the registry
+        sync_interval: Seconds between pushes of changes to `profiles`
+    """
+
+    def __init__(self, db_path: str, sync_interval: float):
+        self.db_path = db_path
+        self.sync_interval = sync_interval
+        self._blocked: Set[int] = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blocked-chats")
+        self._sync_task: Optional[asyncio.Task] = None
+        self._counters = {"skipped_sends": 0, "marked": 0, "cleared": 0}
+
+    async def start(self):
+        """Load the registry and start the periodic profile sync."""
+        if self._conn is not None:
+            return
+        self._blocked = await self._run(self._open)
+        self._sync_task = asyncio.create_task(self._sync_loop(), name="blocked-chats-sync")
+        logger.info("Blocked chat registry opened at %s (%s blocked)", self.db_path, len(self._blocked))
+
+    async def stop(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+            # Push the last changes before closing
+            await self.sync()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    def is_blocked(self, telegram_id: int) -> bool:
+        """True if sends to this chat should be skipped (counted as a skipped send)."""
+        if telegram_id in self._blocked:
+            self._counters["skipped_sends"] += 1
+            return True
+        return False
+
+    def mark_blocked(self, telegram_id: int):
+        """Record a chat after Telegram answered 403 Forbidden."""
+        if telegram_id in self._blocked:
+            return
+        self._blocked.add(telegram_id)
+        self._counters["marked"] += 1
+        logger.info("Chat %s added to blocked registry", telegram_id)
+        self._write_behind(telegram_id, True)
+
+    def clear(self, telegram_id: int):
+        """Forget a chat once the user talks to the bot again."""
+        if telegram_id not in self._blocked:
+            return
+        self._blocked.discard(telegram_id)
+        self._counters["cleared"] += 1
+        logger.info("Chat %s removed from blocked registry", telegram_id)
+        self._write_behind(telegram_id, False)
+
+    def stats(self) -> dict:
+        return {"blocked": len(self._blocked), **self._counters}
+
+    async def sync(self):
+        """Push unsynced registry changes to the `profiles` flag."""
+        if self._conn is None:
+            return
+        pending = await self._run(self._unsynced)
+        for blocked in (True, False):
+            rows = [(telegram_id, updated_at) for telegram_id, flag, updated_at in pending if bool(flag) == blocked]
+            for start in range(0, len(rows), SYNC_BATCH_SIZE):
+                batch = rows[start:start + SYNC_BATCH_SIZE]
+                try:
+                    await (
+                        supabase.table("profiles")
+                        .update({PROFILE_FLAG: blocked})
+                        .in_("telegram_id", [telegram_id for telegram_id, _ in batch])
+                        .execute()
+                    )
+                except Exception as e:
+                    # Kept unsynced and retried on the next round
+                    logger.warning("Blocked chat sync to profiles failed: %s", e)
+                    return
+                await self._run(self._mark_synced, batch)
+        if pending:
+            logger.info("Synced %s blocked chat changes to profiles", len(pending))
+
+    def _write_behind(self, telegram_id: int, blocked: bool):
+        if self._conn is not None:
+            asyncio.get_running_loop().run_in_executor(self._executor, self._write, telegram_id, blocked)
+
+    async def _sync_loop(self):
+        # Off the startup path: the local registry already covers this replica
+        await self._pull_profiles()
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error("Blocked chat sync crashed: %s", e)
+
+    async def _pull_profiles(self):
+        """Adopt chats flagged by other replicas that this registry has never seen."""
+        try:
+            response = await (
+                supabase.table("profiles").select("telegram_id").eq(PROFILE_FLAG, True).execute()
+            )
+        except Exception as e:
+            logger.warning("Could not load blocked chats from profiles: %s", e)
+            return
+        remote = {row["telegram_id"] for row in response.data or [] if row.get("telegram_id")}
+        known = await self._run(self._known_ids)
+        self._blocked |= remote - known
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> Set[int]:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+        return {row[0] for row in conn.execute("SELECT telegram_id FROM blocked_chats WHERE blocked = 1")}
+
+    def _known_ids(self) -> Set[int]:
+        return {row[0] for row in self._conn.execute("SELECT telegram_id FROM blocked_chats")}
+
+    def _write(self, telegram_id: int, blocked: bool):
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO blocked_chats (telegram_id, blocked, synced, updated_at) VALUES (?, ?, 0, ?)",
+                    (telegram_id, int(blocked), time.time())
+                )
+        except Exception as e:
+            logger.error("Failed to persist blocked chat %s: %s", telegram_id, e)
+
+    def _unsynced(self) -> List[Tuple[int, int, float]]:
+        return self._conn.execute(
+            "SELECT telegram_id, blocked, updated_at FROM blocked_chats WHERE synced = 0"
+        ).fetchall()
+
+    def _mark_synced(self, rows: List[Tuple[int, float]]):
+        # A change made while the sync was in flight stays unsynced
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE blocked_chats SET synced = 1 WHERE telegram_id = ? AND updated_at = ?",
+                rows
+            )
+
+
+# Shared registry checked before every outbound send
+blocked_chats = BlockedChatRegistry(settings.blocked_chats_db_path, settings.blocked_chats_sync_interval)
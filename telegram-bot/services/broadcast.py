@@ -0,0 +1,467 @@
+"""
+Broadcast engine for sending one message to every registered profile.
+
+Recipients are streamed from `profiles` in keyset-paginated chunks ordered
+by telegram_id, sent by a small worker pool under a dedicated rate limit
+(on top of the dispatcher's global Telegram budget), and every outcome is
+recorded in a local SQLite table. A broadcast interrupted by a restart
+resumes from its last committed chunk and skips recipients already handled.
+
+Delivery is at-least-once. Outcomes are committed in batches after the
+sends, so a crash re-sends to recipients whose outcome was not committed
+yet: at most about FLUSH_EVERY + 2 * concurrency (66 by default). On a
+clean shutdown only the sends in flight (up to concurrency) can repeat.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from postgrest.types import CountMethod
+
+from bot import supabase
+from config import settings
+from services.blocked_chats import blocked_chats
+from services.dispatcher import dispatcher, TokenBucket
+from utils.logger import logger
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cursor INTEGER,
+    total INTEGER,
+    sent INTEGER NOT NULL DEFAULT 0,
+    blocked INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS broadcast_recipients (
+    broadcast_id INTEGER NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (broadcast_id, telegram_id)
+) WITHOUT ROWID;
+"""
+
+COLUMNS = "id, text, status, cursor, total, sent, blocked, failed, created_at, started_at, finished_at"
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+
+OUTCOME_SENT = "sent"
+OUTCOME_BLOCKED = "blocked"
+OUTCOME_FAILED = "failed"
+
+# Outcomes are committed at least this often within a chunk; bounds the re-send window after a crash
+FLUSH_EVERY = 50
+
+# Attempts for transient Telegram errors before a recipient counts as failed
+SEND_ATTEMPTS = 3
+
+# Window used for the throughput reported in progress()
+THROUGHPUT_WINDOW = 60.0
+
+Outcome = Tuple[int, str, Optional[str]]
+
+
+class BroadcastStore:
+    """
+    SQLite tables of broadcasts and per-recipient outcomes, accessed from one thread.
+
+    Args:
+        path: Path of the SQLite database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broadcast")
+        self._start_lock = asyncio.Lock()
+
+    async def _run(self, fn, *args):
+        if self._conn is None:
+            await self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def start(self):
+        async with self._start_lock:
+            if self._conn is not None:
+                return
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+            logger.info("Broadcast store opened at %s", self.path)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+
+    async def stop(self):
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+
+    async def create(self, text: str, total: Optional[int]) -> int:
+        return await self._run(self._create, text, total)
+
+    def _create(self, text: str, total: Optional[int]) -> int:
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO broadcasts (text, status, total, created_at) VALUES (?, ?, ?, ?)",
+                (text, STATUS_PENDING, total, time.time())
+            )
+        return cursor.lastrowid
+
+    async def get(self, broadcast_id: int) -> Optional[dict]:
+        return await self._run(self._get, broadcast_id)
+
+    def _get(self, broadcast_id: int) -> Optional[dict]:
+        row = self._conn.execute(f"SELECT {COLUMNS} FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+        return dict(row) if row else None
+
+    async def recent(self, limit: int) -> List[dict]:
+        return await self._run(self._recent, limit)
+
+    def _recent(self, limit: int) -> List[dict]:
+        rows = self._conn.execute(
+            f"SELECT {COLUMNS} FROM broadcasts ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def next_runnable(self) -> Optional[dict]:
+        """Oldest broadcast that is interrupted (running) or waiting (pending)."""
+        return await self._run(self._next_runnable)
+
+    def _next_runnable(self) -> Optional[dict]:
+        row = self._conn.execute(
+            f"SELECT {COLUMNS} FROM broadcasts WHERE status IN (?, ?) ORDER BY id LIMIT 1",
+            (STATUS_RUNNING, STATUS_PENDING)
+        ).fetchone()
+        return dict(row) if row else None
+
+    async def handled_after(self, broadcast_id: int, cursor: Optional[int]) -> Set[int]:
+        """Recipients past the cursor whose outcome was already recorded (before a restart)."""
+        return await self._run(self._handled_after, broadcast_id, cursor)
+
+    def _handled_after(self, broadcast_id: int, cursor: Optional[int]) -> Set[int]:
+        rows = self._conn.execute(
+            "SELECT telegram_id FROM broadcast_recipients WHERE broadcast_id = ? AND telegram_id > ?",
+            (broadcast_id, cursor if cursor is not None else -2 ** 63)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    async def record(self, broadcast_id: int, outcomes: List[Outcome], cursor: Optional[int] = None):
+        """Store outcomes and counters, and advance the cursor, in one transaction."""
+        await self._run(self._record, broadcast_id, outcomes, cursor)
+
+    def _record(self, broadcast_id: int, outcomes: List[Outcome], cursor: Optional[int]):
+        now = time.time()
+        counts = {OUTCOME_SENT: 0, OUTCOME_BLOCKED: 0, OUTCOME_FAILED: 0}
+        for _, outcome, _ in outcomes:
+            counts[outcome] += 1
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO broadcast_recipients (broadcast_id, telegram_id, outcome, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(broadcast_id, telegram_id, outcome, error, now) for telegram_id, outcome, error in outcomes]
+            )
+            self._conn.execute(
+                "UPDATE broadcasts SET sent = sent + ?, blocked = blocked + ?, failed = failed + ?, "
+                "cursor = COALESCE(?, cursor) WHERE id = ?",
+                (counts[OUTCOME_SENT], counts[OUTCOME_BLOCKED], counts[OUTCOME_FAILED], cursor, broadcast_id)
+            )
+
+    async def set_status(self, broadcast_id: int, status: str):
+        await self._run(self._set_status, broadcast_id, status)
+
+    def _set_status(self, broadcast_id: int, status: str):
+        now = time.time()
+        with self._conn:
+            if status == STATUS_RUNNING:
+                self._conn.execute(
+                    "UPDATE broadcasts SET status = ?, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (status, now, broadcast_id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ?",
+                    (status, now, broadcast_id)
+                )
+
+
+class BroadcastEngine:
+    """
+    Runs broadcasts one at a time, oldest first.
+
+    Args:
+        store: Broadcast and outcome tables
+        rate: Broadcast messages per second (also limited by `global_bucket`)
+        concurrency: Sends in flight at once
+        chunk_size: Recipients fetched from Supabase per page
+        global_bucket: Shared Telegram budget, so order notifications keep working
+    """
+
+    def __init__(
+        self,
+        store: BroadcastStore,
+        rate: float,
+        concurrency: int,
+        chunk_size: int,
+        global_bucket: Optional[TokenBucket] = None
+    ):
+        self.store = store
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self._bucket = TokenBucket(rate, capacity=1)
+        self._global_bucket = global_bucket
+        self._bot: Optional[Bot] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._current: Optional[int] = None
+        self._cancelled: Set[int] = set()
+        self._completed = deque()
+
+    async def start(self, bot: Bot):
+        """Start the runner; an interrupted broadcast is resumed first."""
+        # Startup and the first broadcast request may race; only one runner may exist
+        async with self._start_lock:
+            if self._runner is not None:
+                return
+            self._bot = bot
+            await self.store.start()
+            self._runner = asyncio.create_task(self._run(), name="broadcast-runner")
+
+    async def stop(self):
+        """Stop sending; the running broadcast stays resumable."""
+        if self._runner is None:
+            return
+        self._runner.cancel()
+        await asyncio.gather(self._runner, return_exceptions=True)
+        self._runner = None
+        await self.store.stop()
+
+    async def create(self, text: str) -> int:
+        """Queue a broadcast of `text` (HTML) to every profile; returns its id."""
+        broadcast_id = await self.store.create(text, await self._count_recipients())
+        self._wakeup.set()
+        logger.info("📣 Broadcast %s queued", broadcast_id)
+        return broadcast_id
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Stop a pending or running broadcast. False if it already finished."""
+        broadcast = await self.store.get(broadcast_id)
+        if broadcast is None or broadcast["status"] not in (STATUS_PENDING, STATUS_RUNNING):
+            return False
+        if broadcast_id == self._current:
+            # The runner stops at the next recipient and records the status
+            self._cancelled.add(broadcast_id)
+        else:
+            await self.store.set_status(broadcast_id, STATUS_CANCELLED)
+        return True
+
+    async def progress(self, broadcast_id: int) -> Optional[dict]:
+        """Counters, throughput (messages/second over the last minute) and ETA."""
+        broadcast = await self.store.get(broadcast_id)
+        if broadcast is None:
+            return None
+        broadcast.pop("text")
+        processed = broadcast["sent"] + broadcast["blocked"] + broadcast["failed"]
+        broadcast["processed"] = processed
+
+        throughput = 0.0
+        if broadcast_id == self._current:
+            self._prune_completed(time.monotonic())
+            throughput = len(self._completed) / THROUGHPUT_WINDOW
+        elif broadcast["started_at"] and broadcast["finished_at"]:
+            elapsed = broadcast["finished_at"] - broadcast["started_at"]
+            throughput = processed / elapsed if elapsed > 0 else 0.0
+        broadcast["throughput"] = round(throughput, 2)
+
+        remaining = (broadcast["total"] or 0) - processed
+        if broadcast["status"] == STATUS_RUNNING and throughput > 0 and remaining > 0:
+            broadcast["eta_seconds"] = round(remaining / throughput)
+        return broadcast
+
+    async def _count_recipients(self) -> Optional[int]:
+        try:
+            response = await (
+                supabase.table("profiles")
+                .select("telegram_id", count=CountMethod.exact)
+                .not_.is_("telegram_id", "null")
+                .limit(1)
+                .execute()
+            )
+            return response.count
+        except Exception as e:
+            logger.warning("Could not count broadcast recipients: %s", e)
+            return None
+
+    async def _run(self):
+        while True:
+            broadcast = await self.store.next_runnable()
+            if broadcast is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._current = broadcast["id"]
+            try:
+                await self._broadcast(broadcast)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Left as running, so it is retried after a pause (or on restart)
+                logger.error("Broadcast %s interrupted: %s", broadcast['id'], e)
+                await asyncio.sleep(30)
+            finally:
+                self._current = None
+
+    async def _broadcast(self, broadcast: dict):
+        broadcast_id = broadcast["id"]
+        cursor = broadcast["cursor"]
+        resumed = broadcast["status"] == STATUS_RUNNING
+        await self.store.set_status(broadcast_id, STATUS_RUNNING)
+        skip = await self.store.handled_after(broadcast_id, cursor) if resumed else set()
+        logger.info(
+            "📣 Broadcast %s %s%s",
+            broadcast_id,
+            "resumed" if resumed else "started",
+            f" after telegram_id {cursor}" if cursor is not None else ""
+        )
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        outcomes: List[Outcome] = []
+        workers = [
+            asyncio.create_task(self._worker(broadcast_id, broadcast["text"], queue, outcomes))
+            for _ in range(self.concurrency)
+        ]
+        try:
+            chunk = await self._fetch_chunk(cursor)
+            while chunk and broadcast_id not in self._cancelled:
+                # Fetch the next page while this one is being sent
+                next_chunk = asyncio.create_task(self._fetch_chunk(chunk[-1]))
+                try:
+                    for telegram_id in chunk:
+                        if broadcast_id in self._cancelled:
+                            break
+                        if telegram_id in skip:
+                            continue
+                        # Blocks while the workers are busy: backpressure on the reader
+                        await queue.put(telegram_id)
+                        if len(outcomes) >= FLUSH_EVERY:
+                            await self._flush(broadcast_id, outcomes)
+                    await queue.join()
+                    if broadcast_id in self._cancelled:
+                        break
+                    await self._flush(broadcast_id, outcomes, cursor=chunk[-1])
+                    chunk = await next_chunk
+                finally:
+                    next_chunk.cancel()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Whatever was sent before an interruption is kept, without moving the cursor
+            if outcomes:
+                await asyncio.shield(self._flush(broadcast_id, outcomes))
+
+        if broadcast_id in self._cancelled:
+            self._cancelled.discard(broadcast_id)
+            await self.store.set_status(broadcast_id, STATUS_CANCELLED)
+            logger.info("📣 Broadcast %s cancelled", broadcast_id)
+        else:
+            await self.store.set_status(broadcast_id, STATUS_COMPLETED)
+            logger.info("📣 Broadcast %s completed", broadcast_id)
+
+    async def _fetch_chunk(self, after: Optional[int]) -> List[int]:
+        query = supabase.table("profiles").select("telegram_id").not_.is_("telegram_id", "null")
+        if after is not None:
+            query = query.gt("telegram_id", after)
+        response = await query.order("telegram_id").limit(self.chunk_size).execute()
+        return [row["telegram_id"] for row in response.data or []]
+
+    async def _flush(self, broadcast_id: int, outcomes: List[Outcome], cursor: Optional[int] = None):
+        batch = outcomes[:]
+        outcomes.clear()
+        await self.store.record(broadcast_id, batch, cursor)
+
+    async def _worker(self, broadcast_id: int, text: str, queue: asyncio.Queue, outcomes: List[Outcome]):
+        while True:
+            telegram_id = await queue.get()
+            try:
+                if broadcast_id not in self._cancelled:
+                    outcome, error = await self._send(telegram_id, text)
+                    outcomes.append((telegram_id, outcome, error))
+                    now = time.monotonic()
+                    self._completed.append(now)
+                    self._prune_completed(now)
+            finally:
+                queue.task_done()
+
+    async def _send(self, telegram_id: int, text: str) -> Tuple[str, Optional[str]]:
+        if blocked_chats.is_blocked(telegram_id):
+            return OUTCOME_BLOCKED, "Skipped: chat is in the blocked registry"
+
+        attempts = 0
+        while True:
+            await self._bucket.acquire()
+            if self._global_bucket is not None:
+                await self._global_bucket.acquire()
+            attempts += 1
+            try:
+                await self._bot.send_message(chat_id=telegram_id, text=text, parse_mode="HTML")
+                return OUTCOME_SENT, None
+            except TelegramRetryAfter as e:
+                # Flood control applies to the whole bot, so everyone waits
+                logger.warning("Broadcast flood control, pausing %ss", e.retry_after)
+                self._bucket.block_for(e.retry_after)
+                if self._global_bucket is not None:
+                    self._global_bucket.block_for(e.retry_after)
+            except TelegramForbiddenError as e:
+                blocked_chats.mark_blocked(telegram_id)
+                return OUTCOME_BLOCKED, str(e)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempts >= SEND_ATTEMPTS:
+                    return OUTCOME_FAILED, str(e)
+                await asyncio.sleep(2 ** attempts)
+            except Exception as e:
+                return OUTCOME_FAILED, str(e)
+
+    def _prune_completed(self, now: float):
+        while self._completed and now - self._completed[0] > THROUGHPUT_WINDOW:
+            self._completed.popleft()
+
+
+# Shared broadcast engine; shares the global Telegram budget with the dispatcher
+broadcast_engine = BroadcastEngine(
+    BroadcastStore(settings.broadcast_db_path),
+    rate=settings.broadcast_rate,
+    concurrency=settings.broadcast_concurrency,
+    chunk_size=settings.broadcast_chunk_size,
+    global_bucket=dispatcher.global_bucket
+)
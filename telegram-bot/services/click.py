@@ -0,0 +1,280 @@
+"""
+Click SHOP API engine (prepare/complete).
+
+Verifies the MD5 `sign_string`, validates the order amount on prepare and
+reserves a `merchant_prepare_id` for it. The order looked up on prepare is
+cached per `merchant_trans_id`, so complete only does the status write.
+Documentation: https://docs.click.uz/click-api-request/
+"""
+import hashlib
+import hmac
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from bot import supabase
+from config import settings
+from services.order_status import transition_order_status
+from utils.logger import logger
+
+
+ACTION_PREPARE = 0
+ACTION_COMPLETE = 1
+
+# Prepared payments are kept this long waiting for complete
+PREPARE_TTL = 3600.0
+
+# Latency samples kept per action for percentiles
+LATENCY_SAMPLES = 1000
+
+# Click error codes
+ERROR_SUCCESS = 0
+ERROR_SIGN_CHECK_FAILED = -1
+ERROR_INCORRECT_AMOUNT = -2
+ERROR_ACTION_NOT_FOUND = -3
+ERROR_ALREADY_PAID = -4
+ERROR_ORDER_NOT_FOUND = -5
+ERROR_TRANSACTION_NOT_FOUND = -6
+ERROR_UPDATE_FAILED = -7
+ERROR_BAD_REQUEST = -8
+ERROR_TRANSACTION_CANCELLED = -9
+
+ERROR_NOTES = {
+    ERROR_SUCCESS: "Success",
+    ERROR_SIGN_CHECK_FAILED: "SIGN CHECK FAILED!",
+    ERROR_INCORRECT_AMOUNT: "Incorrect parameter amount",
+    ERROR_ACTION_NOT_FOUND: "Action not found",
+    ERROR_ALREADY_PAID: "Already paid",
+    ERROR_ORDER_NOT_FOUND: "Order does not exist",
+    ERROR_TRANSACTION_NOT_FOUND: "Transaction does not exist",
+    ERROR_UPDATE_FAILED: "Failed to update order",
+    ERROR_BAD_REQUEST: "Error in request from click",
+    ERROR_TRANSACTION_CANCELLED: "Transaction cancelled",
+}
+
+
+@dataclass
+class ClickRequest:
+    """Form fields posted by Click to the prepare and complete URLs."""
+    click_trans_id: int
+    service_id: int
+    click_paydoc_id: int
+    merchant_trans_id: str
+    amount: str
+    action: int
+    error: int
+    error_note: str
+    sign_time: str
+    sign_string: str
+    merchant_prepare_id: Optional[int] = None
+
+
+@dataclass
+class _PreparedPayment:
+    """Order data captured on prepare, reused by complete."""
+    prepare_id: int
+    click_trans_id: int
+    merchant_trans_id: str
+    amount: float
+    expires_at: float
+
+
+class ClickMerchant:
+    """
+    Click prepare/complete handler with signature verification.
+
+    Args:
+        secret_key: Secret key from the Click merchant cabinet
+        service_id: Expected service id (None to accept any)
+    """
+
+    def __init__(self, secret_key: Optional[str], service_id: Optional[int]):
+        self.secret_key = secret_key
+        self.service_id = service_id
+        # Start above ids issued by earlier runs
+        self._prepare_ids = itertools.count(int(time.time() * 1000))
+        self._prepared: Dict[int, _PreparedPayment] = {}
+        self._by_order: Dict[str, _PreparedPayment] = {}
+        self._latency = {ACTION_PREPARE: deque(maxlen=LATENCY_SAMPLES), ACTION_COMPLETE: deque(maxlen=LATENCY_SAMPLES)}
+
+    async def handle(self, request: ClickRequest) -> dict:
+        """Verify and process a Click callback, recording its latency."""
+        started = time.perf_counter()
+        try:
+            if request.action == ACTION_PREPARE:
+                response = await self.prepare(request)
+            elif request.action == ACTION_COMPLETE:
+                response = await self.complete(request)
+            else:
+                response = self._response(request, ERROR_ACTION_NOT_FOUND)
+        finally:
+            samples = self._latency.get(request.action)
+            if samples is not None:
+                samples.append(time.perf_counter() - started)
+
+        logger.info(
+            "💰 Click action=%s for order %s: "
+            "error=%s",
+            request.action, request.merchant_trans_id, response['error']
+        )
+        return response
+
+    def verify_sign(self, request: ClickRequest) -> bool:
+        """Check `sign_string` = md5(click_trans_id service_id secret merchant_trans_id [prepare_id] amount action sign_time)."""
+        if not self.secret_key:
+            logger.error("CLICK_SECRET_KEY is not configured, rejecting Click callback")
+            return False
+        prepare_id = "" if request.action == ACTION_PREPARE else str(request.merchant_prepare_id or "")
+        raw = (
+            f"{request.click_trans_id}{request.service_id}{self.secret_key}"
+            f"{request.merchant_trans_id}{prepare_id}{request.amount}{request.action}{request.sign_time}"
+        )
+        expected = hashlib.md5(raw.encode()).hexdigest()
+        return hmac.compare_digest(expected, request.sign_string.lower())
+
+    async def prepare(self, request: ClickRequest) -> dict:
+        error = self._check_request(request)
+        if error is not None:
+            return self._response(request, error)
+
+        amount = float(request.amount)
+        prepared = self._by_order.get(request.merchant_trans_id)
+        if prepared and prepared.expires_at > time.monotonic():
+            if prepared.click_trans_id == request.click_trans_id:
+                # Repeated prepare for the same Click transaction
+                return self._response(request, ERROR_SUCCESS, merchant_prepare_id=prepared.prepare_id)
+
+        try:
+            order = await self._load_order(request.merchant_trans_id)
+        except Exception as e:
+            # Not the order's fault: report it as a failure on our side, not "order does not exist"
+            logger.error("❌ Click prepare: order lookup failed for %s: %s", request.merchant_trans_id, e)
+            return self._response(request, ERROR_UPDATE_FAILED)
+        if order is None:
+            return self._response(request, ERROR_ORDER_NOT_FOUND)
+        if order.get("status") != "pending_payment":
+            return self._response(request, ERROR_ALREADY_PAID)
+        if abs((order.get("total_price") or 0) - amount) >= 0.01:
+            return self._response(request, ERROR_INCORRECT_AMOUNT)
+
+        self._sweep()
+        prepared = _PreparedPayment(
+            prepare_id=next(self._prepare_ids),
+            click_trans_id=request.click_trans_id,
+            merchant_trans_id=request.merchant_trans_id,
+            amount=amount,
+            expires_at=time.monotonic() + PREPARE_TTL
+        )
+        self._prepared[prepared.prepare_id] = prepared
+        self._by_order[prepared.merchant_trans_id] = prepared
+        return self._response(request, ERROR_SUCCESS, merchant_prepare_id=prepared.prepare_id)
+
+    async def complete(self, request: ClickRequest) -> dict:
+        error = self._check_request(request)
+        if error is not None:
+            return self._response(request, error)
+
+        prepared = self._prepared.get(request.merchant_prepare_id)
+        if prepared is None:
+            # Prepared before a restart: validate against the database instead of the cache
+            try:
+                prepared = await self._recover(request)
+            except Exception as e:
+                logger.error("❌ Click complete: order lookup failed for %s: %s", request.merchant_trans_id, e)
+                return self._response(request, ERROR_UPDATE_FAILED)
+            if prepared is None:
+                return self._response(request, ERROR_TRANSACTION_NOT_FOUND)
+
+        if prepared.click_trans_id != request.click_trans_id or prepared.merchant_trans_id != request.merchant_trans_id:
+            return self._response(request, ERROR_TRANSACTION_NOT_FOUND)
+        if abs(prepared.amount - float(request.amount)) >= 0.01:
+            return self._response(request, ERROR_INCORRECT_AMOUNT)
+
+        if request.error < 0:
+            # Click reports the payment failed or was cancelled
+            self._release(prepared)
+            return self._response(request, ERROR_TRANSACTION_CANCELLED)
+
+        try:
+            paid = await transition_order_status(request.merchant_trans_id, "pending")
+        except Exception as e:
+            logger.error("❌ Click complete failed for order %s: %s", request.merchant_trans_id, e)
+            return self._response(request, ERROR_UPDATE_FAILED)
+
+        self._release(prepared)
+        if not paid:
+            return self._response(request, ERROR_ALREADY_PAID)
+        return self._response(request, ERROR_SUCCESS, merchant_confirm_id=prepared.prepare_id)
+
+    def stats(self) -> dict:
+        """Callback latency per action in milliseconds."""
+        result = {"prepared": len(self._prepared)}
+        for action, name in ((ACTION_PREPARE, "prepare"), (ACTION_COMPLETE, "complete")):
+            samples = sorted(self._latency[action])
+            if samples:
+                result[name] = {
+                    "count": len(samples),
+                    "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+                    "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2),
+                    "max_ms": round(samples[-1] * 1000, 2),
+                }
+        return result
+
+    def _check_request(self, request: ClickRequest) -> Optional[int]:
+        if not self.verify_sign(request):
+            logger.warning("Click sign check failed for order %s", request.merchant_trans_id)
+            return ERROR_SIGN_CHECK_FAILED
+        if self.service_id is not None and request.service_id != self.service_id:
+            return ERROR_BAD_REQUEST
+        try:
+            float(request.amount)
+        except ValueError:
+            return ERROR_INCORRECT_AMOUNT
+        if request.action == ACTION_PREPARE and request.error < 0:
+            return ERROR_TRANSACTION_CANCELLED
+        return None
+
+    async def _load_order(self, order_id: str) -> Optional[dict]:
+        """The order row, or None if it does not exist. Lookup failures propagate."""
+        response = await supabase.table("orders").select("id,status,total_price").eq("id", order_id).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    async def _recover(self, request: ClickRequest) -> Optional[_PreparedPayment]:
+        if request.merchant_prepare_id is None:
+            return None
+        order = await self._load_order(request.merchant_trans_id)
+        if order is None:
+            return None
+        return _PreparedPayment(
+            prepare_id=request.merchant_prepare_id,
+            click_trans_id=request.click_trans_id,
+            merchant_trans_id=request.merchant_trans_id,
+            amount=float(order.get("total_price") or 0),
+            expires_at=time.monotonic() + PREPARE_TTL
+        )
+
+    def _release(self, prepared: _PreparedPayment):
+        self._prepared.pop(prepared.prepare_id, None)
+        if self._by_order.get(prepared.merchant_trans_id) is prepared:
+            del self._by_order[prepared.merchant_trans_id]
+
+    def _sweep(self):
+        now = time.monotonic()
+        for prepared in [p for p in self._prepared.values() if p.expires_at <= now]:
+            self._release(prepared)
+
+    @staticmethod
+    def _response(request: ClickRequest, error: int, **extra) -> dict:
+        return {
+            "click_trans_id": request.click_trans_id,
+            "merchant_trans_id": request.merchant_trans_id,
+            **extra,
+            "error": error,
+            "error_note": ERROR_NOTES[error],
+        }
+
+
+# Shared Click engine
+click_merchant = ClickMerchant(settings.click_secret_key, settings.click_service_id)
@@ -0,0 +1,142 @@
+"""
+Per-order coalescing of rapid successive status updates.
+
+Kitchens often click confirmed -> ready -> delivering within seconds. While an
+update for an order is still queued, newer updates are folded into it so only
+the furthest status is sent; once a message has been sent, updates arriving
+within the window edit that message instead of sending a new one.
+"""
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional
+
+from services.order_status import STATUS_RANK
+from utils.logger import logger
+
+if TYPE_CHECKING:
+    from services.dispatcher import NotificationJob
+
+
+@dataclass
+class _OrderEntry:
+    """What the coalescer knows about one order."""
+    pending: Optional["NotificationJob"] = None
+    chat_id: Optional[int] = None
+    message_id: Optional[int] = None
+    sent_at: float = 0.0
+    touched_at: float = 0.0
+
+
+class StatusCoalescer:
+    """
+    In-memory map of order_id -> latest queued job / last sent message.
+
+    Entries expire `window` seconds after they were last touched, unless a
+    job for the order is still waiting in the queue.
+
+    Args:
+        window: Coalescing interval in seconds (0 disables coalescing)
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._entries: Dict[str, _OrderEntry] = {}
+        self._last_sweep = time.monotonic()
+        self._counters = {"coalesced": 0, "edited": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def absorb(self, job: "NotificationJob") -> bool:
+        """
+        Fold `job` into a queued job for the same order, if there is one.
+
+        Returns:
+            True if the job was absorbed and must not be queued itself
+        """
+        if not self.enabled:
+            return False
+
+        now = time.monotonic()
+        self._maybe_sweep(now)
+        entry = self._entries.get(job.order_id)
+        target = entry.pending if entry else None
+        if target is None or target.telegram_user_id != job.telegram_user_id:
+            return False
+
+        # Updates arrive out of order (webhook and Realtime feed, retries); keep the furthest status
+        job_rank, target_rank = STATUS_RANK.get(job.status, 0), STATUS_RANK.get(target.status, 0)
+        if job_rank > target_rank or (job_rank == target_rank and job.enqueued_at >= target.enqueued_at):
+            target.status = job.status
+            target.product_name = job.product_name or target.product_name
+            target.order_type = job.order_type or target.order_type
+            target.locale = job.locale or target.locale
+            target.enqueued_at = job.enqueued_at
+        if job.outbox_id is not None:
+            target.merged_outbox_ids.append(job.outbox_id)
+        target.merged_outbox_ids.extend(job.merged_outbox_ids)
+
+        entry.touched_at = now
+        self._counters["coalesced"] += 1
+        logger.info("Coalesced update for order %s into queued job %s", job.order_id, target.job_id)
+        return True
+
+    def track(self, job: "NotificationJob"):
+        """Remember `job` as the queued job for its order."""
+        if not self.enabled:
+            return
+        entry = self._entries.setdefault(job.order_id, _OrderEntry())
+        entry.pending = job
+        entry.touched_at = time.monotonic()
+
+    def claim(self, job: "NotificationJob") -> Optional[int]:
+        """
+        Mark `job` as being sent so later updates queue separately.
+
+        Returns:
+            Message id to edit instead of sending a new message, if the
+            previous message for this order was sent within the window
+        """
+        if not self.enabled:
+            return None
+        entry = self._entries.get(job.order_id)
+        if entry is None:
+            return None
+        if entry.pending is job:
+            entry.pending = None
+
+        now = time.monotonic()
+        if (
+            entry.message_id is not None
+            and entry.chat_id == job.telegram_user_id
+            and now - entry.sent_at < self.window
+        ):
+            self._counters["edited"] += 1
+            return entry.message_id
+        return None
+
+    def record_sent(self, job: "NotificationJob", message_id: Optional[int]):
+        """Remember the message sent for `job` so follow-ups can edit it."""
+        if not self.enabled or message_id is None:
+            return
+        now = time.monotonic()
+        entry = self._entries.setdefault(job.order_id, _OrderEntry())
+        entry.chat_id = job.telegram_user_id
+        entry.message_id = message_id
+        entry.sent_at = now
+        entry.touched_at = now
+
+    def stats(self) -> dict:
+        return {"tracked_orders": len(self._entries), **self._counters}
+
+    def _maybe_sweep(self, now: float):
+        if now - self._last_sweep < self.window:
+            return
+        self._last_sweep = now
+        expired = [
+            order_id for order_id, entry in self._entries.items()
+            if entry.pending is None and now - entry.touched_at >= self.window
+        ]
+        for order_id in expired:
+            del self._entries[order_id]
@@ -0,0 +1,339 @@
+"""
+Background dispatcher for outbound order notifications.
+
+Webhook requests only enqueue a job; worker tasks drain the queue while
+respecting Telegram's per-chat and global send limits.
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+
+from config import settings
+from services.coalescer import StatusCoalescer
+from services.notify_user import notify_user_order_status
+from services.outbox import outbox
+from utils.logger import logger, log_context
+from utils.tracing import tracer, current_span_context, SpanContext
+
+
+# Window used to compute the drain rate reported by stats()
+DRAIN_RATE_WINDOW = 60.0
+
+# Per-chat buckets are swept once the map grows past this size
+CHAT_BUCKETS_SWEEP_SIZE = 5000
+
+
+class TokenBucket:
+    """
+    Async token bucket limiting how often an action may happen.
+
+    Args:
+        rate: Tokens added per second
+        capacity: Maximum burst size
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it (FIFO between waiters)."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def block_for(self, seconds: float):
+        """Hand out no tokens for the given number of seconds (Telegram retry_after)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    def is_idle(self) -> bool:
+        """True if the bucket is full and nobody is waiting on it."""
+        self._refill(time.monotonic())
+        return not self._lock.locked() and self._tokens >= self.capacity
+
+
+@dataclass
+class NotificationJob:
+    """A single order status notification waiting to be sent."""
+    telegram_user_id: int
+    order_id: str
+    status: str
+    product_name: Optional[str] = None
+    order_type: Optional[str] = None
+    locale: Optional[str] = None
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    outbox_id: Optional[int] = None
+    merged_outbox_ids: List[int] = field(default_factory=list)
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # Trace of the request that queued the job (not persisted)
+    trace_parent: Optional[SpanContext] = field(default_factory=current_span_context, repr=False)
+
+    def to_payload(self) -> dict:
+        """Fields persisted in the outbox."""
+        return {
+            "telegram_user_id": self.telegram_user_id,
+            "order_id": self.order_id,
+            "status": self.status,
+            "product_name": self.product_name,
+            "order_type": self.order_type,
+            "locale": self.locale,
+        }
+
+    def outbox_ids(self) -> List[int]:
+        """Outbox rows settled by this job, including coalesced updates."""
+        ids = [self.outbox_id] if self.outbox_id is not None else []
+        return ids + self.merged_outbox_ids
+
+    @classmethod
+    def from_outbox(cls, outbox_id: int, payload: dict) -> "NotificationJob":
+        return cls(**payload, job_id=str(outbox_id), outbox_id=outbox_id)
+
+
+class NotificationDispatcher:
+    """
+    Queue of notification jobs drained by a pool of worker tasks.
+
+    Args:
+        workers: Number of concurrent worker tasks
+        queue_size: Maximum number of queued jobs
+        global_rate: Messages per second allowed across all chats
+        chat_rate: Messages per second allowed into a single chat
+        max_attempts: Attempts per job before it is dropped
+        coalesce_window: Seconds during which updates for one order collapse
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        global_rate: float,
+        chat_rate: float,
+        max_attempts: int,
+        coalesce_window: float = 0.0
+    ):
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.max_attempts = max_attempts
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._coalescer = StatusCoalescer(coalesce_window)
+        self._tasks = []
+        self._bot: Optional[Bot] = None
+        self._in_flight = 0
+        self._completed = deque()
+        self._counters = {"accepted": 0, "sent": 0, "failed": 0, "retried": 0}
+
+    async def start(self, bot: Bot):
+        """Start worker tasks sending through the given bot."""
+        if self._tasks:
+            return
+        self._bot = bot
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"notify-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info("Notification dispatcher started with %s workers", self.workers)
+
+    async def stop(self, timeout: float = 5.0):
+        """Give queued jobs a moment to drain, then stop the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dispatcher stopped with %s jobs still queued", self._queue.qsize())
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Notification dispatcher stopped")
+
+    @property
+    def global_bucket(self) -> TokenBucket:
+        """Global Telegram send budget, shared with other senders such as broadcasts."""
+        return self._global_bucket
+
+    def submit(self, job: NotificationJob) -> str:
+        """
+        Queue a job without waiting for it to be sent.
+
+        A job for an order that already has one waiting in the queue is
+        folded into it instead of being queued separately.
+
+        Raises:
+            asyncio.QueueFull: If the queue is at capacity
+        """
+        if not self._coalescer.absorb(job):
+            self._queue.put_nowait(job)
+            self._coalescer.track(job)
+        self._counters["accepted"] += 1
+        return job.job_id
+
+    async def replay_outbox(self) -> int:
+        """
+        Re-queue every outbox row that was not delivered before the last shutdown.
+
+        Returns:
+            Number of replayed jobs
+        """
+        pending = await outbox.load_pending()
+        for outbox_id, payload in pending:
+            job = NotificationJob.from_outbox(outbox_id, payload)
+            if not self._coalescer.absorb(job):
+                # Wait for room instead of failing: these updates were already accepted
+                await self._queue.put(job)
+                self._coalescer.track(job)
+            self._counters["accepted"] += 1
+        if pending:
+            logger.info("Replayed %s pending notifications from outbox", len(pending))
+        return len(pending)
+
+    def stats(self) -> dict:
+        """Queue depth, counters and drain rate (messages/second over the last minute)."""
+        self._prune_completed(time.monotonic())
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "in_flight": self._in_flight,
+            "workers": len(self._tasks),
+            "drain_rate": round(len(self._completed) / DRAIN_RATE_WINDOW, 3),
+            **self._counters,
+            "coalescer": self._coalescer.stats(),
+        }
+
+    def _prune_completed(self, now: float):
+        while self._completed and now - self._completed[0] > DRAIN_RATE_WINDOW:
+            self._completed.popleft()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= CHAT_BUCKETS_SWEEP_SIZE:
+                self._chat_buckets = {
+                    cid: b for cid, b in self._chat_buckets.items() if not b.is_idle()
+                }
+            bucket = TokenBucket(self.chat_rate)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            self._in_flight += 1
+            try:
+                with log_context(order_id=job.order_id), tracer.start_as_current_span(
+                    "notify",
+                    {"order_id": job.order_id, "attempt": job.attempts + 1,
+                     "queue_wait_ms": round((time.monotonic() - job.enqueued_at) * 1000, 1)},
+                    parent=job.trace_parent
+                ):
+                    await self._process(job)
+            except Exception as e:
+                self._fail(job)
+                logger.error("Dispatcher worker %s crashed on job %s: %s", index, job.job_id, e)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _process(self, job: NotificationJob):
+        chat_bucket = self._chat_bucket(job.telegram_user_id)
+        await chat_bucket.acquire()
+        await self._global_bucket.acquire()
+
+        job.attempts += 1
+        edit_message_id = self._coalescer.claim(job)
+        result = await notify_user_order_status(
+            bot=self._bot,
+            telegram_user_id=job.telegram_user_id,
+            order_id=job.order_id,
+            status=job.status,
+            product_name=job.product_name,
+            order_type=job.order_type,
+            locale=job.locale,
+            message_id=edit_message_id
+        )
+
+        if result["success"]:
+            self._counters["sent"] += 1
+            self._coalescer.record_sent(job, result.get("message_id"))
+            for outbox_id in job.outbox_ids():
+                outbox.mark_done(outbox_id)
+            now = time.monotonic()
+            self._completed.append(now)
+            self._prune_completed(now)
+            return
+
+        retry_after = result.get("retry_after")
+        if retry_after:
+            # Flood control: pause this chat and the whole bot, not just this job
+            chat_bucket.block_for(retry_after)
+            self._global_bucket.block_for(retry_after)
+        elif result.get("retryable"):
+            retry_after = min(2 ** job.attempts, 30)
+        else:
+            self._fail(job)
+            return
+
+        if job.attempts >= self.max_attempts:
+            self._fail(job)
+            logger.error("Giving up on job %s for order %s after %s attempts", job.job_id, job.order_id, job.attempts)
+            return
+
+        self._counters["retried"] += 1
+        logger.warning("Retrying job %s for order %s in %ss", job.job_id, job.order_id, retry_after)
+        asyncio.get_running_loop().call_later(retry_after, self._requeue, job)
+
+    def _fail(self, job: NotificationJob):
+        self._counters["failed"] += 1
+        for outbox_id in job.outbox_ids():
+            outbox.mark_failed(outbox_id)
+
+    def _requeue(self, job: NotificationJob):
+        if self._coalescer.absorb(job):
+            # A newer update for the order is already queued and carries this one
+            return
+        try:
+            self._queue.put_nowait(job)
+            self._coalescer.track(job)
+        except asyncio.QueueFull:
+            # Left pending in the outbox, so it is replayed on the next start
+            self._counters["failed"] += 1
+            logger.error("Queue full, dropping retry of job %s for order %s", job.job_id, job.order_id)
+
+
+# Shared dispatcher instance
+dispatcher = NotificationDispatcher(
+    workers=settings.notify_workers,
+    queue_size=settings.notify_queue_size,
+    global_rate=settings.telegram_global_rate,
+    chat_rate=settings.telegram_chat_rate,
+    max_attempts=settings.notify_max_attempts,
+    coalesce_window=settings.notify_coalesce_window
+)
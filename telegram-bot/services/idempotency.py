@@ -0,0 +1,191 @@
+"""
+Idempotency key store for payment provider callbacks.
+
+Click and Payme retry callbacks aggressively. The first response for a
+transaction is stored under its idempotency key and replayed for duplicates
+straight from memory, without touching Supabase or the bot. An optional
+SQLite tier keeps the responses across restarts.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config import settings
+from utils.logger import logger
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency (created_at);
+"""
+
+
+class IdempotencyStore:
+    """
+    Bounded in-memory map of key -> first response, with optional SQLite persistence.
+
+    On start the most recent persisted responses are loaded into memory, so
+    lookups never wait on disk; new responses are written behind.
+
+    Args:
+        max_size: Maximum number of responses kept in memory
+        ttl: Seconds a response is replayed for
+        db_path: SQLite file for the persistence tier, or None for memory only
+    """
+
+    def __init__(self, max_size: int, ttl: float, db_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="idempotency")
+        self._counters = {"hits": 0, "misses": 0}
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """Open the persistence tier and load recent responses into memory."""
+        async with self._start_lock:
+            if not self.db_path or self._conn is not None:
+                return
+            rows = await self._run(self._open)
+            now = time.time()
+            for key, response, created_at in rows:
+                self._remember(key, json.loads(response), created_at + self.ttl - now)
+            logger.info("Idempotency store opened at %s (%s keys loaded)", self.db_path, len(rows))
+
+    async def stop(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    async def run(
+        self,
+        key: str,
+        handler: Callable[[], Awaitable[dict]],
+        cacheable: Callable[[dict], bool] = lambda response: True
+    ) -> dict:
+        """
+        Return the stored response for `key`, or run `handler` once and store its result.
+
+        Concurrent duplicates wait for the first call instead of running the
+        handler again.
+
+        Args:
+            key: Idempotency key, e.g. "click:<click_trans_id>:<action>"
+            handler: Coroutine function producing the response
+            cacheable: Decides whether a response is final and may be replayed
+        """
+        if self._conn is None and self.db_path:
+            # First payment callback since startup: load stored responses before answering
+            try:
+                await self.start()
+            except Exception as e:
+                logger.error("Idempotency store unavailable, answering from memory only: %s", e)
+
+        response = self.get(key)
+        if response is not None:
+            return response
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await handler()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            if cacheable(response):
+                self.put(key, response)
+            future.set_result(response)
+            return response
+        finally:
+            self._inflight.pop(key, None)
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > time.monotonic():
+                self._counters["hits"] += 1
+                return response
+            del self._entries[key]
+        self._counters["misses"] += 1
+        return None
+
+    def put(self, key: str, response: dict):
+        """Store a response in memory and write it behind to SQLite."""
+        self._remember(key, response, self.ttl)
+        if self._conn is not None:
+            asyncio.get_running_loop().run_in_executor(
+                self._executor, self._write, key, json.dumps(response)
+            )
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "persistent": self._conn is not None,
+            **self._counters,
+        }
+
+    def _remember(self, key: str, response: dict, ttl: float):
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.execute("DELETE FROM idempotency WHERE created_at < ?", (time.time() - self.ttl,))
+        rows = conn.execute(
+            "SELECT key, response, created_at FROM idempotency ORDER BY created_at DESC LIMIT ?",
+            (self.max_size,)
+        ).fetchall()
+        self._conn = conn
+        # Oldest first, so the LRU order matches insertion order
+        return rows[::-1]
+
+    def _write(self, key: str, response: str):
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO idempotency (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, time.time())
+                )
+        except Exception as e:
+            logger.error("Failed to persist idempotency key %s: %s", key, e)
+
+
+# Shared store for payment callbacks
+idempotency_store = IdempotencyStore(
+    max_size=settings.idempotency_cache_size,
+    ttl=settings.idempotency_ttl,
+    db_path=settings.idempotency_db_path or None
+)
@@ -0,0 +1,247 @@
+"""
+Signed Web App launch tokens.
+
+The Web App URL carries one `launch` parameter instead of the user's
+profile in plain query parameters. It is a base64url string of a packed
+binary payload (version, expiry, telegram_id, phone, name) followed by a
+truncated HMAC-SHA256. The website sends it back to
+POST /api/launch-token/verify, and the bot checks it without querying
+Supabase.
+
+Tokens expire, but reply keyboards stay in the chat for weeks. When a
+token has expired the website falls back to the Web App's Telegram
+`initData`, which Telegram signs with the bot token at every launch
+(verify_init_data).
+
+Layout (big-endian):
+    B version | B flags | I expires_at | Q telegram_id
+    | Q phone digits (flags & PHONE_E164) or B length + UTF-8 phone
+    | UTF-8 full_name (rest) | 16-byte signature
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import struct
+import time
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from config import settings
+
+
+VERSION = 1
+SIGNATURE_SIZE = 16
+MAX_NAME_BYTES = 96
+
+# flags
+PHONE_E164 = 1
+
+# initData is signed when the Web App opens, so only recent launches are accepted
+INIT_DATA_MAX_AGE = 86400
+
+_HEADER = struct.Struct(">BBIQ")
+_PHONE = struct.Struct(">Q")
+
+
+class InvalidLaunchToken(ValueError):
+    """The token is malformed, forged or expired."""
+
+
+@dataclass(frozen=True)
+class LaunchProfile:
+    """Profile fields carried by a verified token."""
+    telegram_user_id: int
+    full_name: Optional[str]
+    phone: Optional[str]
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _truncate_utf8(text: str, limit: int) -> bytes:
+    return text.encode("utf-8")[:limit].decode("utf-8", "ignore").encode("utf-8")
+
+
+class LaunchTokens:
+    """
+    Issues and verifies launch tokens; verification results are cached per token.
+
+    Args:
+        secret: HMAC key
+        ttl: Seconds a token stays valid after it is issued
+        cache_size: Maximum number of cached verification results
+    """
+
+    def __init__(self, secret: bytes, ttl: float, cache_size: int):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._secret = secret
+        self._verified: "OrderedDict[str, Tuple[Optional[LaunchProfile], str]]" = OrderedDict()
+        self._counters = {"issued": 0, "hits": 0, "misses": 0, "rejected": 0}
+
+    def issue(self, telegram_user_id: int, full_name: Optional[str] = None, phone: Optional[str] = None) -> str:
+        """
+        Create a token for a user.
+
+        Args:
+            telegram_user_id: User's Telegram ID
+            full_name: User's full name (truncated to MAX_NAME_BYTES)
+            phone: User's phone number
+
+        Returns:
+            base64url token
+        """
+        flags = 0
+        digits = phone[1:] if phone and phone.startswith("+") else ""
+        if digits.isdigit() and not digits.startswith("0") and len(digits) <= 18:
+            flags |= PHONE_E164
+            phone_part = _PHONE.pack(int(digits))
+        else:
+            encoded = _truncate_utf8(phone or "", 255)
+            phone_part = bytes((len(encoded),)) + encoded
+
+        expires_at = int(time.time() + self.ttl)
+        payload = (
+            _HEADER.pack(VERSION, flags, expires_at, telegram_user_id)
+            + phone_part
+            + _truncate_utf8(full_name or "", MAX_NAME_BYTES)
+        )
+        self._counters["issued"] += 1
+        return _b64encode(payload + self._sign(payload))
+
+    def verify(self, token: str) -> LaunchProfile:
+        """
+        Check a token's signature and expiry.
+
+        Returns:
+            The profile fields the token was issued for
+
+        Raises:
+            InvalidLaunchToken: If the token is malformed, forged or expired
+        """
+        entry = self._verified.get(token)
+        if entry is not None:
+            self._verified.move_to_end(token)
+            self._counters["hits"] += 1
+        else:
+            self._counters["misses"] += 1
+            try:
+                entry = (self._decode(token), "")
+            except InvalidLaunchToken as e:
+                entry = (None, str(e))
+            self._verified[token] = entry
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+
+        profile, error = entry
+        if profile is None:
+            self._counters["rejected"] += 1
+            raise InvalidLaunchToken(error)
+        if profile.expires_at < time.time():
+            self._counters["rejected"] += 1
+            raise InvalidLaunchToken("Launch token expired")
+        return profile
+
+    def stats(self) -> dict:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "cached": len(self._verified),
+            "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+            **self._counters,
+        }
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+    def _decode(self, token: str) -> LaunchProfile:
+        try:
+            raw = _b64decode(token)
+        except (binascii.Error, ValueError):
+            raise InvalidLaunchToken("Malformed launch token")
+        if len(raw) < _HEADER.size + 1 + SIGNATURE_SIZE:
+            raise InvalidLaunchToken("Malformed launch token")
+
+        payload, signature = raw[:-SIGNATURE_SIZE], raw[-SIGNATURE_SIZE:]
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidLaunchToken("Invalid launch token signature")
+
+        version, flags, expires_at, telegram_user_id = _HEADER.unpack_from(payload)
+        if version != VERSION:
+            raise InvalidLaunchToken("Unsupported launch token version")
+        offset = _HEADER.size
+        try:
+            if flags & PHONE_E164:
+                phone = f"+{_PHONE.unpack_from(payload, offset)[0]}"
+                offset += _PHONE.size
+            else:
+                length = payload[offset]
+                phone = payload[offset + 1:offset + 1 + length].decode("utf-8")
+                offset += 1 + length
+            full_name = payload[offset:].decode("utf-8")
+        except (struct.error, IndexError, UnicodeDecodeError):
+            raise InvalidLaunchToken("Malformed launch token")
+
+        return LaunchProfile(
+            telegram_user_id=telegram_user_id,
+            full_name=full_name or None,
+            phone=phone or None,
+            expires_at=expires_at
+        )
+
+
+def verify_init_data(init_data: str, bot_token: str, max_age: float = INIT_DATA_MAX_AGE) -> int:
+    """
+    Check Telegram Web App `initData` as described in the Bot API docs.
+
+    Args:
+        init_data: Telegram.WebApp.initData (query string with a `hash` field)
+        bot_token: Token of the bot that opened the Web App
+        max_age: Seconds after `auth_date` the data is accepted
+
+    Returns:
+        The launching user's Telegram ID
+
+    Raises:
+        InvalidLaunchToken: If the data is malformed, forged or too old
+    """
+    try:
+        fields = dict(urllib.parse.parse_qsl(init_data, strict_parsing=True))
+    except ValueError:
+        raise InvalidLaunchToken("Malformed init data")
+    received = fields.pop("hash", "")
+
+    check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode("utf-8"), hashlib.sha256).digest()
+    expected = hmac.new(secret, check_string.encode("utf-8"), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise InvalidLaunchToken("Invalid init data signature")
+
+    try:
+        auth_date = int(fields["auth_date"])
+        telegram_user_id = int(json.loads(fields["user"])["id"])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidLaunchToken("Malformed init data")
+    if auth_date + max_age < time.time():
+        raise InvalidLaunchToken("Init data expired")
+    return telegram_user_id
+
+
+def _secret() -> bytes:
+    if settings.launch_token_secret:
+        return settings.launch_token_secret.encode("utf-8")
+    # Derived so deployments without LAUNCH_TOKEN_SECRET still get a key only the bot knows
+    return hmac.new(settings.api_secret_key.encode("utf-8"), b"launch-token", hashlib.sha256).digest()
+
+
+# Shared issuer/verifier
+launch_tokens = LaunchTokens(_secret(), ttl=settings.launch_token_ttl, cache_size=settings.launch_token_cache_size)
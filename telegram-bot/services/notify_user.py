@@ -2,76 +2,18 @@
 """
 Service for sending notifications to users.
 """
+from typing import Optional
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from services.blocked_chats import blocked_chats
+from services.templates import render_status_message
 from utils.logger import logger
-from utils.id_formatter import format_order_id
-
-
-# Message templates in Uzbek with rich formatting
-MESSAGE_TEMPLATES = {
-    "confirmed": (
-        "✨ <b>Yangi buyurtma qabul qilindi!</b>\n\n"
-        "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
-        "🍔 <b>Mahsulot:</b> {product_name}\n"
-        "⏳ <b>Holat:</b> Tasdiqlandi\n\n"
-        "<i>Tez orada taomingizni tayyorlashni boshlaymiz!</i>"
-    ),
-    "ready": {
-        "delivery": (
-            "🍳 <b>Buyurtmangiz tayyor bo'ldi!</b>\n\n"
-            "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
-            "🍔 <b>Mahsulot:</b> {product_name}\n"
-            "🏃‍♂️ <b>Holat:</b> Dastavkaga berildi\n\n"
-            "<i>Dastavkachi hozir yo'lga chiqadi.</i>"
-        ),
-        "takeaway": (
-            "🍳 <b>Buyurtmangiz tayyor bo'ldi!</b>\n\n"
-            "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
-            "🍔 <b>Mahsulot:</b> {product_name}\n"
-            "🛍️ <b>Holat:</b> Tayyor\n\n"
-            "<i>Kelib olib ketishingiz mumkin!</i>"
-        ),
-        "preorder": (
-            "🍳 <b>Broningiz tayyor!</b>\n\n"
-            "🆔 <b>ID:</b> <code>{order_id}</code>\n"
-            "🍔 <b>Mahsulot:</b> {product_name}\n"
-            "📅 <b>Holat:</b> Stolingiz tayyor\n\n"
-            "<i>Sizni kutmoqdamiz!</i>"
-        )
-    },
-    "delivering": (
-        "🚚 <b>Buyurtmangiz yo'lda!</b>\n\n"
-        "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
-        "🍔 <b>Mahsulot:</b> {product_name}\n"
-        "📍 <b>Holat:</b> Yetkazilmoqda\n\n"
-        "<i>Iltimos, kuting, dastavkachi yaqin orada yetib boradi.</i>"
-    ),
-    "delivered": {
-        "delivery": (
-            "✅ <b>Tabriklaymiz! Buyurtma yetkazildi!</b>\n\n"
-            "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
-            "🍔 <b>Mahsulot:</b> {product_name}\n"
-            "🏁 <b>Holat:</b> Yakunlandi\n\n"
-            "<b>Yoqimli ishtaha! 🍽️</b>\n"
-            "<i>Bizni tanlaganingiz uchun rahmat!</i>"
-        ),
-        "takeaway": (
-            "✅ <b>Tabriklaymiz! Buyurtma olib ketildi!</b>\n\n"
-            "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
-            "🍔 <b>Mahsulot:</b> {product_name}\n"
-            "🏁 <b>Holat:</b> Yakunlandi\n\n"
-            "<b>Yoqimli ishtaha! 🍽️</b>\n"
-            "<i>Bizni tanlaganingiz uchun rahmat!</i>"
-        ),
-        "preorder": (
-            "✅ <b>Tabriklaymiz! Tashrifingiz yakunlandi!</b>\n\n"
-            "🆔 <b>ID:</b> <code>{order_id}</code>\n"
-            "🏁 <b>Holat:</b> Yakunlandi\n\n"
-            "<i>Tashrifingiz uchun rahmat! Yana kutib qolamiz! 🍽️</i>"
-        )
-    }
-}
 
 
 async def notify_user_order_status(
@@ -80,67 +22,98 @@ async def notify_user_order_status(
     order_id: str,
     status: str,
     product_name: str = "Savatcha",
-    order_type: str = "delivery"
+    order_type: str = "delivery",
+    message_id: Optional[int] = None,
+    locale: Optional[str] = None
 ) -> dict:
     """
     Send order status notification to the user.
+
+    If `message_id` is given, that earlier notification is edited in place
+    instead of sending a new message (used when coalescing quick updates).
+    `locale` selects the template language (uz, ru, en; Uzbek by default).
     """
-    if status not in MESSAGE_TEMPLATES:
-        logger.error(f"Invalid status: {status}")
+    message_text = render_status_message(status, order_id, product_name, order_type, locale)
+    if message_text is None:
+        logger.error("Invalid status: %s", status)
         return {
             "success": False,
             "message": f"Invalid status: {status}"
         }
-    
-    # Format order ID for display
-    display_id = format_order_id(order_id)
-    
-    # Get message template base
-    template = MESSAGE_TEMPLATES[status]
-    
-    # If template is a dictionary, pick based on order_type
-    if isinstance(template, dict):
-        # Default to 'delivery' if order_type is unknown, None or empty
-        current_type = order_type if order_type and order_type in template else "delivery"
-        text_template = template.get(current_type, template.get("delivery"))
-    else:
-        text_template = template
-        
-    # Get message template
-    message_text = text_template.format(
-        order_id=display_id,
-        product_name=product_name or "Taomlar"
-    )
+
+    if blocked_chats.is_blocked(telegram_user_id):
+        logger.info("Skipping notification for order %s: user %s blocked the bot", order_id, telegram_user_id)
+        return {
+            "success": False,
+            "message": "User blocked the bot"
+        }
     
     try:
-        await bot.send_message(
+        if message_id is not None:
+            edited = await _edit_notification(bot, telegram_user_id, message_id, message_text)
+            if edited:
+                logger.info(
+                    "Notification edited for user %s "
+                    "for order %s with status %s",
+                    telegram_user_id, order_id, status
+                )
+                return {
+                    "success": True,
+                    "message": "Notification edited successfully",
+                    "message_id": message_id
+                }
+
+        sent = await bot.send_message(
             chat_id=telegram_user_id,
             text=message_text,
             parse_mode="HTML"
         )
         
         logger.info(
-            f"Notification sent to user {telegram_user_id} "
-            f"for order {order_id} with status {status}"
+            "Notification sent to user %s "
+            "for order %s with status %s",
+            telegram_user_id, order_id, status
         )
         
         return {
             "success": True,
-            "message": "Notification sent successfully"
+            "message": "Notification sent successfully",
+            "message_id": sent.message_id
         }
         
     except TelegramForbiddenError:
         logger.warning(
-            f"User {telegram_user_id} blocked the bot"
+            "User %s blocked the bot", telegram_user_id
         )
+        blocked_chats.mark_blocked(telegram_user_id)
         return {
             "success": False,
             "message": "User blocked the bot"
         }
         
+    except TelegramRetryAfter as e:
+        logger.warning(
+            "Flood control hit sending to %s, retry in %ss", telegram_user_id, e.retry_after
+        )
+        return {
+            "success": False,
+            "message": "Flood control exceeded",
+            "retry_after": e.retry_after
+        }
+
+    except (TelegramNetworkError, TelegramServerError) as e:
+        logger.warning(
+            "Transient error sending notification to %s: %s", telegram_user_id, e
+        )
+        return {
+            "success": False,
+            "message": f"Transient error: {str(e)}",
+            "retryable": True
+        }
+
     except TelegramBadRequest as e:
         logger.error(
-            f"Bad request sending notification to {telegram_user_id}: {e}"
+            "Bad request sending notification to %s: %s", telegram_user_id, e
         )
         return {
             "success": False,
@@ -149,9 +122,26 @@ async def notify_user_order_status(
         
     except Exception as e:
         logger.error(
-            f"Error sending notification to {telegram_user_id}: {e}"
+            "Error sending notification to %s: %s", telegram_user_id, e
         )
         return {
             "success": False,
             "message": f"Error: {str(e)}"
         }
+
+
+async def _edit_notification(bot: Bot, chat_id: int, message_id: int, text: str) -> bool:
+    """Edit a previously sent notification; False if it can no longer be edited."""
+    try:
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=text,
+            parse_mode="HTML"
+        )
+        return True
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return True
+        logger.warning("Could not edit message %s in chat %s, sending new one: %s", message_id, chat_id, e)
+        return False
@@ -0,0 +1,457 @@
+"""
+Order status notifications from the Supabase Realtime change feed.
+
+Instead of relying on the website to call /api/order-update after every
+status change, the bot keeps one Realtime websocket subscribed to
+`public.orders` and queues a notification whenever an order's status moves
+to one users are told about. Missed calls from the website (closed tab,
+payment callbacks that flip pending_payment -> pending) no longer mean
+silent orders.
+
+The last notified status of every recent order is kept in memory and in
+local SQLite. It de-duplicates the feed against /api/order-update (whichever
+delivers a change first claims it; statuses only move forward, so a late
+copy of an earlier status is dropped too) and drives catch-up: after every
+(re)connect the orders created within ORDER_FEED_CATCHUP_WINDOW are read
+once and any status that changed while the feed was down is notified.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+from bot import supabase
+from config import settings
+from services.dispatcher import dispatcher, NotificationJob
+from services.order_history import order_history
+from services.order_status import DB_STATUS_TO_NOTIFY, STATUS_RANK
+from services.outbox import outbox
+from services.staff_feed import staff_feed
+from utils.logger import logger, log_context
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_status (
+    order_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_status_updated ON order_status (updated_at);
+CREATE TABLE IF NOT EXISTS feed_state (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+CATCHUP_COLUMNS = "id,telegram_user_id,phone_number,status,product_name,order_type,quantity,customer_name,created_at"
+CATCHUP_PAGE_SIZE = 500
+
+# Orders remembered for de-duplication
+RETENTION = 7 * 24 * 3600.0
+MAX_TRACKED_ORDERS = 100000
+
+# Phoenix channel heartbeat (Realtime closes sockets silent for 60s)
+HEARTBEAT_INTERVAL = 25.0
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+
+# Orders created this close before a catch-up may have been missed by it
+CLOCK_MARGIN = 60.0
+
+TOPIC = "realtime:public:orders"
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _is_newer(status: str, known: Optional[str]) -> bool:
+    return known is None or STATUS_RANK.get(status, 0) > STATUS_RANK.get(known, 0)
+
+
+class FeedError(Exception):
+    """The Realtime server rejected or closed the subscription."""
+
+
+class OrderFeed:
+    """
+    Realtime subscription to order changes feeding the notification dispatcher.
+
+    Args:
+        supabase_url: Supabase project URL
+        api_key: Supabase key the subscription is authorized with
+        db_path: SQLite file with the last notified status per order
+        catchup_window: Seconds of orders re-read after every (re)connect
+        enabled: False leaves notifications to /api/order-update alone
+    """
+
+    def __init__(self, supabase_url: str, api_key: str, db_path: str, catchup_window: float, enabled: bool = True):
+        self.enabled = enabled
+        self.db_path = db_path
+        self.catchup_window = catchup_window
+        self.api_key = api_key
+        base = supabase_url.rstrip("/").replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+        self.realtime_url = f"{base}/realtime/v1/websocket"
+        self._statuses: "OrderedDict[str, str]" = OrderedDict()
+        # Status each order had before its latest claim, for forget()
+        self._previous: Dict[str, Optional[str]] = {}
+        self._last_seen: Optional[float] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-feed")
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refs = itertools.count(1)
+        self._heartbeat_ref: Optional[str] = None
+        self._connected = False
+        self._counters = {
+            "connects": 0, "disconnects": 0, "changes": 0, "notified": 0,
+            "caught_up": 0, "duplicates": 0, "no_chat": 0
+        }
+
+    async def start(self):
+        """Load the known order statuses and start the subscription."""
+        if not self.enabled or self._task is not None:
+            return
+        self._statuses, self._last_seen = await self._run(self._open)
+        self._session = aiohttp.ClientSession()
+        self._task = asyncio.create_task(self._connect_loop(), name="order-feed")
+        logger.info("Order feed started (%s orders tracked)", len(self._statuses))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    def claim(self, order_id: str, status: str) -> bool:
+        """
+        Record that a status notification for an order is being sent.
+
+        Called for every update from the feed and from /api/order-update.
+        Each change reaches both, in any order, so a status is only claimed
+        if it is further along (STATUS_RANK) than every status claimed so far.
+
+        Returns:
+            False if this status, or a later one, was already notified for the order
+        """
+        if not self.enabled:
+            return True
+        known = self._statuses.get(order_id)
+        if not _is_newer(status, known):
+            self._counters["duplicates"] += 1
+            return False
+        self._previous[order_id] = known
+        self._remember(order_id, status)
+        return True
+
+    def forget(self, order_id: str, status: str):
+        """
+        Undo a claim whose notification could not be queued, so a later delivery is not a duplicate.
+
+        The order goes back to the status claimed before it, so statuses that
+        were already sent stay claimed. Nothing changes if a later status has
+        been claimed since.
+        """
+        if self._statuses.get(order_id) != status:
+            return
+        previous = self._previous.pop(order_id, None)
+        if previous is None:
+            self._statuses.pop(order_id, None)
+            if self._conn is not None:
+                asyncio.get_running_loop().run_in_executor(self._executor, self._delete_status, order_id)
+        else:
+            self._remember(order_id, previous)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "connected": self._connected,
+            "tracked_orders": len(self._statuses),
+            "last_seen": self._last_seen,
+            **self._counters,
+        }
+
+    def _remember(self, order_id: str, status: str):
+        self._statuses[order_id] = status
+        self._statuses.move_to_end(order_id)
+        while len(self._statuses) > MAX_TRACKED_ORDERS:
+            evicted, _ = self._statuses.popitem(last=False)
+            self._previous.pop(evicted, None)
+        if self._conn is not None:
+            asyncio.get_running_loop().run_in_executor(self._executor, self._write_status, order_id, status)
+
+    def _see(self, seen_at: float):
+        if self._last_seen is None or seen_at > self._last_seen:
+            self._last_seen = seen_at
+            if self._conn is not None:
+                asyncio.get_running_loop().run_in_executor(self._executor, self._write_last_seen, seen_at)
+
+    async def _connect_loop(self):
+        failures = 0
+        while True:
+            try:
+                async with self._session.ws_connect(
+                    self.realtime_url, params={"apikey": self.api_key, "vsn": "1.0.0"}, timeout=10
+                ) as ws:
+                    await self._subscribe(ws)
+                    failures = 0
+                    self._connected = True
+                    self._counters["connects"] += 1
+                    logger.info("Order feed subscribed to %s", TOPIC)
+                    await self._consume(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Order feed connection failed: %s", e)
+            finally:
+                if self._connected:
+                    self._counters["disconnects"] += 1
+                self._connected = False
+
+            failures += 1
+            delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** (failures - 1))
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    async def _subscribe(self, ws: aiohttp.ClientWebSocketResponse):
+        ref = str(next(self._refs))
+        await ws.send_json({
+            "topic": TOPIC,
+            "event": "phx_join",
+            "payload": {
+                "config": {
+                    "broadcast": {"self": False},
+                    "presence": {"key": ""},
+                    "postgres_changes": [{"event": "*", "schema": "public", "table": "orders"}],
+                },
+                "access_token": self.api_key,
+            },
+            "ref": ref,
+            "join_ref": ref,
+        })
+        while True:
+            message = json.loads(await ws.receive_str(timeout=10))
+            if message.get("event") == "phx_reply" and message.get("ref") == ref:
+                payload = message.get("payload") or {}
+                if payload.get("status") != "ok":
+                    raise FeedError(f"Join rejected: {payload.get('response')}")
+                return
+
+    async def _consume(self, ws: aiohttp.ClientWebSocketResponse):
+        heartbeat = asyncio.create_task(self._heartbeat(ws), name="order-feed-heartbeat")
+        try:
+            # Changes committed while disconnected; new ones queue up on the socket meanwhile
+            try:
+                await self._catch_up()
+            except Exception as e:
+                logger.warning("Order feed catch-up failed, streaming without it: %s", e)
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                message = json.loads(msg.data)
+                event = message.get("event")
+                if event == "postgres_changes":
+                    await self._on_change(message["payload"]["data"])
+                elif event == "phx_reply" and message.get("topic") == "phoenix":
+                    self._heartbeat_ref = None
+                elif event in ("phx_error", "phx_close"):
+                    raise FeedError(f"Channel closed by server ({event})")
+                elif event == "system" and (message.get("payload") or {}).get("status") == "error":
+                    raise FeedError(f"Subscription error: {message['payload'].get('message')}")
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+    async def _heartbeat(self, ws: aiohttp.ClientWebSocketResponse):
+        self._heartbeat_ref = None
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if self._heartbeat_ref is not None:
+                logger.warning("Order feed heartbeat timed out, reconnecting")
+                await ws.close()
+                return
+            self._heartbeat_ref = str(next(self._refs))
+            await ws.send_json({"topic": "phoenix", "event": "heartbeat", "payload": {}, "ref": self._heartbeat_ref})
+
+    async def _on_change(self, data: dict):
+        self._counters["changes"] += 1
+        record = data.get("record") or {}
+        if data.get("type") not in ("INSERT", "UPDATE") or not record.get("id"):
+            return
+        staff_feed.apply_record(record)
+        old_status = (data.get("old_record") or {}).get("status")
+        if old_status is not None and old_status == record.get("status"):
+            # Another column changed (old_record carries status with REPLICA IDENTITY FULL)
+            return
+        committed_at = _timestamp(data.get("commit_timestamp"))
+        await self._apply(record, "realtime")
+        if committed_at is not None:
+            self._see(committed_at)
+
+    async def _catch_up(self):
+        started = time.time()
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.catchup_window)
+        # Orders we have never seen are new only if created after the feed last saw anything
+        new_after = self._last_seen - CLOCK_MARGIN if self._last_seen is not None else None
+        notified = 0
+        offset = 0
+        while True:
+            response = await (
+                supabase.table("orders")
+                .select(CATCHUP_COLUMNS)
+                .gte("created_at", since.isoformat())
+                .order("created_at")
+                .range(offset, offset + CATCHUP_PAGE_SIZE - 1)
+                .execute()
+            )
+            rows = response.data or []
+            for row in rows:
+                staff_feed.apply_record(row)
+                order_id = row.get("id")
+                status = DB_STATUS_TO_NOTIFY.get(row.get("status"))
+                if not order_id or status is None:
+                    continue
+                known = self._statuses.get(order_id)
+                if not _is_newer(status, known):
+                    continue
+                if known is None:
+                    created_at = _timestamp(row.get("created_at"))
+                    if new_after is None or created_at is None or created_at <= new_after:
+                        # Baseline: notified (or not) before this replica tracked it
+                        self._remember(order_id, status)
+                        continue
+                if await self._apply(row, "catchup"):
+                    notified += 1
+            if len(rows) < CATCHUP_PAGE_SIZE:
+                break
+            offset += CATCHUP_PAGE_SIZE
+
+        self._counters["caught_up"] += notified
+        self._see(started)
+        if notified:
+            logger.info("Order feed catch-up queued %s missed notifications", notified)
+
+    async def _apply(self, record: dict, source: str) -> bool:
+        """Queue a notification for the record's status unless it was already sent."""
+        order_id = record["id"]
+        status = DB_STATUS_TO_NOTIFY.get(record.get("status"))
+        if status is None or not self.claim(order_id, status):
+            return False
+
+        with log_context(order_id=order_id):
+            telegram_user_id = record.get("telegram_user_id") or await self._chat_for_phone(record.get("phone_number"))
+            if not telegram_user_id:
+                self._counters["no_chat"] += 1
+                return False
+
+            job = NotificationJob(
+                telegram_user_id=int(telegram_user_id),
+                order_id=order_id,
+                status=status,
+                product_name=record.get("product_name"),
+                order_type=record.get("order_type")
+            )
+            order_history.invalidate(job.telegram_user_id)
+            try:
+                job.outbox_id = await outbox.append(job.to_payload())
+                job.job_id = str(job.outbox_id)
+                dispatcher.submit(job)
+            except asyncio.QueueFull:
+                outbox.mark_failed(job.outbox_id)
+                self.forget(order_id, status)
+                logger.error("Notification queue full, dropping %s update for order %s", source, order_id)
+                return False
+            except Exception as e:
+                self.forget(order_id, status)
+                logger.error("Failed to queue %s update for order %s: %s", source, order_id, e)
+                return False
+
+        self._counters["notified"] += 1
+        logger.info("Order %s is %s (%s), notification queued", order_id, status, source)
+        return True
+
+    async def _chat_for_phone(self, phone: Optional[str]) -> Optional[int]:
+        """Orders placed outside Telegram only carry a phone number; find its profile."""
+        if not phone:
+            return None
+        try:
+            response = await (
+                supabase.table("profiles").select("telegram_id").eq("phone", phone).limit(1).execute()
+            )
+        except Exception as e:
+            logger.warning("Profile lookup by phone failed: %s", e)
+            return None
+        return response.data[0].get("telegram_id") if response.data else None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> Tuple["OrderedDict[str, str]", Optional[float]]:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.execute("DELETE FROM order_status WHERE updated_at < ?", (time.time() - RETENTION,))
+        self._conn = conn
+        statuses = OrderedDict(conn.execute(
+            "SELECT order_id, status FROM order_status ORDER BY updated_at DESC LIMIT ?", (MAX_TRACKED_ORDERS,)
+        ).fetchall()[::-1])
+        row = conn.execute("SELECT value FROM feed_state WHERE key = 'last_seen'").fetchone()
+        return statuses, row[0] if row else None
+
+    def _write_status(self, order_id: str, status: str):
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO order_status (order_id, status, updated_at) VALUES (?, ?, ?)",
+                    (order_id, status, time.time())
+                )
+        except Exception as e:
+            logger.error("Failed to persist status of order %s: %s", order_id, e)
+
+    def _delete_status(self, order_id: str):
+        try:
+            with self._conn:
+                self._conn.execute("DELETE FROM order_status WHERE order_id = ?", (order_id,))
+        except Exception as e:
+            logger.error("Failed to forget status of order %s: %s", order_id, e)
+
+    def _write_last_seen(self, seen_at: float):
+        try:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO feed_state (key, value) VALUES ('last_seen', ?)", (seen_at,))
+        except Exception as e:
+            logger.error("Failed to persist order feed position: %s", e)
+
+
+# Shared feed; /api/order-update claims through it too
+order_feed = OrderFeed(
+    settings.supabase_url,
+    settings.supabase_key,
+    settings.order_feed_db_path,
+    catchup_window=settings.order_feed_catchup_window,
+    enabled=settings.order_feed_enabled
+)
@@ -0,0 +1,216 @@
+"""
+Paginated order history for the "Mening buyurtmalarim" button.
+
+Orders are read newest first with keyset pagination on (created_at, id),
+selecting only the columns the page shows. Rendered pages are cached per
+user, so paging back and forth does not query Supabase again; the cache is
+dropped for a user whenever an order update for them arrives.
+"""
+import html
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from bot import supabase
+from config import settings
+from utils.logger import logger
+
+
+# Only what a page renders
+COLUMNS = "id,product_name,quantity,total_price,status,created_at"
+
+DIRECTION_OLDER = "older"
+DIRECTION_NEWER = "newer"
+
+STATUS_LABELS = {
+    "pending_payment": "💳 To'lov kutilmoqda",
+    "pending": "⏳ Qabul qilindi",
+    "confirmed": "🍳 Tayyorlanmoqda",
+    "ready": "🥡 Tayyor",
+    "delivering": "🚚 Yo'lda",
+    "on_way": "🚚 Yo'lda",
+    "delivered": "✅ Yetkazildi",
+    "cancelled": "❌ Bekor qilindi"
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """Position of an order in (created_at, id) order; created_at in epoch microseconds."""
+    created_at: int
+    order_id: str
+
+    @classmethod
+    def from_order(cls, order: dict) -> "Cursor":
+        created = datetime.fromisoformat(order["created_at"].replace("Z", "+00:00"))
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        return cls(created_at=(created - _EPOCH) // timedelta(microseconds=1), order_id=order["id"])
+
+    def timestamp(self) -> str:
+        return (_EPOCH + timedelta(microseconds=self.created_at)).isoformat()
+
+
+@dataclass
+class OrderPage:
+    """Rendered page plus the cursors for the neighbouring pages."""
+    text: str
+    newer: Optional[Cursor] = None
+    older: Optional[Cursor] = None
+
+
+PageKey = Tuple[str, Optional[Cursor]]
+
+
+class OrderHistory:
+    """
+    Keyset-paginated order history with a per-user page cache.
+
+    Args:
+        page_size: Orders per page
+        max_users: Users whose pages are kept (least recently used are dropped)
+        ttl: Seconds a user's cached pages stay valid
+    """
+
+    def __init__(self, page_size: int, max_users: int, ttl: float):
+        self.page_size = page_size
+        self.max_users = max_users
+        self.ttl = ttl
+        # telegram_id -> (expires_at, pages)
+        self._users: "OrderedDict[int, Tuple[float, Dict[PageKey, OrderPage]]]" = OrderedDict()
+        # Bumped on invalidation so a fetch that raced with it is not cached
+        self._generations: Dict[int, int] = {}
+        self._counters = {"hits": 0, "misses": 0}
+
+    async def get_page(
+        self,
+        telegram_id: int,
+        direction: Optional[str] = None,
+        cursor: Optional[Cursor] = None
+    ) -> Optional[OrderPage]:
+        """
+        Return a page of the user's orders, or None if they have none.
+
+        Args:
+            telegram_id: User's Telegram ID
+            direction: DIRECTION_OLDER / DIRECTION_NEWER relative to `cursor`,
+                or None for the newest page
+            cursor: Last (older) or first (newer) order of the current page
+
+        Raises:
+            Exception: Whatever the Supabase query raised (errors are not cached)
+        """
+        key: PageKey = (direction, cursor) if cursor else (None, None)
+
+        entry = self._users.get(telegram_id)
+        if entry is not None:
+            expires_at, pages = entry
+            if expires_at > time.monotonic():
+                page = pages.get(key)
+                if page is not None:
+                    self._users.move_to_end(telegram_id)
+                    self._counters["hits"] += 1
+                    return page
+            else:
+                del self._users[telegram_id]
+
+        self._counters["misses"] += 1
+        generation = self._generations.get(telegram_id, 0)
+        page = await self._fetch(telegram_id, *key)
+        if page is not None and self._generations.get(telegram_id, 0) == generation:
+            self._store(telegram_id, key, page)
+        return page
+
+    def invalidate(self, telegram_id: int):
+        """Drop a user's cached pages (an order of theirs changed)."""
+        self._users.pop(telegram_id, None)
+        self._generations[telegram_id] = self._generations.get(telegram_id, 0) + 1
+        if len(self._generations) > self.max_users:
+            # Counters only matter while a fetch is running; old ones can go
+            self._generations.clear()
+
+    def stats(self) -> dict:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "users": len(self._users),
+            "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+            **self._counters,
+        }
+
+    def _store(self, telegram_id: int, key: PageKey, page: OrderPage):
+        entry = self._users.get(telegram_id)
+        if entry is None or entry[0] <= time.monotonic():
+            entry = (time.monotonic() + self.ttl, {})
+            self._users[telegram_id] = entry
+        entry[1][key] = page
+        self._users.move_to_end(telegram_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    async def _fetch(self, telegram_id: int, direction: Optional[str], cursor: Optional[Cursor]) -> Optional[OrderPage]:
+        logger.info("Order history cache miss for %s (%s)", telegram_id, direction or 'newest')
+        newer = direction == DIRECTION_NEWER
+
+        query = supabase.table("orders").select(COLUMNS).eq("telegram_user_id", telegram_id)
+        if cursor:
+            op = "gt" if newer else "lt"
+            ts = cursor.timestamp()
+            query = query.or_(
+                f'created_at.{op}."{ts}",and(created_at.eq."{ts}",id.{op}.{cursor.order_id})'
+            )
+        # One extra row tells whether another page exists in that direction
+        response = await (
+            query.order("created_at", desc=not newer)
+            .order("id", desc=not newer)
+            .limit(self.page_size + 1)
+            .execute()
+        )
+
+        rows = response.data or []
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if newer:
+            rows.reverse()
+        if not rows:
+            return None
+
+        if newer:
+            # Reached from an older page, so there is always one to go back to
+            has_newer, has_older = has_more, True
+        else:
+            has_newer, has_older = cursor is not None, has_more
+
+        return OrderPage(
+            text=render_orders(rows),
+            newer=Cursor.from_order(rows[0]) if has_newer else None,
+            older=Cursor.from_order(rows[-1]) if has_older else None
+        )
+
+
+def render_orders(orders: list) -> str:
+    """Format a page of orders as an HTML message."""
+    parts = ["📝 <b>Buyurtmalaringiz:</b>\n\n"]
+    for order in orders:
+        status = STATUS_LABELS.get(order.get("status"), order.get("status"))
+        price = f"{order.get('total_price'):,}".replace(",", " ") if order.get("total_price") else "0"
+        parts.append(
+            f"🆔 <b>Buyurtma #{order.get('id')[:6]}</b>\n"
+            f"🍟 Mahsulot: {html.escape(str(order.get('product_name')))} (x{order.get('quantity')})\n"
+            f"💰 Narxi: {price} so'm\n"
+            f"📊 Holati: {status}\n"
+            f"📅 Sana: {order.get('created_at')[:16].replace('T', ' ')}\n"
+            f"------------------\n\n"
+        )
+    return "".join(parts)
+
+
+# Shared order history instance used by handlers and the order-update webhook
+order_history = OrderHistory(
+    page_size=settings.order_history_page_size,
+    max_users=settings.order_history_cache_size,
+    ttl=settings.order_history_cache_ttl
+)
@@ -0,0 +1,105 @@
+"""
+Order statuses: database -> notification mapping, and the transitions
+triggered by payment callbacks.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from bot import supabase
+from utils.logger import logger
+
+
+# Order statuses in the database -> notification statuses (others are not notified)
+DB_STATUS_TO_NOTIFY = {
+    "pending": "confirmed",
+    "ready": "ready",
+    "on_way": "delivering",
+    "delivered": "delivered",
+}
+
+# Notification statuses in the order an order moves through them; an order never moves back,
+# so a status ranked at or below one already sent is a stale or repeated update
+STATUS_RANK = {"confirmed": 1, "ready": 2, "delivering": 3, "delivered": 4}
+
+# How long a successful transition is remembered and how many are kept
+SETTLED_TTL = 600.0
+SETTLED_MAX_SIZE = 10000
+
+# (order_id, status) -> running transition / expiry of a successful one
+_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+_settled: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+
+async def transition_order_status(order_id: str, status: str) -> bool:
+    """
+    Move an order out of pending_payment in a single conditional write.
+
+    Concurrent calls for the same transition share one database request.
+    A successful transition is remembered for SETTLED_TTL, so Click/Payme
+    retries skip the database; unsuccessful ones are re-checked every time.
+
+    Args:
+        order_id: Order ID
+        status: Status to set if the order is still pending_payment
+
+    Returns:
+        True if the order was in pending_payment and has been updated
+
+    Raises:
+        Exception: If the database request failed (failures are not remembered)
+    """
+    key = (order_id, status)
+
+    expires_at = _settled.get(key)
+    if expires_at is not None:
+        if expires_at > time.monotonic():
+            logger.info("Order %s transition to %s already settled, skipping DB", order_id, status)
+            return True
+        del _settled[key]
+
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await _transition(order_id, status)
+        # Only successes: a missing row may be created later, and must then be paid normally
+        if result:
+            _remember(key)
+        future.set_result(result)
+        return result
+    except Exception as e:
+        # Errors are not remembered, so a later retry hits the database again
+        future.set_exception(e)
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+async def _transition(order_id: str, status: str) -> bool:
+    # "update ... where id = X and status = 'pending_payment' returning *"
+    response = await (
+        supabase.table("orders")
+        .update({"status": status})
+        .eq("id", order_id)
+        .eq("status", "pending_payment")
+        .execute()
+    )
+    if response.data:
+        logger.info("✅ Order %s status updated to %s via payment callback", order_id, status)
+        return True
+
+    logger.info("Order %s not in pending_payment (already processed or not found)", order_id)
+    return False
+
+
+def _remember(key: Tuple[str, str]):
+    _settled[key] = time.monotonic() + SETTLED_TTL
+    _settled.move_to_end(key)
+    while len(_settled) > SETTLED_MAX_SIZE:
+        _settled.popitem(last=False)
@@ -0,0 +1,232 @@
+"""
+Crash-safe outbox for order notifications backed by local SQLite.
+
+Accepted updates are written here before they are queued, marked done once
+delivered and replayed on startup. Writes are group-committed: every append
+and status change issued within a short window shares one transaction.
+If a commit fails, waiting appends fail with the error and status changes
+are put back and retried with backoff.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from config import settings
+from utils.logger import logger
+
+
+# Max operations per group commit and how long the writer waits to fill a batch
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.005
+
+# Delay before retrying a failed group commit, doubled per consecutive failure
+RETRY_BACKOFF = 0.1
+RETRY_BACKOFF_MAX = 5.0
+
+# Delivered rows older than this are purged on startup
+DONE_RETENTION = 24 * 3600
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, id);
+"""
+
+
+class NotificationOutbox:
+    """
+    Durable queue of notification payloads.
+
+    All SQLite access happens on one dedicated thread so the event loop never
+    blocks on disk and the connection is never shared between threads.
+
+    Args:
+        path: Path of the SQLite database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._appends: List[Tuple[str, asyncio.Future]] = []
+        self._updates: List[Tuple[str, int]] = []
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._closing = False
+        self._start_lock = asyncio.Lock()
+        self._replay_upto = 0
+        self._counters = {"appended": 0, "commits": 0}
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.execute(
+            "DELETE FROM outbox WHERE status != ? AND updated_at < ?",
+            (STATUS_PENDING, time.time() - DONE_RETENTION)
+        )
+        conn.commit()
+        # Rows appended after this point are queued by their own request, not replayed
+        self._replay_upto = conn.execute("SELECT COALESCE(MAX(id), 0) FROM outbox").fetchone()[0]
+        self._conn = conn
+
+    async def start(self):
+        """Open the database and start the group-commit writer."""
+        async with self._start_lock:
+            if self._writer:
+                return
+            await self._run(self._open)
+            self._writer = asyncio.create_task(self._write_loop(), name="outbox-writer")
+            logger.info("Notification outbox opened at %s", self.path)
+
+    async def stop(self):
+        """Flush outstanding writes and close the database."""
+        if not self._writer:
+            return
+        # The writer drains everything still buffered before it exits
+        self._closing = True
+        self._wakeup.set()
+        await self._writer
+        self._writer = None
+        self._closing = False
+        await self._run(self._conn.close)
+        self._conn = None
+        logger.info("Notification outbox closed")
+
+    async def append(self, payload: dict) -> int:
+        """
+        Persist a payload and return its outbox id.
+
+        Returns only after the transaction containing the row is committed.
+        """
+        return (await self.append_many([payload]))[0]
+
+    async def append_many(self, payloads: List[dict]) -> List[int]:
+        """Persist several payloads in the same group commit."""
+        if not self._writer:
+            # Webhook requests may arrive before the bot's startup hook has run
+            await self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for payload in payloads:
+            future = loop.create_future()
+            self._appends.append((json.dumps(payload), future))
+            futures.append(future)
+        self._wakeup.set()
+        return list(await asyncio.gather(*futures))
+
+    def mark_done(self, outbox_id: int):
+        """Record successful delivery (committed with the next batch)."""
+        self._updates.append((STATUS_DONE, outbox_id))
+        self._wakeup.set()
+
+    def mark_failed(self, outbox_id: int):
+        """Record a permanent failure so the row is not replayed."""
+        self._updates.append((STATUS_FAILED, outbox_id))
+        self._wakeup.set()
+
+    async def load_pending(self) -> List[Tuple[int, dict]]:
+        """Return (id, payload) for every row left undelivered by the previous run."""
+        rows = await self._run(self._select_pending)
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def _select_pending(self):
+        return self._conn.execute(
+            "SELECT id, payload FROM outbox WHERE status = ? AND id <= ? ORDER BY id",
+            (STATUS_PENDING, self._replay_upto)
+        ).fetchall()
+
+    def stats(self) -> dict:
+        return {
+            "pending_writes": len(self._appends) + len(self._updates),
+            **self._counters,
+        }
+
+    async def _write_loop(self):
+        backoff = RETRY_BACKOFF
+        while True:
+            await self._wakeup.wait()
+            # Let concurrent writers join this batch unless it is already full
+            if not self._closing and len(self._appends) + len(self._updates) < BATCH_SIZE:
+                await asyncio.sleep(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                await self._flush()
+                backoff = RETRY_BACKOFF
+            except Exception as e:
+                logger.error("Outbox commit failed, retrying in %.1fs: %s", backoff, e)
+                if self._closing:
+                    if self._updates:
+                        logger.error("Outbox closed with %s status changes not written", len(self._updates))
+                    return
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
+                self._wakeup.set()
+            if self._closing and not self._appends and not self._updates:
+                return
+
+    async def _flush(self):
+        appends, self._appends = self._appends[:BATCH_SIZE], self._appends[BATCH_SIZE:]
+        updates, self._updates = self._updates[:BATCH_SIZE], self._updates[BATCH_SIZE:]
+        if self._appends or self._updates:
+            self._wakeup.set()
+        if not appends and not updates:
+            return
+
+        try:
+            ids = await self._run(self._commit, [payload for payload, _ in appends], updates)
+        except Exception as e:
+            # Appenders are still waiting and get the error (their caller answers 503 and
+            # is retried); status changes have no one waiting, so they go back in front
+            for _, future in appends:
+                if not future.done():
+                    future.set_exception(e)
+            self._updates = updates + self._updates
+            raise
+
+        for (_, future), row_id in zip(appends, ids):
+            if not future.done():
+                future.set_result(row_id)
+        self._counters["appended"] += len(appends)
+        self._counters["commits"] += 1
+
+    def _commit(self, payloads: List[str], updates: List[Tuple[str, int]]) -> List[int]:
+        now = time.time()
+        ids = []
+        with self._conn:
+            for payload in payloads:
+                cursor = self._conn.execute(
+                    "INSERT INTO outbox (payload, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (payload, STATUS_PENDING, now, now)
+                )
+                ids.append(cursor.lastrowid)
+            if updates:
+                self._conn.executemany(
+                    "UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?",
+                    [(status, now, row_id) for status, row_id in updates]
+                )
+        return ids
+
+
+# Shared outbox instance
+outbox = NotificationOutbox(settings.outbox_db_path)
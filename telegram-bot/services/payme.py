@@ -0,0 +1,455 @@
+"""
+Payme Merchant API engine (JSON-RPC 2.0).
+
+Implements CheckPerformTransaction, CreateTransaction, PerformTransaction,
+CancelTransaction, CheckTransaction and GetStatement on top of a local
+SQLite transaction table. Transactions are indexed by Payme id and by Payme
+time, so GetStatement over a date range is an index range scan.
+Documentation: https://developer.help.paycom.uz/metody-merchant-api
+"""
+import asyncio
+import base64
+import hmac
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from bot import supabase
+from config import settings
+from services.order_status import transition_order_status
+from utils.logger import logger
+
+
+# A created transaction expires if not performed within 12 hours
+TRANSACTION_TIMEOUT_MS = 12 * 3600 * 1000
+
+STATE_CREATED = 1
+STATE_PERFORMED = 2
+STATE_CANCELLED = -1
+STATE_CANCELLED_AFTER_PERFORM = -2
+
+# Cancel reason used when a transaction times out
+REASON_TIMEOUT = 4
+
+# Order statuses after which a performed payment can no longer be cancelled
+FINAL_ORDER_STATUSES = {"delivered"}
+
+# JSON-RPC / Payme error codes
+ERROR_INVALID_AMOUNT = -31001
+ERROR_TRANSACTION_NOT_FOUND = -31003
+ERROR_CANNOT_CANCEL = -31007
+ERROR_CANNOT_PERFORM = -31008
+ERROR_INVALID_ACCOUNT = -31050
+ERROR_INSUFFICIENT_PRIVILEGE = -32504
+ERROR_METHOD_NOT_FOUND = -32601
+ERROR_INVALID_PARAMS = -32600
+ERROR_SYSTEM = -32400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS payme_transactions (
+    id TEXT PRIMARY KEY,
+    time INTEGER NOT NULL,
+    amount INTEGER NOT NULL,
+    order_id TEXT NOT NULL,
+    create_time INTEGER NOT NULL,
+    perform_time INTEGER NOT NULL DEFAULT 0,
+    cancel_time INTEGER NOT NULL DEFAULT 0,
+    state INTEGER NOT NULL,
+    reason INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_payme_time ON payme_transactions (time);
+CREATE INDEX IF NOT EXISTS idx_payme_order ON payme_transactions (order_id, state);
+"""
+
+COLUMNS = "id, time, amount, order_id, create_time, perform_time, cancel_time, state, reason"
+
+
+class PaymeError(Exception):
+    """Error returned to Payme as a JSON-RPC error object."""
+
+    def __init__(self, code: int, message: str, data: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    def to_dict(self) -> dict:
+        error = {
+            "code": self.code,
+            "message": {"uz": self.message, "ru": self.message, "en": self.message}
+        }
+        if self.data:
+            error["data"] = self.data
+        return error
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class PaymeTransactionStore:
+    """
+    SQLite table of Payme transactions, accessed from one dedicated thread.
+
+    Args:
+        path: Path of the SQLite database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="payme")
+        self._start_lock = asyncio.Lock()
+
+    async def _run(self, fn, *args):
+        if self._conn is None:
+            await self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def start(self):
+        async with self._start_lock:
+            if self._conn is not None:
+                return
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+            logger.info("Payme transaction store opened at %s", self.path)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+
+    async def get(self, transaction_id: str) -> Optional[dict]:
+        return await self._run(self._get, transaction_id)
+
+    def _get(self, transaction_id: str) -> Optional[dict]:
+        row = self._conn.execute(
+            f"SELECT {COLUMNS} FROM payme_transactions WHERE id = ?", (transaction_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    async def active_for_order(self, order_id: str) -> Optional[dict]:
+        """Created or performed transaction for an order, if any."""
+        return await self._run(self._active_for_order, order_id)
+
+    def _active_for_order(self, order_id: str) -> Optional[dict]:
+        row = self._conn.execute(
+            f"SELECT {COLUMNS} FROM payme_transactions WHERE order_id = ? AND state IN (?, ?)",
+            (order_id, STATE_CREATED, STATE_PERFORMED)
+        ).fetchone()
+        return dict(row) if row else None
+
+    async def insert(self, transaction: dict):
+        await self._run(self._insert, transaction)
+
+    def _insert(self, transaction: dict):
+        with self._conn:
+            self._conn.execute(
+                f"INSERT INTO payme_transactions ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                tuple(transaction[column.strip()] for column in COLUMNS.split(","))
+            )
+
+    async def update(self, transaction_id: str, **fields):
+        await self._run(self._update, transaction_id, fields)
+
+    def _update(self, transaction_id: str, fields: dict):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._conn:
+            self._conn.execute(
+                f"UPDATE payme_transactions SET {assignments} WHERE id = ?",
+                (*fields.values(), transaction_id)
+            )
+
+    async def between(self, start: int, end: int) -> List[dict]:
+        """Transactions whose Payme time falls in [start, end] (uses idx_payme_time)."""
+        return await self._run(self._between, start, end)
+
+    def _between(self, start: int, end: int) -> List[dict]:
+        rows = self._conn.execute(
+            f"SELECT {COLUMNS} FROM payme_transactions WHERE time BETWEEN ? AND ? ORDER BY time",
+            (start, end)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def stop(self):
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+
+
+class PaymeMerchant:
+    """
+    Payme merchant API method dispatcher.
+
+    Args:
+        store: Transaction state table
+        merchant_key: Key issued by Payme for Basic authentication
+    """
+
+    def __init__(self, store: PaymeTransactionStore, merchant_key: Optional[str]):
+        self.store = store
+        self.merchant_key = merchant_key
+        self._locks: Dict[str, list] = {}
+        self._methods = {
+            "CheckPerformTransaction": self.check_perform_transaction,
+            "CreateTransaction": self.create_transaction,
+            "PerformTransaction": self.perform_transaction,
+            "CancelTransaction": self.cancel_transaction,
+            "CheckTransaction": self.check_transaction,
+            "GetStatement": self.get_statement,
+        }
+
+    def is_authorized(self, authorization: Optional[str]) -> bool:
+        """Check the `Authorization: Basic base64(Paycom:<key>)` header."""
+        if not self.merchant_key or not authorization or not authorization.startswith("Basic "):
+            return False
+        try:
+            credentials = base64.b64decode(authorization[6:]).decode()
+        except Exception:
+            return False
+        _, _, key = credentials.partition(":")
+        return hmac.compare_digest(key, self.merchant_key)
+
+    async def handle(self, method: str, params: dict) -> dict:
+        """
+        Run a merchant API method.
+
+        Returns:
+            The JSON-RPC `result` object
+
+        Raises:
+            PaymeError: For any protocol-level error; unexpected failures are
+                reported as a system error so Payme retries later
+        """
+        handler = self._methods.get(method)
+        if handler is None:
+            raise PaymeError(ERROR_METHOD_NOT_FOUND, f"Method not found: {method}")
+
+        transaction_id = params.get("id")
+        if transaction_id is None:
+            return await self._call(handler, params)
+
+        # Serialize state changes for one transaction ([lock, users] pairs)
+        entry = self._locks.setdefault(transaction_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._call(handler, params)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[transaction_id]
+
+    @staticmethod
+    async def _call(handler, params: dict) -> dict:
+        try:
+            return await handler(params)
+        except PaymeError:
+            raise
+        except Exception as e:
+            logger.error("❌ Payme handler failed: %s", e)
+            raise PaymeError(ERROR_SYSTEM, "System error")
+
+    async def _validate_order(self, params: dict) -> str:
+        account = params.get("account") or {}
+        order_id = account.get("order_id")
+        amount = params.get("amount")
+        if not order_id:
+            raise PaymeError(ERROR_INVALID_ACCOUNT, "Order ID is missing", "order_id")
+        if not isinstance(amount, int):
+            raise PaymeError(ERROR_INVALID_AMOUNT, "Invalid amount")
+
+        try:
+            response = await (
+                supabase.table("orders")
+                .select("id,status,total_price")
+                .eq("id", order_id)
+                .limit(1)
+                .execute()
+            )
+        except Exception as e:
+            # Not the order's fault: Payme must not be told it does not exist
+            logger.error("Payme: order lookup failed for %s: %s", order_id, e)
+            raise PaymeError(ERROR_SYSTEM, "System error")
+
+        if not response.data:
+            raise PaymeError(ERROR_INVALID_ACCOUNT, "Order not found", "order_id")
+        order = response.data[0]
+        if order.get("status") != "pending_payment":
+            raise PaymeError(ERROR_INVALID_ACCOUNT, "Order is not awaiting payment", "order_id")
+        # Payme amounts are in tiyin (1 so'm = 100 tiyin)
+        if round((order.get("total_price") or 0) * 100) != amount:
+            raise PaymeError(ERROR_INVALID_AMOUNT, "Invalid amount")
+        return order_id
+
+    async def check_perform_transaction(self, params: dict) -> dict:
+        await self._validate_order(params)
+        return {"allow": True}
+
+    async def create_transaction(self, params: dict) -> dict:
+        transaction_id = params.get("id")
+        if not transaction_id or not isinstance(params.get("time"), int):
+            raise PaymeError(ERROR_INVALID_PARAMS, "Invalid params")
+
+        existing = await self.store.get(transaction_id)
+        if existing:
+            if existing["state"] != STATE_CREATED:
+                raise PaymeError(ERROR_CANNOT_PERFORM, "Transaction is not active")
+            if await self._expire_if_timed_out(existing):
+                raise PaymeError(ERROR_CANNOT_PERFORM, "Transaction timed out")
+            return self._create_result(existing)
+
+        order_id = await self._validate_order(params)
+        active = await self.store.active_for_order(order_id)
+        if active:
+            raise PaymeError(ERROR_INVALID_ACCOUNT, "Order already has a pending transaction", "order_id")
+
+        transaction = {
+            "id": transaction_id,
+            "time": params["time"],
+            "amount": params["amount"],
+            "order_id": order_id,
+            "create_time": _now_ms(),
+            "perform_time": 0,
+            "cancel_time": 0,
+            "state": STATE_CREATED,
+            "reason": None,
+        }
+        await self.store.insert(transaction)
+        logger.info("💳 Payme transaction %s created for order %s", transaction_id, order_id)
+        return self._create_result(transaction)
+
+    async def perform_transaction(self, params: dict) -> dict:
+        transaction = await self._get_transaction(params)
+
+        if transaction["state"] == STATE_CREATED:
+            if await self._expire_if_timed_out(transaction):
+                raise PaymeError(ERROR_CANNOT_PERFORM, "Transaction timed out")
+
+            if not await transition_order_status(transaction["order_id"], "pending"):
+                raise PaymeError(ERROR_CANNOT_PERFORM, "Order can not be paid")
+
+            perform_time = _now_ms()
+            await self.store.update(transaction["id"], state=STATE_PERFORMED, perform_time=perform_time)
+            transaction.update(state=STATE_PERFORMED, perform_time=perform_time)
+            logger.info("💳 Payme transaction %s performed for order %s", transaction['id'], transaction['order_id'])
+
+        if transaction["state"] != STATE_PERFORMED:
+            raise PaymeError(ERROR_CANNOT_PERFORM, "Transaction is cancelled")
+
+        return {
+            "transaction": transaction["id"],
+            "perform_time": transaction["perform_time"],
+            "state": transaction["state"],
+        }
+
+    async def cancel_transaction(self, params: dict) -> dict:
+        transaction = await self._get_transaction(params)
+        reason = params.get("reason")
+
+        if transaction["state"] == STATE_CREATED:
+            new_state = STATE_CANCELLED
+            await transition_order_status(transaction["order_id"], "cancelled")
+        elif transaction["state"] == STATE_PERFORMED:
+            new_state = STATE_CANCELLED_AFTER_PERFORM
+            await self._cancel_paid_order(transaction["order_id"])
+        else:
+            # Already cancelled: report the stored state
+            new_state = None
+
+        if new_state is not None:
+            cancel_time = _now_ms()
+            await self.store.update(transaction["id"], state=new_state, cancel_time=cancel_time, reason=reason)
+            transaction.update(state=new_state, cancel_time=cancel_time, reason=reason)
+            logger.info("💳 Payme transaction %s cancelled (reason %s)", transaction['id'], reason)
+
+        return {
+            "transaction": transaction["id"],
+            "cancel_time": transaction["cancel_time"],
+            "state": transaction["state"],
+        }
+
+    async def check_transaction(self, params: dict) -> dict:
+        transaction = await self._get_transaction(params)
+        return {
+            "create_time": transaction["create_time"],
+            "perform_time": transaction["perform_time"],
+            "cancel_time": transaction["cancel_time"],
+            "transaction": transaction["id"],
+            "state": transaction["state"],
+            "reason": transaction["reason"],
+        }
+
+    async def get_statement(self, params: dict) -> dict:
+        start, end = params.get("from"), params.get("to")
+        if not isinstance(start, int) or not isinstance(end, int):
+            raise PaymeError(ERROR_INVALID_PARAMS, "Invalid params")
+
+        transactions = await self.store.between(start, end)
+        return {
+            "transactions": [
+                {
+                    "id": t["id"],
+                    "time": t["time"],
+                    "amount": t["amount"],
+                    "account": {"order_id": t["order_id"]},
+                    "create_time": t["create_time"],
+                    "perform_time": t["perform_time"],
+                    "cancel_time": t["cancel_time"],
+                    "transaction": t["id"],
+                    "state": t["state"],
+                    "reason": t["reason"],
+                }
+                for t in transactions
+            ]
+        }
+
+    async def _get_transaction(self, params: dict) -> dict:
+        transaction_id = params.get("id")
+        transaction = await self.store.get(transaction_id) if transaction_id else None
+        if transaction is None:
+            raise PaymeError(ERROR_TRANSACTION_NOT_FOUND, "Transaction not found")
+        return transaction
+
+    async def _expire_if_timed_out(self, transaction: dict) -> bool:
+        if _now_ms() - transaction["create_time"] <= TRANSACTION_TIMEOUT_MS:
+            return False
+        cancel_time = _now_ms()
+        await self.store.update(
+            transaction["id"], state=STATE_CANCELLED, cancel_time=cancel_time, reason=REASON_TIMEOUT
+        )
+        transaction.update(state=STATE_CANCELLED, cancel_time=cancel_time, reason=REASON_TIMEOUT)
+        await transition_order_status(transaction["order_id"], "cancelled")
+        logger.info("💳 Payme transaction %s expired", transaction['id'])
+        return True
+
+    async def _cancel_paid_order(self, order_id: str):
+        # One conditional write, so an order that is completed meanwhile is never cancelled
+        response = await (
+            supabase.table("orders")
+            .update({"status": "cancelled"})
+            .eq("id", order_id)
+            .not_.in_("status", list(FINAL_ORDER_STATUSES))
+            .execute()
+        )
+        if not response.data:
+            raise PaymeError(ERROR_CANNOT_CANCEL, "Order is already completed")
+
+    @staticmethod
+    def _create_result(transaction: dict) -> dict:
+        return {
+            "create_time": transaction["create_time"],
+            "transaction": transaction["id"],
+            "state": transaction["state"],
+        }
+
+
+# Shared Payme engine
+payme_merchant = PaymeMerchant(PaymeTransactionStore(settings.payme_db_path), settings.payme_merchant_key)
@@ -0,0 +1,106 @@
+"""
+Read-through cache for user profiles.
+
+`profiles` lookups by telegram_id are the hottest Supabase query the bot
+runs (every /start and every order button tap), so handlers read profiles
+through this cache instead of querying directly.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from bot import supabase
+from config import settings
+from utils.logger import logger
+
+
+# Users without a profile are re-checked sooner, since they are about to register
+NEGATIVE_TTL = 30.0
+
+
+class ProfileCache:
+    """
+    Bounded LRU cache of profiles keyed by telegram_id, with TTL.
+
+    Concurrent misses for the same user share a single Supabase query.
+
+    Args:
+        max_size: Maximum number of cached profiles
+        ttl: Seconds a cached profile stays valid
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, Optional[dict]]]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._counters = {"hits": 0, "misses": 0, "coalesced_misses": 0}
+
+    async def get(self, telegram_id: int) -> Optional[dict]:
+        """
+        Return the profile for a user, or None if they are not registered.
+
+        Raises:
+            Exception: Whatever the Supabase query raised (errors are not cached)
+        """
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            expires_at, profile = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self._counters["hits"] += 1
+                return profile
+            del self._entries[telegram_id]
+
+        inflight = self._inflight.get(telegram_id)
+        if inflight is not None:
+            self._counters["coalesced_misses"] += 1
+            return await asyncio.shield(inflight)
+
+        self._counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[telegram_id] = future
+        try:
+            profile = await self._fetch(telegram_id)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a miss nobody else waited on does not log a warning
+            future.exception()
+            raise
+        else:
+            self.set(telegram_id, profile)
+            future.set_result(profile)
+            return profile
+        finally:
+            self._inflight.pop(telegram_id, None)
+
+    def set(self, telegram_id: int, profile: Optional[dict]):
+        """Store (or replace) the cached profile for a user."""
+        ttl = self.ttl if profile is not None else min(self.ttl, NEGATIVE_TTL)
+        self._entries[telegram_id] = (time.monotonic() + ttl, profile)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        """Drop the cached profile so the next read goes to Supabase."""
+        self._entries.pop(telegram_id, None)
+
+    def stats(self) -> dict:
+        lookups = self._counters["hits"] + self._counters["misses"] + self._counters["coalesced_misses"]
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+            **self._counters,
+        }
+
+    async def _fetch(self, telegram_id: int) -> Optional[dict]:
+        logger.info("Profile cache miss, fetching profile for telegram_id: %s", telegram_id)
+        response = await supabase.table("profiles").select("*").eq("telegram_id", telegram_id).execute()
+        return response.data[0] if response.data else None
+
+
+# Shared cache instance used by all handlers
+profile_cache = ProfileCache(max_size=settings.profile_cache_size, ttl=settings.profile_cache_ttl)
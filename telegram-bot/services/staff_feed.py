@@ -0,0 +1,389 @@
+"""
+Kitchen/staff order feed in a Telegram chat.
+
+Keeps an in-memory index of active orders (confirmed, ready, delivering),
+grouped by status and order type. The index is built once from `orders`
+at startup. After that, it is updated from the status updates that reach
+the bot: /api/order-update and the Realtime order feed. Changes are
+collected for STAFF_FEED_INTERVAL seconds. Each round then posts one diff
+message to STAFF_CHAT_ID and edits a pinned summary message in place.
+
+Every order's summary line is rendered once when the order changes and
+is cached. A summary edit only joins cached lines, and it is skipped when
+the text did not change.
+"""
+import asyncio
+import html
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from bot import supabase
+from config import settings
+from services.dispatcher import dispatcher
+from services.order_status import DB_STATUS_TO_NOTIFY
+from utils.id_formatter import format_order_id
+from utils.logger import logger
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS staff_feed_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+ACTIVE_STATUSES = ("confirmed", "ready", "delivering")
+# Terminal statuses remove an order from the index
+CLOSED_STATUSES = ("delivered", "cancelled")
+
+STATUS_LABELS = {
+    "confirmed": "🆕 Qabul qilingan",
+    "ready": "🍳 Tayyor",
+    "delivering": "🚚 Yo'lda",
+    "delivered": "✅ Yetkazildi",
+    "cancelled": "❌ Bekor qilindi",
+}
+TYPE_LABELS = {
+    "delivery": "🚗 Yetkazish",
+    "takeaway": "🛍 Olib ketish",
+    "preorder": "🕒 Oldindan",
+}
+
+INDEX_COLUMNS = "id,status,order_type,product_name,quantity,customer_name,created_at"
+
+# Diff lines per message; the rest is summarised as a count
+MAX_DIFF_LINES = 40
+
+# Telegram's message length limit
+MAX_MESSAGE_LENGTH = 4096
+
+
+@dataclass
+class ActiveOrder:
+    """An order shown in the staff summary."""
+    order_id: str
+    status: str
+    order_type: str
+    product_name: Optional[str] = None
+    quantity: Optional[int] = None
+    customer_name: Optional[str] = None
+    created_at: str = ""
+
+
+class StaffFeed:
+    """
+    Active order index mirrored to a staff chat.
+
+    Args:
+        chat_id: Staff chat (None disables the feed)
+        db_path: SQLite file remembering the pinned summary message
+        interval: Seconds changes are collected before the chat is updated
+        max_rows: Orders listed per status in the summary
+    """
+
+    def __init__(self, chat_id: Optional[int], db_path: str, interval: float, max_rows: int):
+        self.chat_id = chat_id
+        self.db_path = db_path
+        self.interval = interval
+        self.max_rows = max_rows
+        self._orders: Dict[str, ActiveOrder] = {}
+        self._groups: Dict[Tuple[str, str], Set[str]] = {}
+        self._lines: Dict[str, str] = {}
+        self._events: List[str] = []
+        self._dirty = asyncio.Event()
+        self._bot: Optional[Bot] = None
+        self._summary_id: Optional[int] = None
+        self._summary_text = ""
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="staff-feed")
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {"updates": 0, "diffs_sent": 0, "summary_edits": 0, "summary_unchanged": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.chat_id is not None
+
+    async def start(self, bot: Bot):
+        """Build the index from `orders` and start updating the staff chat."""
+        if not self.enabled or self._task is not None:
+            return
+        self._bot = bot
+        self._summary_id = await self._run(self._open)
+
+        try:
+            response = await (
+                supabase.table("orders")
+                .select(INDEX_COLUMNS)
+                .in_("status", [db for db, status in DB_STATUS_TO_NOTIFY.items() if status in ACTIVE_STATUSES])
+                .order("created_at")
+                .execute()
+            )
+            rows = response.data or []
+        except Exception as e:
+            # The index then fills from live updates only
+            logger.warning("Could not load active orders for the staff feed: %s", e)
+            rows = []
+        for row in rows:
+            # Updates that arrived while loading are newer than this snapshot
+            if row.get("id") and row["id"] not in self._orders:
+                self._index(self._order_from_row(row, DB_STATUS_TO_NOTIFY[row["status"]]))
+
+        self._task = asyncio.create_task(self._flush_loop(), name="staff-feed")
+        self._dirty.set()
+        logger.info("Staff feed started for chat %s with %s active orders", self.chat_id, len(self._orders))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    def apply(
+        self,
+        order_id: str,
+        status: str,
+        order_type: Optional[str] = None,
+        product_name: Optional[str] = None,
+        **fields
+    ):
+        """
+        Apply a status update (a notification status, or "cancelled").
+
+        Only the changed order's summary line is re-rendered. Updates that
+        repeat the current status change nothing.
+        """
+        if not self.enabled:
+            return
+        current = self._orders.get(order_id)
+
+        if status in CLOSED_STATUSES:
+            if current is None:
+                return
+            self._unindex(current)
+            self._event(self._title(current), STATUS_LABELS[status])
+            return
+        if status not in ACTIVE_STATUSES:
+            return
+
+        if current is None:
+            order = ActiveOrder(
+                order_id=order_id,
+                status=status,
+                order_type=order_type or "delivery",
+                product_name=product_name,
+                **{key: value for key, value in fields.items() if key in ("quantity", "customer_name", "created_at")}
+            )
+            self._index(order)
+            self._event(self._render_line(order), STATUS_LABELS[status])
+            return
+
+        if current.status == status:
+            # Same status from another source (e.g. the Realtime row after the webhook): fill in details
+            details = {"product_name": product_name, **fields}
+            missing = {key: value for key, value in details.items() if value and not getattr(current, key, True)}
+            if missing:
+                for key, value in missing.items():
+                    setattr(current, key, value)
+                self._lines[order_id] = self._render_line(current)
+                self._dirty.set()
+            return
+        self._unindex(current)
+        current.status = status
+        if order_type:
+            current.order_type = order_type
+        self._index(current)
+        self._event(self._title(current), STATUS_LABELS[status])
+
+    def apply_record(self, record: dict):
+        """Apply an `orders` row (Realtime change or catch-up read)."""
+        db_status = record.get("status")
+        status = "cancelled" if db_status == "cancelled" else DB_STATUS_TO_NOTIFY.get(db_status)
+        if status is None or not record.get("id"):
+            return
+        self.apply(
+            record["id"],
+            status,
+            order_type=record.get("order_type"),
+            product_name=record.get("product_name"),
+            quantity=record.get("quantity"),
+            customer_name=record.get("customer_name"),
+            created_at=record.get("created_at") or ""
+        )
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "active_orders": len(self._orders),
+            "by_group": {f"{status}/{order_type}": len(ids) for (status, order_type), ids in self._groups.items() if ids},
+            **self._counters,
+        }
+
+    def _order_from_row(self, row: dict, status: str) -> ActiveOrder:
+        return ActiveOrder(
+            order_id=row["id"],
+            status=status,
+            order_type=row.get("order_type") or "delivery",
+            product_name=row.get("product_name"),
+            quantity=row.get("quantity"),
+            customer_name=row.get("customer_name"),
+            created_at=row.get("created_at") or ""
+        )
+
+    def _index(self, order: ActiveOrder):
+        self._orders[order.order_id] = order
+        self._groups.setdefault((order.status, order.order_type), set()).add(order.order_id)
+        self._lines[order.order_id] = self._render_line(order)
+
+    def _unindex(self, order: ActiveOrder):
+        self._orders.pop(order.order_id, None)
+        self._groups.get((order.status, order.order_type), set()).discard(order.order_id)
+        self._lines.pop(order.order_id, None)
+
+    def _event(self, line: str, label: str):
+        self._counters["updates"] += 1
+        # Nothing drains the list before start(); its first summary shows the index as it is by then
+        if self._task is None:
+            return
+        self._events.append(f"{label}: {line}")
+        self._dirty.set()
+
+    def _title(self, order: ActiveOrder) -> str:
+        title = f"<b>#{format_order_id(order.order_id)}</b>"
+        if order.product_name:
+            title += f" {html.escape(order.product_name)}"
+            if order.quantity and order.quantity > 1:
+                title += f" ×{order.quantity}"
+        return title
+
+    def _render_line(self, order: ActiveOrder) -> str:
+        line = f"{self._title(order)} · {TYPE_LABELS.get(order.order_type, html.escape(order.order_type))}"
+        if order.customer_name:
+            line += f" · {html.escape(order.customer_name)}"
+        return line
+
+    def _render_summary(self) -> str:
+        lines = [f"📋 <b>Faol buyurtmalar: {len(self._orders)}</b>"]
+        for status in ACTIVE_STATUSES:
+            by_type = [
+                (order_type, len(ids)) for (group_status, order_type), ids in sorted(self._groups.items())
+                if group_status == status and ids
+            ]
+            total = sum(count for _, count in by_type)
+            breakdown = ", ".join(f"{TYPE_LABELS.get(order_type, order_type)} {count}" for order_type, count in by_type)
+            lines.append(f"{STATUS_LABELS[status]}: {total}" + (f" ({breakdown})" if breakdown else ""))
+
+        for status in ACTIVE_STATUSES:
+            ids = [order_id for (group_status, _), group in self._groups.items() if group_status == status for order_id in group]
+            if not ids:
+                continue
+            ids.sort(key=lambda order_id: self._orders[order_id].created_at)
+            lines.append(f"\n<b>{STATUS_LABELS[status]}</b>")
+            lines.extend(self._lines[order_id] for order_id in ids[:self.max_rows])
+            if len(ids) > self.max_rows:
+                lines.append(f"… va yana {len(ids) - self.max_rows} ta")
+
+        text = "\n".join(lines)
+        if len(text) > MAX_MESSAGE_LENGTH:
+            text = text[:MAX_MESSAGE_LENGTH - 1].rsplit("\n", 1)[0] + "\n…"
+        return text
+
+    def _render_diff(self, events: List[str]) -> str:
+        lines = events[:MAX_DIFF_LINES]
+        if len(events) > MAX_DIFF_LINES:
+            lines.append(f"… va yana {len(events) - MAX_DIFF_LINES} ta o'zgarish")
+        return "\n".join(lines)
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            # Collect a burst of changes into one message and one edit
+            await asyncio.sleep(self.interval)
+            self._dirty.clear()
+            events, self._events = self._events, []
+            try:
+                if events:
+                    await self._send(self._render_diff(events))
+                    self._counters["diffs_sent"] += 1
+                await self._update_summary()
+            except TelegramRetryAfter as e:
+                logger.warning("Flood control on the staff chat, retrying in %ss", e.retry_after)
+                self._events = events + self._events
+                await asyncio.sleep(e.retry_after)
+                self._dirty.set()
+            except Exception as e:
+                logger.error("Staff feed update failed: %s", e)
+
+    async def _send(self, text: str) -> int:
+        await dispatcher.global_bucket.acquire()
+        message = await self._bot.send_message(chat_id=self.chat_id, text=text, parse_mode="HTML")
+        return message.message_id
+
+    async def _update_summary(self):
+        text = self._render_summary()
+        if text == self._summary_text:
+            self._counters["summary_unchanged"] += 1
+            return
+
+        if self._summary_id is not None:
+            await dispatcher.global_bucket.acquire()
+            try:
+                await self._bot.edit_message_text(
+                    chat_id=self.chat_id, message_id=self._summary_id, text=text, parse_mode="HTML"
+                )
+                self._summary_text = text
+                self._counters["summary_edits"] += 1
+                return
+            except TelegramBadRequest as e:
+                if "message is not modified" in str(e):
+                    self._summary_text = text
+                    return
+                logger.warning("Could not edit staff summary %s, posting a new one: %s", self._summary_id, e)
+
+        self._summary_id = await self._send(text)
+        self._summary_text = text
+        await self._run(self._save_summary_id, self._summary_id)
+        try:
+            await self._bot.pin_chat_message(
+                chat_id=self.chat_id, message_id=self._summary_id, disable_notification=True
+            )
+        except Exception as e:
+            logger.warning("Could not pin the staff summary (is the bot an admin?): %s", e)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> Optional[int]:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+        row = conn.execute("SELECT value FROM staff_feed_state WHERE key = 'summary_message_id'").fetchone()
+        return row[0] if row else None
+
+    def _save_summary_id(self, message_id: int):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO staff_feed_state (key, value) VALUES ('summary_message_id', ?)",
+                (message_id,)
+            )
+
+
+# Shared staff feed; disabled unless STAFF_CHAT_ID is set
+staff_feed = StaffFeed(
+    settings.staff_chat_id,
+    settings.staff_feed_db_path,
+    interval=settings.staff_feed_interval,
+    max_rows=settings.staff_feed_max_rows
+)
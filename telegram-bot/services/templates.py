@@ -0,0 +1,312 @@
+"""
+Precompiled order status notification templates.
+
+Templates are written per locale as {status: text or {order_type: text}}
+and compiled once at import into a flat dict keyed by
+(status, order_type, locale). Each entry keeps the static text between the
+placeholders, so rendering a message is a dict lookup and a concatenation.
+"""
+import html
+from string import Formatter
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.id_formatter import format_order_id
+
+
+DEFAULT_LOCALE = "uz"
+DEFAULT_ORDER_TYPE = "delivery"
+ORDER_TYPES = ("delivery", "takeaway", "preorder")
+
+# Shown when the backend does not send a product name
+DEFAULT_PRODUCT_NAMES = {"uz": "Taomlar", "ru": "Блюда", "en": "Your meal"}
+
+
+# Message templates with rich formatting (HTML parse mode)
+TEMPLATE_SOURCES = {
+    "uz": {
+        "confirmed": (
+            "✨ <b>Yangi buyurtma qabul qilindi!</b>\n\n"
+            "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
+            "🍔 <b>Mahsulot:</b> {product_name}\n"
+            "⏳ <b>Holat:</b> Tasdiqlandi\n\n"
+            "<i>Tez orada taomingizni tayyorlashni boshlaymiz!</i>"
+        ),
+        "ready": {
+            "delivery": (
+                "🍳 <b>Buyurtmangiz tayyor bo'ldi!</b>\n\n"
+                "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Mahsulot:</b> {product_name}\n"
+                "🏃‍♂️ <b>Holat:</b> Dastavkaga berildi\n\n"
+                "<i>Dastavkachi hozir yo'lga chiqadi.</i>"
+            ),
+            "takeaway": (
+                "🍳 <b>Buyurtmangiz tayyor bo'ldi!</b>\n\n"
+                "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Mahsulot:</b> {product_name}\n"
+                "🛍️ <b>Holat:</b> Tayyor\n\n"
+                "<i>Kelib olib ketishingiz mumkin!</i>"
+            ),
+            "preorder": (
+                "🍳 <b>Broningiz tayyor!</b>\n\n"
+                "🆔 <b>ID:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Mahsulot:</b> {product_name}\n"
+                "📅 <b>Holat:</b> Stolingiz tayyor\n\n"
+                "<i>Sizni kutmoqdamiz!</i>"
+            )
+        },
+        "delivering": (
+            "🚚 <b>Buyurtmangiz yo'lda!</b>\n\n"
+            "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
+            "🍔 <b>Mahsulot:</b> {product_name}\n"
+            "📍 <b>Holat:</b> Yetkazilmoqda\n\n"
+            "<i>Iltimos, kuting, dastavkachi yaqin orada yetib boradi.</i>"
+        ),
+        "delivered": {
+            "delivery": (
+                "✅ <b>Tabriklaymiz! Buyurtma yetkazildi!</b>\n\n"
+                "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Mahsulot:</b> {product_name}\n"
+                "🏁 <b>Holat:</b> Yakunlandi\n\n"
+                "<b>Yoqimli ishtaha! 🍽️</b>\n"
+                "<i>Bizni tanlaganingiz uchun rahmat!</i>"
+            ),
+            "takeaway": (
+                "✅ <b>Tabriklaymiz! Buyurtma olib ketildi!</b>\n\n"
+                "🆔 <b>Buyurtma:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Mahsulot:</b> {product_name}\n"
+                "🏁 <b>Holat:</b> Yakunlandi\n\n"
+                "<b>Yoqimli ishtaha! 🍽️</b>\n"
+                "<i>Bizni tanlaganingiz uchun rahmat!</i>"
+            ),
+            "preorder": (
+                "✅ <b>Tabriklaymiz! Tashrifingiz yakunlandi!</b>\n\n"
+                "🆔 <b>ID:</b> <code>{order_id}</code>\n"
+                "🏁 <b>Holat:</b> Yakunlandi\n\n"
+                "<i>Tashrifingiz uchun rahmat! Yana kutib qolamiz! 🍽️</i>"
+            )
+        }
+    },
+    "ru": {
+        "confirmed": (
+            "✨ <b>Новый заказ принят!</b>\n\n"
+            "🆔 <b>Заказ:</b> <code>{order_id}</code>\n"
+            "🍔 <b>Блюдо:</b> {product_name}\n"
+            "⏳ <b>Статус:</b> Подтверждён\n\n"
+            "<i>Скоро начнём готовить ваш заказ!</i>"
+        ),
+        "ready": {
+            "delivery": (
+                "🍳 <b>Ваш заказ готов!</b>\n\n"
+                "🆔 <b>Заказ:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Блюдо:</b> {product_name}\n"
+                "🏃‍♂️ <b>Статус:</b> Передан курьеру\n\n"
+                "<i>Курьер скоро выедет.</i>"
+            ),
+            "takeaway": (
+                "🍳 <b>Ваш заказ готов!</b>\n\n"
+                "🆔 <b>Заказ:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Блюдо:</b> {product_name}\n"
+                "🛍️ <b>Статус:</b> Готов\n\n"
+                "<i>Можете забрать его!</i>"
+            ),
+            "preorder": (
+                "🍳 <b>Ваша бронь готова!</b>\n\n"
+                "🆔 <b>ID:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Блюдо:</b> {product_name}\n"
+                "📅 <b>Статус:</b> Столик готов\n\n"
+                "<i>Ждём вас!</i>"
+            )
+        },
+        "delivering": (
+            "🚚 <b>Ваш заказ в пути!</b>\n\n"
+            "🆔 <b>Заказ:</b> <code>{order_id}</code>\n"
+            "🍔 <b>Блюдо:</b> {product_name}\n"
+            "📍 <b>Статус:</b> Доставляется\n\n"
+            "<i>Пожалуйста, подождите, курьер скоро будет у вас.</i>"
+        ),
+        "delivered": {
+            "delivery": (
+                "✅ <b>Заказ доставлен!</b>\n\n"
+                "🆔 <b>Заказ:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Блюдо:</b> {product_name}\n"
+                "🏁 <b>Статус:</b> Завершён\n\n"
+                "<b>Приятного аппетита! 🍽️</b>\n"
+                "<i>Спасибо, что выбрали нас!</i>"
+            ),
+            "takeaway": (
+                "✅ <b>Заказ получен!</b>\n\n"
+                "🆔 <b>Заказ:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Блюдо:</b> {product_name}\n"
+                "🏁 <b>Статус:</b> Завершён\n\n"
+                "<b>Приятного аппетита! 🍽️</b>\n"
+                "<i>Спасибо, что выбрали нас!</i>"
+            ),
+            "preorder": (
+                "✅ <b>Спасибо за визит!</b>\n\n"
+                "🆔 <b>ID:</b> <code>{order_id}</code>\n"
+                "🏁 <b>Статус:</b> Завершён\n\n"
+                "<i>Будем рады видеть вас снова! 🍽️</i>"
+            )
+        }
+    },
+    "en": {
+        "confirmed": (
+            "✨ <b>New order received!</b>\n\n"
+            "🆔 <b>Order:</b> <code>{order_id}</code>\n"
+            "🍔 <b>Item:</b> {product_name}\n"
+            "⏳ <b>Status:</b> Confirmed\n\n"
+            "<i>We will start preparing your meal shortly!</i>"
+        ),
+        "ready": {
+            "delivery": (
+                "🍳 <b>Your order is ready!</b>\n\n"
+                "🆔 <b>Order:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Item:</b> {product_name}\n"
+                "🏃‍♂️ <b>Status:</b> Handed to the courier\n\n"
+                "<i>The courier is about to head out.</i>"
+            ),
+            "takeaway": (
+                "🍳 <b>Your order is ready!</b>\n\n"
+                "🆔 <b>Order:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Item:</b> {product_name}\n"
+                "🛍️ <b>Status:</b> Ready\n\n"
+                "<i>You can come and pick it up!</i>"
+            ),
+            "preorder": (
+                "🍳 <b>Your reservation is ready!</b>\n\n"
+                "🆔 <b>ID:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Item:</b> {product_name}\n"
+                "📅 <b>Status:</b> Your table is ready\n\n"
+                "<i>We are waiting for you!</i>"
+            )
+        },
+        "delivering": (
+            "🚚 <b>Your order is on its way!</b>\n\n"
+            "🆔 <b>Order:</b> <code>{order_id}</code>\n"
+            "🍔 <b>Item:</b> {product_name}\n"
+            "📍 <b>Status:</b> Out for delivery\n\n"
+            "<i>Please wait, the courier will arrive soon.</i>"
+        ),
+        "delivered": {
+            "delivery": (
+                "✅ <b>Your order has been delivered!</b>\n\n"
+                "🆔 <b>Order:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Item:</b> {product_name}\n"
+                "🏁 <b>Status:</b> Completed\n\n"
+                "<b>Enjoy your meal! 🍽️</b>\n"
+                "<i>Thank you for choosing us!</i>"
+            ),
+            "takeaway": (
+                "✅ <b>Your order has been picked up!</b>\n\n"
+                "🆔 <b>Order:</b> <code>{order_id}</code>\n"
+                "🍔 <b>Item:</b> {product_name}\n"
+                "🏁 <b>Status:</b> Completed\n\n"
+                "<b>Enjoy your meal! 🍽️</b>\n"
+                "<i>Thank you for choosing us!</i>"
+            ),
+            "preorder": (
+                "✅ <b>Thank you for your visit!</b>\n\n"
+                "🆔 <b>ID:</b> <code>{order_id}</code>\n"
+                "🏁 <b>Status:</b> Completed\n\n"
+                "<i>We hope to see you again! 🍽️</i>"
+            )
+        }
+    }
+}
+
+STATUSES = frozenset(TEMPLATE_SOURCES[DEFAULT_LOCALE])
+LOCALES = frozenset(TEMPLATE_SOURCES)
+
+
+class CompiledTemplate:
+    """
+    A template split into the static fragments around its placeholders.
+
+    `render` is built at compile time as a plain concatenation for the
+    usual layouts, so no parsing or formatting happens per message.
+    """
+
+    __slots__ = ("fragments", "fields", "render")
+
+    def __init__(self, source: str):
+        fragments, fields = [], []
+        literal = ""
+        for text, field_name, _, _ in Formatter().parse(source):
+            literal += text
+            if field_name is not None:
+                fragments.append(literal)
+                fields.append(field_name)
+                literal = ""
+        fragments.append(literal)
+        self.fragments: Tuple[str, ...] = tuple(fragments)
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self.render: Callable[[str, str], str] = _make_renderer(self.fragments, self.fields)
+
+
+def _make_renderer(fragments: Tuple[str, ...], fields: Tuple[str, ...]) -> Callable[[str, str], str]:
+    if fields == ("order_id", "product_name"):
+        f0, f1, f2 = fragments
+        return lambda order_id, product_name: f0 + order_id + f1 + product_name + f2
+    if fields == ("order_id",):
+        f0, f1 = fragments
+        return lambda order_id, product_name: f0 + order_id + f1
+
+    def render(order_id: str, product_name: str) -> str:
+        values = {"order_id": order_id, "product_name": product_name}
+        parts = [fragments[0]]
+        for index, name in enumerate(fields, 1):
+            parts.append(values[name])
+            parts.append(fragments[index])
+        return "".join(parts)
+
+    return render
+
+
+def _compile() -> Dict[Tuple[str, Optional[str], str], CompiledTemplate]:
+    compiled = {}
+    for locale, templates in TEMPLATE_SOURCES.items():
+        for status, source in templates.items():
+            for order_type in ORDER_TYPES:
+                if isinstance(source, dict):
+                    text = source.get(order_type, source[DEFAULT_ORDER_TYPE])
+                else:
+                    text = source
+                compiled[(status, order_type, locale)] = CompiledTemplate(text)
+            # Missing order type means delivery
+            compiled[(status, None, locale)] = compiled[(status, DEFAULT_ORDER_TYPE, locale)]
+            compiled[(status, "", locale)] = compiled[(status, DEFAULT_ORDER_TYPE, locale)]
+    return compiled
+
+
+# (status, order_type, locale) -> compiled template, built once at import
+COMPILED_TEMPLATES = _compile()
+
+
+def render_status_message(
+    status: str,
+    order_id: str,
+    product_name: Optional[str] = None,
+    order_type: Optional[str] = None,
+    locale: Optional[str] = None
+) -> Optional[str]:
+    """
+    Render an order status notification.
+
+    Unknown or missing order types fall back to delivery and unknown
+    locales to Uzbek. `product_name` is HTML-escaped.
+
+    Returns:
+        Message text, or None if the status has no template
+    """
+    if locale not in LOCALES:
+        locale = DEFAULT_LOCALE
+    template = COMPILED_TEMPLATES.get((status, order_type, locale))
+    if template is None:
+        template = COMPILED_TEMPLATES.get((status, DEFAULT_ORDER_TYPE, locale))
+        if template is None:
+            return None
+
+    return template.render(
+        format_order_id(order_id),
+        html.escape(product_name) if product_name else DEFAULT_PRODUCT_NAMES[locale]
+    )
@@ -0,0 +1,152 @@
+"""
+Pluggable FSM storage for the aiogram dispatcher.
+
+aiogram's default MemoryStorage keeps conversation state inside one process,
+so a user's registration breaks on restart or when another worker receives
+the next update. Backends selected by FSM_STORAGE:
+
+- memory: aiogram MemoryStorage (single process, state lost on restart)
+- sqlite: SQLiteStorage below, shared by every worker on the same host
+- redis: aiogram RedisStorage, shared across hosts (needs the `redis` package)
+
+Any other shared store can be plugged in by implementing aiogram's
+BaseStorage (set_state/get_state/set_data/get_data/close).
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from utils.logger import logger
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm (updated_at);
+"""
+
+# Seconds a worker waits for another worker's write lock
+BUSY_TIMEOUT = 5.0
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage in a local SQLite file, safe to share between processes.
+
+    WAL mode lets workers read while another one writes; each call is a
+    single short statement run on a dedicated thread.
+
+    Args:
+        path: SQLite database file
+        ttl: Seconds after which an untouched conversation is dropped on open
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await self._run(self._write, "state", self.key_builder.build(key), state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._run(self._read, self.key_builder.build(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._run(self._write, "data", self.key_builder.build(key), json.dumps(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._run(self._read, self.key_builder.build(key))
+        return json.loads(row[1]) if row else {}
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, *args)
+
+    def _call(self, fn, *args):
+        # Opened lazily on the storage thread, so creating the dispatcher stays cheap
+        if self._conn is None:
+            self._open()
+        return fn(*args)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.execute("DELETE FROM fsm WHERE updated_at < ?", (time.time() - self.ttl,))
+        self._conn = conn
+        logger.info("FSM storage opened at %s", self.path)
+
+    def _read(self, key: str):
+        return self._conn.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+
+    def _write(self, column: str, key: str, value: Optional[str]):
+        with self._conn:
+            self._conn.execute(
+                f"INSERT INTO fsm (key, {column}, updated_at) VALUES (?, ?, ?) "
+                f"ON CONFLICT(key) DO UPDATE SET {column} = excluded.{column}, updated_at = excluded.updated_at",
+                (key, value, time.time())
+            )
+            # A cleared conversation leaves no row behind
+            self._conn.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+
+
+def create_fsm_storage(backend: str, path: str, redis_url: Optional[str], ttl: float) -> BaseStorage:
+    """
+    Build the FSM storage selected by FSM_STORAGE.
+
+    Args:
+        backend: "memory", "sqlite" or "redis"
+        path: SQLite file for the sqlite backend
+        redis_url: Connection URL for the redis backend
+        ttl: Seconds an idle conversation is kept (sqlite and redis)
+
+    Raises:
+        ValueError: If the backend is unknown or cannot be used
+    """
+    if backend == "memory":
+        return MemoryStorage()
+
+    if backend == "sqlite":
+        return SQLiteStorage(path, ttl)
+
+    if backend == "redis":
+        if not redis_url:
+            raise ValueError("REDIS_URL is required for FSM_STORAGE=redis")
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise ValueError("FSM_STORAGE=redis needs the 'redis' package (pip install redis)")
+        return RedisStorage.from_url(
+            redis_url,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=int(ttl),
+            data_ttl=int(ttl)
+        )
+
+    raise ValueError(f"Unknown FSM_STORAGE backend: {backend!r}")
@@ -1,53 +1,222 @@
 """
 Logging configuration for the Telegram bot.
+
+Log calls only put the record on a queue; formatting and the console/file
+writes happen on a background QueueListener thread, so a slow disk never
+stalls the event loop. Records carry the current request and order IDs
+(set with `log_context`) and are written as one JSON object per line.
+Messages use %-style arguments, so records for disabled levels are never
+formatted at all.
 """
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
-from datetime import datetime
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+
+LOGGER_NAME = "telegram_bot"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+order_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("order_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
 
+@contextmanager
+def log_context(request_id: Optional[str] = None, order_id: Optional[str] = None):
+    """Attach request/order IDs to every record logged inside the block."""
+    tokens = []
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    if order_id is not None:
+        tokens.append((order_id_var, order_id_var.set(str(order_id))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that captures the correlation IDs on the calling thread.
 
-def setup_logger(name: str = "telegram_bot") -> logging.Logger:
+    Only the message itself is rendered here (the args may change once the
+    call returns); timestamps, JSON and I/O are left to the listener thread.
+    The record is updated in place: this is the logger's only handler.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.request_id = request_id_var.get()
+        record.order_id = order_id_var.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        order_id = getattr(record, "order_id", None)
+        if order_id:
+            entry["order_id"] = order_id
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic human-readable line, with correlation IDs appended."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        ids = [
+            f"{name}={value}"
+            for name, value in (("request", getattr(record, "request_id", None)), ("order", getattr(record, "order_id", None)))
+            if value
+        ]
+        return f"{line} [{' '.join(ids)}]" if ids else line
+
+
+def setup_logger(
+    name: str = LOGGER_NAME,
+    level: str = "INFO",
+    fmt: str = "json",
+    log_file: Optional[str] = "logs/bot.log",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5
+) -> logging.Logger:
     """
     Set up and configure logger for the application.
-    
+
+    Calling it again replaces the previous configuration.
+
     Args:
         name: Logger name
-        
+        level: Minimum level (DEBUG, INFO, ...)
+        fmt: "json" or "text"
+        log_file: Rotated log file, or None for console only
+        max_bytes: Size at which the log file is rotated
+        backup_count: Rotated files kept
+
     Returns:
         Configured logger instance
     """
+    global _listener
+
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    
-    # Create console handler
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter()
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    
-    # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
+
+    if log_file:
+        try:
+            directory = os.path.dirname(log_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            )
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        except Exception as e:
+            print(f"Could not setup file logging: {e}")
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(_ContextQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
 
-    # Create file handler for production
-    try:
-        import os
-        log_dir = "logs"
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-            
-        file_handler = logging.FileHandler(f"{log_dir}/bot.log", encoding='utf-8')
-        file_handler.setLevel(logging.INFO)
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-    except Exception as e:
-        print(f"Could not setup file logging: {e}")
-    
     return logger
 
 
-# Create default logger instance
-logger = setup_logger()
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware giving every HTTP request a correlation ID.
+
+    Uses the caller's X-Request-ID when present and echoes the ID back in
+    the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex[:16]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_wrapper)
+
+
+async def update_context_middleware(handler, update, data):
+    """aiogram outer middleware tagging records with the Telegram update ID."""
+    with log_context(request_id=f"update-{update.update_id}"):
+        return await handler(update, data)
+
+
+# Console-only until bot.py applies the LOG_* settings
+logger = setup_logger(log_file=None)
@@ -0,0 +1,295 @@
+"""
+Minimal Prometheus-style metrics.
+
+Metric children are created once per label combination and cached, so the
+hot path is a tuple-keyed dict lookup plus attribute increments; no label
+dicts are built per request. Everything runs on the event loop thread, so
+the counters need no locks. `registry.render()` produces the Prometheus
+text exposition format (version 0.0.4).
+"""
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; suits HTTP handlers, Telegram API calls and Supabase queries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_string(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Exposition lines for this metric."""
+
+
+class _LabelledMetric(_Metric):
+    """A metric with one child per label combination."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation)
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """Return the child for these label values, creating it on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._new_child(values)
+            self._children[values] = child
+        return child
+
+    @abstractmethod
+    def _new_child(self, values: Tuple[str, ...]):
+        """Create the child holding the values for one label combination."""
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in self._children.items():
+            lines.extend(self._render_child(_label_string(self.labelnames, values), values, child))
+        return lines
+
+    def _render_child(self, labels: str, values: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{labels} {child.value}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_LabelledMetric):
+    kind = "counter"
+
+    def _new_child(self, values):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_LabelledMetric):
+    kind = "gauge"
+
+    def _new_child(self, values):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_LabelledMetric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self, values):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, labels, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            bucket_labels = _label_string(self.labelnames, values, 'le="' + le + '"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_sum{labels} {child.sum}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class GaugeCallback(_Metric):
+    """Gauge read from a callback at scrape time (queue depths, hit rates)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return self._header() + [f"{self.name} {float(self.callback())}"]
+
+
+class Registry:
+    """Collection of metrics rendered together by /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name: str, documentation: str, callback: Callable[[], float]) -> GaugeCallback:
+        return self.register(GaugeCallback(name, documentation, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A broken callback must not take the whole scrape down
+                continue
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "FastAPI request latency by route", ("method", "route", "status")
+)
+TELEGRAM_REQUEST_SECONDS = registry.histogram(
+    "telegram_request_duration_seconds", "Telegram Bot API call latency by method", ("method",)
+)
+TELEGRAM_ERRORS = registry.counter(
+    "telegram_request_errors_total", "Failed Telegram Bot API calls by method and exception class", ("method", "error")
+)
+SUPABASE_REQUEST_SECONDS = registry.histogram(
+    "supabase_request_duration_seconds", "Supabase PostgREST latency by table and operation", ("table", "operation")
+)
+SUPABASE_ERRORS = registry.counter(
+    "supabase_request_errors_total", "Failed Supabase requests by table, operation and error", ("table", "operation", "error")
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by its route template.
+
+    The route template (e.g. /api/broadcasts/{broadcast_id}) keeps label
+    cardinality bounded; unmatched paths are reported as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._children: Dict[Tuple[str, str, int], _HistogramChild] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            key = (scope["method"], route.path if route is not None else "unmatched", status)
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = HTTP_REQUEST_SECONDS.labels(key[0], key[1], str(status))
+            child.observe(time.perf_counter() - started)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """aiogram session middleware timing Bot API calls and counting their errors."""
+
+    async def __call__(self, make_request, bot, method):
+        method_name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(method_name, type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_REQUEST_SECONDS.labels(method_name).observe(time.perf_counter() - started)
+
+
+SUPABASE_OPERATIONS = {
+    "GET": "select",
+    "HEAD": "select",
+    "POST": "insert",
+    "PATCH": "update",
+    "PUT": "upsert",
+    "DELETE": "delete",
+}
+
+
+def supabase_labels(method: str, path: str, prefer: str = "") -> Tuple[str, str]:
+    """(table, operation) for a PostgREST request, e.g. ("orders", "update")."""
+    table = path.rsplit("/", 1)[-1] or "unknown"
+    if method == "POST" and "merge-duplicates" in prefer:
+        return table, "upsert"
+    return table, SUPABASE_OPERATIONS.get(method, method.lower())
+
+
+def observe_supabase(table: str, operation: str, seconds: float, error: Optional[str] = None):
+    SUPABASE_REQUEST_SECONDS.labels(table, operation).observe(seconds)
+    if error is not None:
+        SUPABASE_ERRORS.labels(table, operation, error).inc()
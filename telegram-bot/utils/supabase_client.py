@@ -0,0 +1,197 @@
+"""
+Tuned HTTP client for Supabase PostgREST access.
+
+Builds the AsyncPostgrestClient used by `bot.supabase` with an explicit
+connection pool, keep-alive, optional HTTP/2, per-request timeouts and
+retries with jittered backoff, so tail latency is controlled in one place.
+"""
+import asyncio
+import importlib.util
+import random
+import time
+
+import httpx
+from postgrest import AsyncPostgrestClient
+
+from utils.logger import logger
+from utils.metrics import observe_supabase, supabase_labels
+from utils.tracing import tracer
+
+
+# Methods that are safe to resend after the server may have seen them
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Statuses worth retrying: gateway/overload errors from the Supabase edge
+RETRY_STATUSES = {502, 503, 504}
+
+# Errors raised before the request reached the server, safe to retry for any method
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Errors after the request may have been processed, retried for idempotent methods only
+READ_ERRORS = (httpx.ReadTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper retrying transient failures with full-jitter backoff.
+
+    Args:
+        transport: Transport that actually sends requests
+        retries: Extra attempts after the first one
+        backoff: Base delay in seconds (doubled per attempt, capped at `max_backoff`)
+        max_backoff: Upper bound for a single delay
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        retries: int,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0
+    ):
+        self._transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Latency per table/operation includes retries, as seen by the caller
+        table, operation = supabase_labels(request.method, request.url.path, request.headers.get("prefer", ""))
+        started = time.perf_counter()
+        with tracer.start_as_current_span(
+            f"supabase {operation} {table}",
+            {"db.table": table, "db.operation": operation},
+            kind="CLIENT"
+        ) as span:
+            try:
+                response = await self._send_with_retries(request)
+            except Exception as e:
+                observe_supabase(table, operation, time.perf_counter() - started, type(e).__name__)
+                raise
+            error = str(response.status_code) if response.status_code >= 400 else None
+            observe_supabase(table, operation, time.perf_counter() - started, error)
+            span.set_attribute("http.status_code", response.status_code)
+            if error is not None:
+                span.set_status("ERROR", f"HTTP {error}")
+            return response
+
+    async def _send_with_retries(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = await self._transport.handle_async_request(request)
+            except CONNECT_ERRORS as e:
+                if attempt >= self.retries:
+                    raise
+                error = e
+            except READ_ERRORS as e:
+                if not idempotent or attempt >= self.retries:
+                    raise
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUSES or not idempotent or attempt >= self.retries:
+                    return response
+                await response.aclose()
+                error = f"HTTP {response.status_code}"
+
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            attempt += 1
+            logger.warning(
+                "Supabase %s %s failed (%s), "
+                "retry %s/%s in %.2fs",
+                request.method, request.url.path, error, attempt, self.retries, delay
+            )
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_postgrest_client(
+    url: str,
+    key: str,
+    pool_size: int,
+    keepalive: int,
+    keepalive_expiry: float,
+    timeout: float,
+    connect_timeout: float,
+    retries: int,
+    http2: bool
+) -> AsyncPostgrestClient:
+    """
+    Create an AsyncPostgrestClient backed by a tuned, retrying httpx session.
+
+    Args:
+        url: Supabase project URL
+        key: Supabase API key
+        pool_size: Maximum concurrent connections
+        keepalive: Idle connections kept open for reuse
+        keepalive_expiry: Seconds an idle connection is kept
+        timeout: Read/write/pool timeout per request in seconds
+        connect_timeout: Connection establishment timeout in seconds
+        retries: Retries for transient errors
+        http2: Use HTTP/2 if the `h2` package is installed
+
+    Returns:
+        Configured AsyncPostgrestClient
+    """
+    if http2 and not http2_available():
+        logger.warning("HTTP/2 requested for Supabase but 'h2' is not installed, using HTTP/1.1")
+        http2 = False
+
+    client = AsyncPostgrestClient(
+        f"{url}/rest/v1",
+        headers={
+            "apikey": key,
+            "Authorization": f"Bearer {key}"
+        }
+    )
+
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=keepalive,
+        keepalive_expiry=keepalive_expiry
+    )
+    transport = RetryTransport(
+        httpx.AsyncHTTPTransport(limits=limits, http2=http2),
+        retries=retries
+    )
+    # Swap the default session (never opened yet) for the tuned one
+    client.session = httpx.AsyncClient(
+        base_url=client.session.base_url,
+        headers=client.session.headers,
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        transport=transport,
+        follow_redirects=True
+    )
+
+    logger.info(
+        "Supabase client: pool=%s, keepalive=%s, "
+        "http2=%s, timeout=%ss, retries=%s",
+        pool_size, keepalive, http2, timeout, retries
+    )
+    return client
+
+
+async def warm_up(client: AsyncPostgrestClient, connections: int):
+    """
+    Open pooled connections ahead of the first real query.
+
+    Runs a few tiny concurrent queries so TLS handshakes happen at startup
+    rather than on the first user's tap. Failures are logged, not raised.
+    """
+    async def ping():
+        await client.from_("profiles").select("telegram_id").limit(1).execute()
+
+    results = await asyncio.gather(*(ping() for _ in range(connections)), return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        logger.warning("Supabase warm-up: %s/%s queries failed: %s", len(failed), connections, failed[0])
+    else:
+        logger.info("Supabase warm-up complete (%s connections)", connections)
@@ -0,0 +1,320 @@
+"""
+Lightweight request tracing.
+
+Spans follow the OpenTelemetry model (128-bit trace IDs, 64-bit span IDs,
+W3C `traceparent` propagation, `start_as_current_span`) and are written as
+OTLP-style JSON lines by a background thread. The sampling decision is made
+once per trace at its root span; unsampled traces only pay for a context
+variable set/reset, and with TRACE_SAMPLE_RATE=0 nothing is recorded.
+"""
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, NamedTuple, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+
+class SpanContext(NamedTuple):
+    trace_id: int
+    span_id: int
+    sampled: bool
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id:032x}-{self.span_id:016x}-{'01' if self.sampled else '00'}"
+
+
+# Marks the rest of an unsampled trace so children do not sample again
+_NOT_SAMPLED = SpanContext(0, 0, False)
+
+_current_span: ContextVar[Optional[SpanContext]] = ContextVar("current_span", default=None)
+
+
+def current_span_context() -> Optional[SpanContext]:
+    """Context of the active span, to continue a trace in another task (e.g. a queued job)."""
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """Parse a W3C `traceparent` header; None if absent or malformed."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if not trace_id or not span_id:
+        return None
+    return SpanContext(trace_id, span_id, bool(flags & 1))
+
+
+class Span:
+    """A recorded operation; attributes and status can be set until it ends."""
+
+    __slots__ = ("name", "kind", "context", "parent_id", "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    def __init__(self, name: str, kind: str, context: SpanContext, parent_id: Optional[int], attributes: Optional[dict]):
+        self.name = name
+        self.kind = kind
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "UNSET"
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    def is_recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def update_name(self, name: str):
+        self.name = name
+
+    def set_status(self, status: str, message: str = ""):
+        """status: "OK" or "ERROR"."""
+        self.status = status
+        self.status_message = message
+
+    def record_exception(self, exc: BaseException):
+        self.attributes["exception.type"] = type(exc).__name__
+        self.attributes["exception.message"] = str(exc)[:500]
+        self.set_status("ERROR", type(exc).__name__)
+
+    def to_dict(self) -> dict:
+        entry = {
+            "traceId": f"{self.context.trace_id:032x}",
+            "spanId": f"{self.context.span_id:016x}",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            entry["parentSpanId"] = f"{self.parent_id:016x}"
+        if self.status_message:
+            entry["status"]["message"] = self.status_message
+        return entry
+
+
+class _NonRecordingSpan:
+    """Stand-in for unsampled spans; every call is a no-op."""
+
+    __slots__ = ()
+
+    def is_recording(self) -> bool:
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def update_name(self, name):
+        pass
+
+    def set_status(self, status, message=""):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+
+class FileSpanExporter:
+    """Appends finished spans as JSON lines from a background thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        self._queue.put(span)
+
+    def shutdown(self, timeout: float = 5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    break
+                try:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                except Exception as e:
+                    print(f"Could not export span {span.name}: {e}")
+                if self._queue.empty():
+                    f.flush()
+
+
+class Tracer:
+    """Creates spans and hands sampled ones to the exporter."""
+
+    def __init__(self):
+        self.sample_rate = 0.0
+        self._exporter: Optional[FileSpanExporter] = None
+
+    def configure(self, sample_rate: float, path: Optional[str]):
+        """
+        Enable tracing.
+
+        Args:
+            sample_rate: Fraction of traces recorded (0 disables tracing, 1 records all)
+            path: JSON-lines file spans are appended to
+        """
+        self.shutdown()
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        if self.sample_rate > 0 and path:
+            self._exporter = FileSpanExporter(path)
+
+    def shutdown(self):
+        if self._exporter is not None:
+            self._exporter.shutdown()
+            self._exporter = None
+
+    @contextmanager
+    def start_as_current_span(
+        self,
+        name: str,
+        attributes: Optional[dict] = None,
+        kind: str = "INTERNAL",
+        parent: Optional[SpanContext] = None
+    ) -> Iterator:
+        """
+        Run the block inside a new span (a child of `parent` or of the active span).
+
+        Exceptions escaping the block are recorded on the span and re-raised.
+        """
+        if parent is None:
+            parent = _current_span.get()
+
+        if parent is None:
+            exporter = self._exporter
+            if exporter is None or random.random() >= self.sample_rate:
+                token = _current_span.set(_NOT_SAMPLED)
+                try:
+                    yield NON_RECORDING_SPAN
+                finally:
+                    _current_span.reset(token)
+                return
+            context = SpanContext(random.getrandbits(128) or 1, random.getrandbits(64) or 1, True)
+            parent_id = None
+        elif not parent.sampled or self._exporter is None:
+            token = _current_span.set(parent if not parent.sampled else _NOT_SAMPLED)
+            try:
+                yield NON_RECORDING_SPAN
+            finally:
+                _current_span.reset(token)
+            return
+        else:
+            context = SpanContext(parent.trace_id, random.getrandbits(64) or 1, True)
+            parent_id = parent.span_id
+
+        span = Span(name, kind, context, parent_id, attributes)
+        token = _current_span.set(context)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            exporter = self._exporter
+            if exporter is not None:
+                exporter.export(span)
+
+
+# Shared tracer (bot.py applies the TRACE_* settings)
+tracer = Tracer()
+
+atexit.register(tracer.shutdown)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a server span per HTTP request.
+
+    Continues the caller's trace when a `traceparent` header is sent; the
+    span is named after the route template once routing has happened.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or tracer.sample_rate == 0:
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        with tracer.start_as_current_span(f"{method} {scope['path']}", kind="SERVER", parent=parent) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{method} {route.path}")
+                span.set_attribute("http.method", method)
+                span.set_attribute("http.route", route.path if route is not None else scope["path"])
+                span.set_attribute("http.status_code", status)
+                if status >= 500:
+                    span.set_status("ERROR", f"HTTP {status}")
+
+
+async def handler_tracing_middleware(handler, event, data):
+    """aiogram inner middleware: one span per handler invocation."""
+    callback = data["handler"].callback
+    attributes = {"telegram.event": type(event).__name__}
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        attributes["telegram.user_id"] = user.id
+    with tracer.start_as_current_span(f"handler {getattr(callback, '__name__', 'handler')}", attributes):
+        return await handler(event, data)
+
+
+class TelegramTracingMiddleware(BaseRequestMiddleware):
+    """aiogram session middleware: one CLIENT span per Bot API call."""
+
+    async def __call__(self, make_request, bot, method):
+        method_name = type(method).__name__
+        with tracer.start_as_current_span(f"telegram {method_name}", kind="CLIENT") as span:
+            chat_id = getattr(method, "chat_id", None)
+            if chat_id is not None:
+                span.set_attribute("telegram.chat_id", chat_id)
+            return await make_request(bot, method)
@@ -50,6 +50,50 @@ export async function notifyTelegramBot(payload: NotificationPayload) {
     }
 }
 
+export interface LaunchProfile {
+    telegram_user_id: number;
+    full_name: string | null;
+    phone: string | null;
+    expires_at: number;
+}
+
+/**
+ * Telegram's signed Web App launch data, if the page was opened from the bot.
+ * Read from the URL fragment Telegram adds, so telegram-web-app.js is not needed.
+ */
+export function getTelegramInitData(): string | null {
+    const webApp = (window as { Telegram?: { WebApp?: { initData?: string } } }).Telegram?.WebApp;
+    if (webApp?.initData) return webApp.initData;
+    return new URLSearchParams(window.location.hash.slice(1)).get("tgWebAppData");
+}
+
+/**
+ * Verifies the signed `launch` token the bot puts in Web App URLs.
+ * If the token is missing or expired, the bot identifies the user from `initData` instead.
+ *
+ * @param token - Value of the `launch` query parameter
+ * @param initData - Telegram Web App init data (see getTelegramInitData)
+ * @returns The user's profile, or null if neither is valid
+ */
+export async function verifyLaunchToken(token: string | null, initData: string | null = null): Promise<LaunchProfile | null> {
+    if (!WEBHOOK_URL || (!token && !initData)) return null;
+
+    try {
+        const url = WEBHOOK_URL.replace("/order-update", "/launch-token/verify");
+        const response = await fetch(url, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ token, init_data: initData }),
+        });
+
+        if (!response.ok) return null;
+        return await response.json();
+    } catch (error) {
+        console.error("Error verifying launch token:", error);
+        return null;
+    }
+}
+
 /**
  * Sends a direct message to a user via the Telegram bot.
  */
@@ -18,6 +18,7 @@ import {
   MIN_ORDER_AMOUNT,
   type PaymentMethod,
 } from "@/services/paymentService";
+import { getTelegramInitData, verifyLaunchToken } from "@/lib/telegram";
 
 const Index = () => {
   const navigate = useNavigate();
@@ -35,7 +36,36 @@ const Index = () => {
   const { addOrder, updateOrder } = useSupabaseOrders();
   const { settings } = useSupabaseSettings();
 
-  // Handle Telegram user data from URL params
+  // Handle the signed launch token the bot puts in Web App URLs, or Telegram's initData when it is missing or expired
+  useEffect(() => {
+    const token = searchParams.get("launch");
+    const initData = getTelegramInitData();
+    if (!token && !initData) return;
+
+    let cancelled = false;
+    verifyLaunchToken(token, initData).then((profile) => {
+      if (cancelled) return;
+      if (!profile) {
+        toast.info("Ma'lumotlaringizni yangilash uchun botga /start yuboring");
+        return;
+      }
+      setTelegramUserId(profile.telegram_user_id);
+      localStorage.setItem("telegram_user_id", String(profile.telegram_user_id));
+      if (profile.full_name) {
+        setPrefilledName(profile.full_name);
+        localStorage.setItem("full_name", profile.full_name);
+      }
+      if (profile.phone) {
+        setPrefilledPhone(profile.phone);
+        localStorage.setItem("phone", profile.phone);
+      }
+    });
+    return () => {
+      cancelled = true;
+    };
+  }, [searchParams]);
+
+  // Legacy: user data in plain URL params (keyboards sent before launch tokens)
   useEffect(() => {
     const userId = searchParams.get("telegram_user_id");
     const fullName = searchParams.get("full_name");